@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+
+from abc import ABC, abstractmethod
+from io import BytesIO
+from pathlib import Path
+
+from viktor.core import File
+from viktor.external.generic import GenericAnalysis
+
+from app import exchange, timing
+from app.cache import canonical_hash
+from app.dispatch import PartialResultsError, ShardedDispatcher
+from app.frame_solver import analyze_model
+from app.symmetry import SymmetryReduction
+
+# Number of run_etabs workers a sweep may be spread over
+ETABS_WORKER_SHARDS = int(os.environ.get("ETABS_WORKER_SHARDS", 4))
+# "json", which any worker reads, or "npz" for the binary exchange format of app/exchange.py on workers with numpy
+ETABS_EXCHANGE_FORMAT = os.environ.get("ETABS_EXCHANGE_FORMAT", "json")
+
+
+class AnalysisBackend(ABC):
+    """Runs a list of worker model dicts and returns one {"deformations", "max_defo"} payload per model, in order"""
+
+    name = ""
+
+    @abstractmethod
+    def run(self, models: list[dict]) -> list[dict]: ...
+
+
+class EtabsBackend(AnalysisBackend):
+    name = "etabs"
+
+    def __init__(
+        self,
+        timeout: int = 36000,
+        max_shards: int = ETABS_WORKER_SHARDS,
+        target_shard_size: int = 5000,
+        exchange_format: str = ETABS_EXCHANGE_FORMAT,
+    ) -> None:
+        self.timeout = timeout
+        self.max_shards = max_shards
+        self.target_shard_size = target_shard_size
+        self.exchange_format = exchange_format
+        self.shard_timings = []
+
+    def run(self, models: list[dict]) -> list[dict]:
+        """Splits the models over concurrent worker jobs, see ShardedDispatcher"""
+        dispatcher = ShardedDispatcher(self.run_job, max_shards=self.max_shards, target_shard_size=self.target_shard_size)
+        results = dispatcher.run(models)
+        self.shard_timings = dispatcher.shard_timings
+        return results
+
+    def run_job(self, models: list[dict]) -> list[dict]:
+        script_path = Path(__file__).parent / "run_etabs_model.py"
+        files = [
+            ("run_etabs_model.py", File.from_path(script_path)),
+            ("timing.py", File.from_path(Path(timing.__file__))),
+            # Client of the job server, used when the worker has ETABS_SERVER_ADDRESS set
+            ("etabs_server.py", File.from_path(script_path.parent / "etabs_server.py")),
+        ]
+        with timing.span("serialize_inputs", models=len(models)):
+            if self.exchange_format == "npz":
+                files += [
+                    ("inputs.npz", BytesIO(exchange.pack_models(models))),
+                    ("exchange.py", File.from_path(Path(exchange.__file__))),
+                ]
+                output_filename = "output.npz"
+            else:
+                files.append(("inputs.json", BytesIO(bytes(json.dumps(models), "utf8"))))
+                output_filename = "output.json"
+        generic_analysis = GenericAnalysis(files=files, executable_key="run_etabs", output_filenames=[output_filename, "output.jsonl"])
+        timer = timing.current_timer()
+        job_start = timer.now() if timer else 0.0
+        try:
+            with timing.span("worker_job", models=len(models)):
+                generic_analysis.execute(timeout=self.timeout)
+                output_file = generic_analysis.get_output_file(output_filename, as_file=True)
+        except Exception as error:
+            raise PartialResultsError(self.read_checkpoint(generic_analysis, models), error) from error
+        job_end = timer.now() if timer else 0.0
+        with timing.span("read_outputs", models=len(models)):
+            if self.exchange_format == "npz":
+                results = exchange.unpack_results(output_file.getvalue_binary())
+            else:
+                results = json.loads(output_file.getvalue())
+        if timer:
+            add_worker_spans(timer, results, job_start, job_end)
+        return results
+
+    @staticmethod
+    def read_checkpoint(generic_analysis: GenericAnalysis, models: list[dict]) -> dict[int, dict]:
+        """Results the worker appended to output.jsonl before failing, checked against the hash of each model"""
+        try:
+            checkpoint_file = generic_analysis.get_output_file("output.jsonl", as_file=True)
+        except Exception:
+            return {}
+        if checkpoint_file is None:
+            return {}
+        completed = {}
+        for line in checkpoint_file.getvalue().splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            index = entry["index"]
+            if index < len(models) and entry["hash"] == canonical_hash(models[index]):
+                completed[index] = entry["result"]
+        return completed
+
+
+class LocalFrameBackend(AnalysisBackend):
+    """Linear-elastic 3D frame solver running in the app process, for fast screening"""
+
+    name = "local-frame-v1"
+
+    def run(self, models: list[dict]) -> list[dict]:
+        results = []
+        for model in models:
+            with timing.span("local_analysis", members=len(model["lines"])):
+                results.append(analyze_model(model))
+        return results
+
+
+class SymmetricBackend(AnalysisBackend):
+    def __init__(self, backend: AnalysisBackend) -> None:
+        """
+        Runs the symmetric part of every model on backend and expands the results to the full model, see
+        app/symmetry.py. Models without symmetry are run as they are.
+        """
+        self.backend = backend
+        self.name = f"{backend.name}-symmetric"
+
+    def run(self, models: list[dict]) -> list[dict]:
+        with timing.span("reduce_models", models=len(models)):
+            reductions = [SymmetryReduction(model) for model in models]
+        try:
+            results = self.backend.run([reduction.reduced for reduction in reductions])
+        except PartialResultsError as error:
+            completed = {index: reductions[index].expand(result) for index, result in error.completed.items()}
+            raise PartialResultsError(completed, error.cause) from error
+        with timing.span("expand_results", models=len(models)):
+            return [reduction.expand(result) for reduction, result in zip(reductions, results, strict=True)]
+
+
+def add_worker_spans(timer: timing.Timer, results: list[dict], job_start: float, job_end: float) -> None:
+    """
+    Moves the "timings" of worker results onto the timer, on a track of the worker. The worker clock is not the app
+    clock: its spans are placed to end with the job, and the time before the first of them is a "worker_queue" span.
+    """
+    spans = [entry for result in results for entry in result.pop("timings", [])]
+    if not spans:
+        return
+    worker_end = max(entry["start"] + entry["seconds"] for entry in spans)
+    offset = max(job_end - worker_end, job_start)
+    track = f"worker of {threading.current_thread().name}"
+    timer.record("worker_queue", job_start, offset + min(entry["start"] for entry in spans) - job_start, track)
+    timer.add_spans(spans, offset, track)
+
+
+# Options of the analysis engine field, mapped to their backend
+BACKENDS = {"ETABS": EtabsBackend(), "Local solver": LocalFrameBackend()}
+DEFAULT_BACKEND = "ETABS"
+
+
+def get_backend(name: str | None, symmetry: bool = False) -> AnalysisBackend:
+    """The backend of an analysis engine option, analyzing only the symmetric part of the models if symmetry is set"""
+    backend = BACKENDS[name or DEFAULT_BACKEND]
+    return SymmetricBackend(backend) if symmetry else backend
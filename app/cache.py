@@ -0,0 +1,93 @@
+import hashlib
+import json
+
+from collections import OrderedDict
+from collections.abc import Callable
+
+import numpy as np
+
+
+def _normalize(obj):
+    """Converts obj to plain JSON types: string dict keys, lists for tuples and arrays, python numbers"""
+    if isinstance(obj, dict):
+        return {str(key): _normalize(value) for key, value in obj.items()}
+    if isinstance(obj, list | tuple):
+        return [_normalize(value) for value in obj]
+    if isinstance(obj, np.ndarray):
+        return _normalize(obj.tolist())
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def canonical_json(obj) -> str:
+    return json.dumps(_normalize(obj), sort_keys=True, separators=(",", ":"))
+
+
+def canonical_hash(obj) -> str:
+    """Stable hash of a JSON-like object; int keys hash like the string keys they become after a JSON round trip"""
+    return hashlib.sha256(canonical_json(obj).encode("utf8")).hexdigest()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 32, max_weight: float | None = None, weigher: Callable | None = None) -> None:
+        """
+        Least recently used cache, bounded by number of entries and optionally by total weight.
+
+        Args:
+            maxsize (int): Maximum number of entries.
+            max_weight (float | None): Maximum summed weight of the entries, e.g. bytes.
+            weigher (Callable | None): Returns the weight of a value, 1 per entry if not given.
+        """
+        self.maxsize = maxsize
+        self.max_weight = max_weight
+        self.weigher = weigher or (lambda _: 1)
+        self._entries = OrderedDict()
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    def get(self, key, default=None):
+        if key not in self._entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+    def put(self, key, value) -> None:
+        if key in self._entries:
+            self.weight -= self._entries.pop(key)[1]
+        weight = self.weigher(value)
+        self._entries[key] = (value, weight)
+        self.weight += weight
+        self._evict()
+
+    def get_or_compute(self, key, compute: Callable):
+        if key in self._entries:
+            return self.get(key)
+        self.misses += 1
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.weight = 0
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "weight": self.weight}
+
+    def _evict(self) -> None:
+        # The newest entry is always kept, even if it is heavier than max_weight on its own
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.maxsize or (self.max_weight is not None and self.weight > self.max_weight)
+        ):
+            _, (_, weight) = self._entries.popitem(last=False)
+            self.weight -= weight
@@ -0,0 +1,81 @@
+"""
+Colormap lookup tables for deformation coloring, without matplotlib.
+
+The tables reproduce matplotlib's colormaps, a ListedColormap of `partitions` colors sampled from the 256-entry
+colormap, so colors are the same as plt.get_cmap(name) gave before. Colormaps not defined here are taken from
+matplotlib if it is installed.
+"""
+
+from functools import cache
+
+import numpy as np
+
+BASE_COLORS = 256
+# Segment data of matplotlib's LinearSegmentedColormaps: per channel (x, value below x, value above x)
+SEGMENT_DATA = {
+    "jet": {
+        "red": ((0.0, 0, 0), (0.35, 0, 0), (0.66, 1, 1), (0.89, 1, 1), (1, 0.5, 0.5)),
+        "green": ((0.0, 0, 0), (0.125, 0, 0), (0.375, 1, 1), (0.64, 1, 1), (0.91, 0, 0), (1, 0, 0)),
+        "blue": ((0.0, 0.5, 0.5), (0.11, 1, 1), (0.34, 1, 1), (0.65, 0, 0), (1, 0, 0)),
+    },
+    "hot": {
+        "red": ((0.0, 0.0416, 0.0416), (0.365079, 1.000000, 1.000000), (1.0, 1.0, 1.0)),
+        "green": ((0.0, 0.0, 0.0), (0.365079, 0.000000, 0.000000), (0.746032, 1.000000, 1.000000), (1.0, 1.0, 1.0)),
+        "blue": ((0.0, 0.0, 0.0), (0.746032, 0.000000, 0.000000), (1.0, 1.0, 1.0)),
+    },
+    "gray": {"red": ((0.0, 0, 0), (1.0, 1, 1)), "green": ((0.0, 0, 0), (1.0, 1, 1)), "blue": ((0.0, 0, 0), (1.0, 1, 1))},
+}
+
+
+def segment_channel(segments, n: int = BASE_COLORS) -> np.ndarray:
+    """(n,) channel values of piecewise linear segment data, as matplotlib's LinearSegmentedColormap builds them"""
+    data = np.asarray(segments, dtype=float)
+    # Same operations as matplotlib, scaled to table positions, so the rounding matches too
+    x, below, above = data[:, 0] * (n - 1), data[:, 1], data[:, 2]
+    samples = (n - 1) * np.linspace(0, 1, n)
+    index = np.searchsorted(x, samples)[1:-1]
+    distance = (samples[1:-1] - x[index - 1]) / (x[index] - x[index - 1])
+    values = np.concatenate([[above[0]], distance * (below[index] - above[index - 1]) + above[index - 1], [below[-1]]])
+    return np.clip(values, 0.0, 1.0)
+
+
+def lut_index(values, n: int) -> np.ndarray:
+    """Table index of normalized values like a matplotlib colormap call: values below 0 and above 1 take the end colors"""
+    scaled = np.asarray(values, dtype=float) * n
+    return np.clip(np.nan_to_num(scaled, nan=0.0), 0, n - 1).astype(np.intp)
+
+
+@cache
+def base_colormap(name: str) -> np.ndarray:
+    """(256, 3) RGB floats of a colormap"""
+    if name in SEGMENT_DATA:
+        return np.column_stack([segment_channel(SEGMENT_DATA[name][channel]) for channel in ("red", "green", "blue")])
+    try:
+        import matplotlib
+    except ImportError as error:
+        raise ValueError(f"Unknown colormap {name!r}, install matplotlib for colormaps other than {sorted(SEGMENT_DATA)}") from error
+    return matplotlib.colormaps[name].resampled(BASE_COLORS)(np.linspace(0, 1, BASE_COLORS))[:, :3]
+
+
+@cache
+def color_table(name: str = "jet", partitions: int | None = 30) -> np.ndarray:
+    """
+    (partitions, 3) uint8 RGB table of a colormap in partitions bands, or all 256 colors for partitions=None.
+    Channels are truncated to 0-255 integers.
+    """
+    base = base_colormap(name)
+    colors = base if partitions is None else base[lut_index(np.linspace(0, 1, partitions), len(base))]
+    table = (colors * 255).astype(np.uint8)
+    table.flags.writeable = False
+    return table
+
+
+def map_colors(values, max_value: float, name: str = "jet", partitions: int | None = 30) -> np.ndarray:
+    """(N, 3) uint8 RGB colors of values normalized by max_value, one vectorized table lookup"""
+    table = color_table(name, partitions)
+    values = np.asarray(values, dtype=float)
+    normalized = values / max_value if max_value != 0 else np.zeros_like(values)
+    colors = table[lut_index(normalized, len(table))]
+    # Not a number is black, like the default "bad" color of matplotlib
+    colors[np.isnan(normalized)] = 0
+    return colors
@@ -0,0 +1,153 @@
+import numpy as np
+
+from app.components.clean_model import MERGE_TOLERANCE, merge_coincident_nodes
+from app.components.renumber import NodeNumbering, rcm_order
+
+# Component names are stored as small integer codes, the index into this tuple
+COMPONENTS = (None, "Truss", "Column", "Joist")
+
+
+def component_code(component_name: str | None) -> int:
+    return COMPONENTS.index(component_name)
+
+
+class ArrayModel:
+    def __init__(
+        self,
+        node_ids: np.ndarray,
+        coords: np.ndarray,
+        line_ids: np.ndarray,
+        connectivity: np.ndarray,
+        components: np.ndarray,
+    ) -> None:
+        """
+        Structure-of-arrays frame model.
+
+        Args:
+            node_ids (np.ndarray): (N,) node IDs.
+            coords (np.ndarray): (N, 3) node coordinates x, y, z.
+            line_ids (np.ndarray): (M,) line IDs.
+            connectivity (np.ndarray): (M, 2) row indices into the node arrays for nodeI and nodeJ.
+            components (np.ndarray): (M,) component codes, see COMPONENTS.
+        """
+        self.node_ids = np.asarray(node_ids, dtype=np.int64)
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+        self.line_ids = np.asarray(line_ids, dtype=np.int64)
+        self.connectivity = np.asarray(connectivity, dtype=np.int64).reshape(-1, 2)
+        self.components = np.asarray(components, dtype=np.int8)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def n_lines(self) -> int:
+        return len(self.line_ids)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(arr.nbytes for arr in (self.node_ids, self.coords, self.line_ids, self.connectivity, self.components))
+
+    @classmethod
+    def empty(cls) -> "ArrayModel":
+        return cls(np.empty(0), np.empty((0, 3)), np.empty(0), np.empty((0, 2)), np.empty(0))
+
+    @classmethod
+    def concatenate(cls, models: list["ArrayModel"]) -> "ArrayModel":
+        """Stacks models, shifting the connectivity of each one by the number of preceding nodes"""
+        if not models:
+            return cls.empty()
+        offsets = np.cumsum([0] + [model.n_nodes for model in models[:-1]])
+        return cls(
+            node_ids=np.concatenate([model.node_ids for model in models]),
+            coords=np.concatenate([model.coords for model in models]),
+            line_ids=np.concatenate([model.line_ids for model in models]),
+            connectivity=np.concatenate([model.connectivity + offset for model, offset in zip(models, offsets, strict=True)]),
+            components=np.concatenate([model.components for model in models]),
+        )
+
+    @classmethod
+    def from_dicts(cls, nodes: dict, lines: dict) -> "ArrayModel":
+        node_ids = np.fromiter(map(int, nodes.keys()), dtype=np.int64, count=len(nodes))
+        coords = np.array([(node["x"], node["y"], node["z"]) for node in nodes.values()], dtype=np.float64).reshape(-1, 3)
+        line_ids = np.fromiter(map(int, lines.keys()), dtype=np.int64, count=len(lines))
+        end_ids = np.array([(line["nodeI"], line["nodeJ"]) for line in lines.values()], dtype=np.int64).reshape(-1, 2)
+        components = np.array([component_code(line.get("component")) for line in lines.values()], dtype=np.int8)
+        model = cls(node_ids, coords, line_ids, np.empty((0, 2)), components)
+        model.connectivity = model.node_index(end_ids)
+        return model
+
+    def copy(self) -> "ArrayModel":
+        return ArrayModel(
+            self.node_ids.copy(), self.coords.copy(), self.line_ids.copy(), self.connectivity.copy(), self.components.copy()
+        )
+
+    def node_index(self, node_ids) -> np.ndarray:
+        """Maps node IDs to row indices"""
+        return self.numbering().index(node_ids)
+
+    def numbering(self) -> NodeNumbering:
+        """Map between row indices and node IDs, for repeated lookups"""
+        return NodeNumbering(self.node_ids)
+
+    def end_node_ids(self) -> np.ndarray:
+        """(M, 2) nodeI and nodeJ IDs of each line"""
+        return self.node_ids[self.connectivity]
+
+    def node_ids_at_z(self, z: float) -> list[int]:
+        return self.node_ids[self.coords[:, 2] == z].tolist()
+
+    def lengths(self) -> np.ndarray:
+        delta = self.coords[self.connectivity[:, 1]] - self.coords[self.connectivity[:, 0]]
+        return np.sqrt(np.einsum("ij,ij->i", delta, delta))
+
+    def to_dicts(self) -> tuple[dict, dict]:
+        """Dict-of-dicts view with the same layout as NodeList.serialize and LineList.serialize"""
+        node_ids = self.node_ids.tolist()
+        nodes = {
+            node_id: {"id": node_id, "x": x, "y": y, "z": z} for node_id, (x, y, z) in zip(node_ids, self.coords.tolist(), strict=True)
+        }
+        lines = {
+            line_id: {"id": line_id, "nodeI": node_i, "nodeJ": node_j, "component": COMPONENTS[code]}
+            for line_id, (node_i, node_j), code in zip(
+                self.line_ids.tolist(), self.end_node_ids().tolist(), self.components.tolist(), strict=True
+            )
+        }
+        return nodes, lines
+
+    @property
+    def nodes(self) -> dict:
+        return self.to_dicts()[0]
+
+    @property
+    def lines(self) -> dict:
+        return self.to_dicts()[1]
+
+    def merge_coincident_nodes(self, tol: float = MERGE_TOLERANCE) -> int:
+        """Deletes nodes closer than tol, keeping the smallest ID. Returns the number of merged nodes"""
+        replacement, n_merged = merge_coincident_nodes(self.coords, self.node_ids, tol)
+        if n_merged:
+            self._apply_replacement(replacement)
+        return n_merged
+
+    def renumber_nodes(self) -> NodeNumbering:
+        """
+        Reorders the node rows in reverse Cuthill-McKee order of the member graph, so connected nodes are on nearby
+        rows and the stiffness matrix is banded. Node IDs are unchanged, the returned numbering maps rows to IDs
+        """
+        order = rcm_order(self.n_nodes, self.connectivity)
+        new_index = np.empty_like(order)
+        new_index[order] = np.arange(len(order))
+        self.node_ids = self.node_ids[order]
+        self.coords = self.coords[order]
+        self.connectivity = new_index[self.connectivity]
+        return self.numbering()
+
+    def _apply_replacement(self, replacement: np.ndarray) -> int:
+        """Remaps lines onto the kept rows and drops every row that is not its own replacement"""
+        keep = replacement == np.arange(self.n_nodes)
+        new_index = np.cumsum(keep) - 1
+        self.connectivity = new_index[replacement[self.connectivity]]
+        self.node_ids = self.node_ids[keep]
+        self.coords = self.coords[keep]
+        return int((~keep).sum())
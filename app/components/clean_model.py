@@ -1,30 +1,126 @@
-from collections import defaultdict
+import numpy as np
 
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
 
-def clean_model(Nodes: dict, Lines: dict) -> tuple[dict, dict]:
+# Nodes snapped to the same grid cell of this size (in mm), or closer than it, are the same joint
+MERGE_TOLERANCE = 1e-6
+_HASH_MULTIPLIERS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9], dtype=np.uint64)
+# Grid cells per coarse cell along each axis, and the offset that puts coordinates on a grid this much coarser,
+# e.g. whole micrometres for the default tolerance, in the middle of a coarse cell
+_COARSE_CELLS = 1000
+_COARSE_OFFSET = _COARSE_CELLS // 2
+
+
+def merge_coincident_nodes(coords: np.ndarray, node_ids: np.ndarray, tol: float = MERGE_TOLERANCE) -> tuple[np.ndarray, int]:
+    """
+    Finds coincident nodes: nodes snapped to the same cell of a grid with spacing tol, and nodes within tol of each
+    other, which rounding can snap to neighbouring cells. Groups that share a node are merged into one.
+
+    Args:
+        coords (np.ndarray): (N, 3) node coordinates.
+        node_ids (np.ndarray): (N,) node IDs, the smallest ID of every group of coincident nodes is kept.
+        tol (float): Grid spacing used to snap the coordinates, and the distance within which nodes in neighbouring
+            cells are merged.
+
+    Returns:
+        tuple[np.ndarray, int]: For each row the row of the node that replaces it, and the number of merged nodes.
+    """
+    n_nodes = len(node_ids)
+    if n_nodes == 0:
+        return np.arange(0), 0
+    coords = np.asarray(coords, dtype=np.float64)
+    keys = np.round(coords / tol).astype(np.int64)
+    # Group rows by a single hashed key of their coarse cell, which sorts much faster than a lexsort over the three
+    # axes. The hash is only trusted when every run of equal hashes holds a single cell, which also means that no
+    # coarse cell holds more than one cell.
+    coarse, residues = np.divmod(keys + _COARSE_OFFSET, _COARSE_CELLS)
+    on_boundary = np.any((residues == 0) | (residues == _COARSE_CELLS - 1), axis=1)
+    hashed = coarse.view(np.uint64) @ _HASH_MULTIPLIERS
+    order = np.argsort(hashed)
+    sorted_hashes = hashed[order]
+    group_start = np.ones(n_nodes, dtype=bool)
+    group_start[1:] = sorted_hashes[1:] != sorted_hashes[:-1]
+    starts = np.flatnonzero(group_start)
+    group_of_sorted = np.cumsum(group_start) - 1
+    sorted_keys = np.take(keys, order, axis=0)
+    shared_coarse_cells = not np.array_equal(sorted_keys, sorted_keys[starts[group_of_sorted]])
+    if shared_coarse_cells:
+        order = np.lexsort((keys[:, 2], keys[:, 1], keys[:, 0]))
+        sorted_keys = np.take(keys, order, axis=0)
+        group_start[1:] = np.any(sorted_keys[1:] != sorted_keys[:-1], axis=1)
+        starts = np.flatnonzero(group_start)
+        group_of_sorted = np.cumsum(group_start) - 1
+
+    # Keep the node with the smallest ID of every group
+    id_rank = np.empty(n_nodes, dtype=np.int64)
+    by_id = np.argsort(node_ids, kind="stable")
+    id_rank[by_id] = np.arange(n_nodes)
+    labels = _join_neighbour_cells(coords, order, starts, group_of_sorted, coarse, on_boundary, shared_coarse_cells, tol)
+    if labels is None:
+        kept_rank = np.minimum.reduceat(id_rank[order], starts)
+    else:
+        group_of_sorted = labels[group_of_sorted]
+        kept_rank = np.full(labels.max() + 1, n_nodes)
+        np.minimum.at(kept_rank, group_of_sorted, id_rank[order])
+    kept_rows = by_id[kept_rank]
+
+    replacement = np.empty(n_nodes, dtype=np.int64)
+    replacement[order] = kept_rows[group_of_sorted]
+    return replacement, n_nodes - len(kept_rows)
+
+
+def _join_neighbour_cells(
+    coords: np.ndarray,
+    order: np.ndarray,
+    starts: np.ndarray,
+    group_of_sorted: np.ndarray,
+    coarse: np.ndarray,
+    on_boundary: np.ndarray,
+    shared_coarse_cells: bool,
+    tol: float,
+):
+    """
+    Group label of every grid cell after joining the cells of nodes within tol of each other, None if no such nodes
+    are in different cells. Such cells are neighbours, so they share a coarse cell or lie on both sides of a coarse
+    cell boundary. Only the distinct coordinates in those cells are searched for pairs.
+    """
+    n_cells = len(starts)
+    in_candidate = on_boundary[order]
+    if shared_coarse_cells:
+        _, coarse_cell, counts = np.unique(coarse[order[starts]], axis=0, return_inverse=True, return_counts=True)
+        in_candidate |= (counts[coarse_cell.reshape(-1)] > 1)[group_of_sorted]
+    if np.count_nonzero(in_candidate) < 2:
+        return None
+
+    points, first = np.unique(coords[order[in_candidate]], axis=0, return_index=True)
+    cell_of_point = group_of_sorted[in_candidate][first]
+    pairs = cell_of_point[cKDTree(points).query_pairs(tol, output_type="ndarray")].reshape(-1, 2)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    if len(pairs) == 0:
+        return None
+    graph = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n_cells, n_cells))
+    return connected_components(graph, directed=False)[1]
+
+
+def clean_model(Nodes: dict, Lines: dict, tol: float = MERGE_TOLERANCE) -> tuple[dict, dict]:
     """Deletes duplicated nodes"""
-    # Create a mapping from coordinates to node IDs
-    coord_to_nodes = defaultdict(list)
-    for node_id, attrs in Nodes.items():
-        coord = (attrs["x"], attrs["y"], attrs["z"])
-        coord_to_nodes[coord].append(node_id)
-
-    # Identify duplicates: coordinates with more than one node ID
-    duplicates = {coord: ids for coord, ids in coord_to_nodes.items() if len(ids) > 1}
-
-    node_replacements = {}
-    for _, ids in duplicates.items():
-        kept_node = min(ids)  # Choose the node with the smallest ID to keep
-        for duplicate_node in ids:
-            if duplicate_node != kept_node:
-                node_replacements[duplicate_node] = kept_node
+    node_ids = np.fromiter(Nodes.keys(), dtype=np.int64, count=len(Nodes))
+    coords = np.array([(attrs["x"], attrs["y"], attrs["z"]) for attrs in Nodes.values()], dtype=np.float64).reshape(-1, 3)
+    replacement, n_merged = merge_coincident_nodes(coords, node_ids, tol)
+    if n_merged == 0:
+        return Nodes, Lines
+
+    replaced_ids = node_ids[replacement]
+    node_replacements = {
+        int(node_id): int(kept_id) for node_id, kept_id in zip(node_ids, replaced_ids, strict=True) if node_id != kept_id
+    }
 
     # Update Lines to replace deleted Nodes with Kept Nodes
     for line in Lines.values():
-        if line["nodeI"] in node_replacements:
-            line["nodeI"] = node_replacements[line["nodeI"]]
-        if line["nodeJ"] in node_replacements:
-            line["nodeJ"] = node_replacements[line["nodeJ"]]
+        line["nodeI"] = node_replacements.get(line["nodeI"], line["nodeI"])
+        line["nodeJ"] = node_replacements.get(line["nodeJ"], line["nodeJ"])
 
     # Remove duplicate Nodes
     for dup_node in node_replacements.keys():
@@ -1,6 +1,10 @@
+import numpy as np
+
 from pydantic import BaseModel, Field
 from typing import Literal
 
+from app.components.array_model import ArrayModel, component_code
+
 
 class Node(BaseModel):
     id: int | None
@@ -128,7 +132,8 @@ class Truss:
         self.lines.add_line_list(line_list)
         return line_list
 
-    def create_diagonals(self, top_chord_ids: list[int], bottom_chord_ids: list[int]) -> None:
+    def diagonal_pairs(self, top_chord_ids: list[int], bottom_chord_ids: list[int]) -> list[tuple[int, int]]:
+        """Returns the (top, bottom) tag pairs of the diagonals followed by the vertical members"""
         if self.n_diagonals % 2 == 0:
             # Shortest way to get the right nodes
             required_st1_ids = top_chord_ids[::2]
@@ -136,9 +141,6 @@ class Truss:
 
             tags_st1 = sorted([required_st1_ids[0]] + [required_st1_ids[-1]] + required_st1_ids[1:-1] * 2)
             tags_st2 = sorted(required_st2_ids[:] * 2)
-
-            for tag_st1, tag_st2 in zip(tags_st1, tags_st2, strict=True):
-                self.lines.add_lines(Line(id=self.gen_line_tag(), nodeI=tag_st1, nodeJ=tag_st2, component=self.component_name))
         else:
             # Shortest way to get the right nodes
             required_st1_ids = top_chord_ids[:-1:2]
@@ -147,12 +149,14 @@ class Truss:
             tags_st1 = sorted([required_st1_ids[0]] + required_st1_ids[1:] * 2)
             tags_st2 = sorted([required_st2_ids[-1]] + required_st2_ids[:-1] * 2)
 
-            for tag_st1, tag_st2 in zip(tags_st1, tags_st2, strict=True):
-                self.lines.add_lines(Line(id=self.gen_line_tag(), nodeI=tag_st1, nodeJ=tag_st2, component=self.component_name))
+        pairs = list(zip(tags_st1, tags_st2, strict=True))
+        # Vertical members
+        pairs.extend(zip(top_chord_ids, bottom_chord_ids, strict=True))
+        return pairs
 
-        # Create vertical members
-        for node_top, node_bottom in zip(top_chord_ids, bottom_chord_ids, strict=True):
-            self.lines.add_lines(Line(id=self.gen_line_tag(), nodeI=node_top, nodeJ=node_bottom, component=self.component_name))
+    def create_diagonals(self, top_chord_ids: list[int], bottom_chord_ids: list[int]) -> None:
+        for tag_st1, tag_st2 in self.diagonal_pairs(top_chord_ids, bottom_chord_ids):
+            self.lines.add_lines(Line(id=self.gen_line_tag(), nodeI=tag_st1, nodeJ=tag_st2, component=self.component_name))
 
     def create(self) -> tuple[dict[int, Node], dict[int, Line]]:
         bottom_chord_nodes = self.create_chord_nodes(
@@ -180,6 +184,37 @@ class Truss:
 
         return self.nodes.serialize(), self.lines.serialize()
 
+    def chord_coords(self, zo: float) -> np.ndarray:
+        nNodes = self.n_diagonals + 1
+        delta = self.width / (nNodes - 1)
+        offsets = np.arange(nNodes) * delta
+        coords = np.empty((nNodes, 3))
+        coords[:, 0] = self.xo + offsets if self.plane == "xz" else self.xo
+        coords[:, 1] = self.yo + offsets if self.plane == "yz" else self.yo
+        coords[:, 2] = zo
+        return coords
+
+    def create_arrays(self) -> ArrayModel:
+        """Same geometry, tags and line order as create, emitted as an ArrayModel without per-node objects"""
+        nNodes = self.n_diagonals + 1
+        coords = np.concatenate([self.chord_coords(self.zo - self.height), self.chord_coords(self.zo)])
+        node_ids = np.arange(self.nodes_id + 1, self.nodes_id + 2 * nNodes + 1)
+        self.nodes_id += 2 * nNodes
+
+        bottom_rows = np.arange(nNodes)
+        top_rows = bottom_rows + nNodes
+        chord_pairs = np.concatenate(
+            [np.column_stack([bottom_rows[:-1], bottom_rows[1:]]), np.column_stack([top_rows[:-1], top_rows[1:]])]
+        )
+        web_pairs = np.array(self.diagonal_pairs(top_rows.tolist(), bottom_rows.tolist()), dtype=np.int64)
+        connectivity = np.concatenate([chord_pairs, web_pairs])
+        line_ids = np.arange(self.lines_id + 1, self.lines_id + len(connectivity) + 1)
+        self.lines_id += len(connectivity)
+
+        self.joist_nodes = node_ids[top_rows[1:-1]].tolist()
+        components = np.full(len(connectivity), component_code(self.component_name))
+        return ArrayModel(node_ids, coords, line_ids, connectivity, components)
+
 
 class Columns:
     def __init__(
@@ -248,21 +283,39 @@ class Columns:
 
         return self.nodes.serialize(), self.lines.serialize()
 
+    def create_arrays(self) -> ArrayModel:
+        """Same geometry, tags and line order as create, emitted as an ArrayModel without per-node objects"""
+        delta = self.height / self.partition
+        n_nodes = self.partition + 1
+        coords = np.empty((n_nodes, 3))
+        coords[:, 0] = self.xo
+        coords[:, 1] = self.yo
+        coords[:, 2] = self.zo + np.arange(n_nodes) * delta
+        node_ids = np.arange(self.nodes_id + 1, self.nodes_id + n_nodes + 1)
+        self.nodes_id += n_nodes
+
+        rows = np.arange(n_nodes)
+        connectivity = np.column_stack([rows[:-1], rows[1:]])
+        line_ids = np.arange(self.lines_id + 1, self.lines_id + self.partition + 1)
+        self.lines_id += self.partition
+
+        components = np.full(self.partition, component_code(self.component_name))
+        return ArrayModel(node_ids, coords, line_ids, connectivity, components)
+
 
 def create_joists(ref_truss: Truss, height: float, width: float, n_diagonal: int) -> list[Truss]:
     """Crates joist based on reference truss"""
     joist_list = []
-    nodes, lines = ref_truss.create()
+    ref_model = ref_truss.create_arrays()
     joist_nodes_tags = ref_truss.get_joist_node_tag()
-    for joint_tag in joist_nodes_tags:
-        node = nodes[joint_tag]
+    for x, y, z in ref_model.coords[ref_model.node_index(joist_nodes_tags)].tolist():
         temp_truss = Truss(
             height=height,
             width=width,
             n_diagonals=n_diagonal,
-            xo=node["x"],
-            yo=node["y"],
-            zo=node["z"],
+            xo=x,
+            yo=y,
+            zo=z,
             plane="yz",
             component_name="Joist",
         )
@@ -1,3 +1,6 @@
+from app.components.array_model import ArrayModel
+
+
 class Model:
     def __init__(self, components: list) -> None:
         """
@@ -27,3 +30,16 @@ class Model:
             self.update_nodes_and_lines(_nodes, _lines)
             self.lines_id = component.get_line_id()
             self.nodes_id = component.get_nodes_id()
+
+    def build_arrays(self) -> ArrayModel:
+        """
+        Same numbering as build, but every component emits arrays which are stacked into a single ArrayModel.
+        """
+        component_models = []
+        for component in self.components:
+            component.set_nodes_id(self.nodes_id)
+            component.set_lines_id(self.lines_id)
+            component_models.append(component.create_arrays())
+            self.lines_id = component.get_line_id()
+            self.nodes_id = component.get_nodes_id()
+        return ArrayModel.concatenate(component_models)
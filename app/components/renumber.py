@@ -0,0 +1,56 @@
+import numpy as np
+
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import reverse_cuthill_mckee
+
+
+class NodeNumbering:
+    def __init__(self, node_ids: np.ndarray) -> None:
+        """
+        Bidirectional map between the contiguous indices 0..N-1 of the node arrays and the original node IDs,
+        which name the nodes in ETABS and in the viewer.
+
+        Args:
+            node_ids (np.ndarray): (N,) original ID of every index.
+        """
+        self.node_ids = np.asarray(node_ids, dtype=np.int64)
+        self._order = np.argsort(self.node_ids, kind="stable")
+        self._sorted_ids = self.node_ids[self._order]
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def ids(self, indices) -> np.ndarray:
+        """Original IDs of indices"""
+        return self.node_ids[np.asarray(indices, dtype=np.int64)]
+
+    def index(self, node_ids) -> np.ndarray:
+        """Indices of original IDs"""
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        positions = np.searchsorted(self._sorted_ids, node_ids)
+        n_nodes = len(self)
+        if np.any(positions >= n_nodes) or not np.array_equal(self._sorted_ids[np.minimum(positions, n_nodes - 1)], node_ids):
+            raise KeyError("Unknown node ID in connectivity")
+        return self._order[positions]
+
+
+def rcm_order(n_nodes: int, connectivity: np.ndarray) -> np.ndarray:
+    """
+    Reverse Cuthill-McKee order of the member graph: for every new index the old one. Connected nodes get nearby
+    indices, so the stiffness matrix of the model is banded.
+
+    Args:
+        n_nodes (int): Number of nodes.
+        connectivity (np.ndarray): (M, 2) node indices of the members.
+    """
+    if n_nodes == 0:
+        return np.arange(0)
+    connectivity = np.asarray(connectivity, dtype=np.int64).reshape(-1, 2)
+    graph = coo_matrix((np.ones(len(connectivity)), (connectivity[:, 0], connectivity[:, 1])), shape=(n_nodes, n_nodes)).tocsr()
+    return reverse_cuthill_mckee(graph + graph.T, symmetric_mode=True).astype(np.int64)
+
+
+def bandwidth(connectivity: np.ndarray) -> int:
+    """Largest index difference of the two nodes of a member, in nodes"""
+    connectivity = np.asarray(connectivity).reshape(-1, 2)
+    return int(np.abs(connectivity[:, 0] - connectivity[:, 1]).max()) if len(connectivity) else 0
@@ -1,21 +1,26 @@
-import json
 import viktor as vkt
 
 from io import BytesIO
-from pathlib import Path
 from textwrap import dedent
 
-from viktor.core import File
-from viktor.external.generic import GenericAnalysis
-
-from app.structure import generate_model
+from app.backends import BACKENDS, DEFAULT_BACKEND, get_backend
+from app.dispatch import PartialResultsError
+from app.structure import ModelTemplate, area_to_point_load, cached_generate_model, geometry_key
+from app.superposition import load_sweep, scale_result, to_unit_model
 from app.optimization import plot_displacement_vs_truss_depth, calculate_variants, generate_variants, mass_co2_from_model
-from app.visualization import render_frame_elements, create_load_arrow
+from app.optimization import emissions_range, search_min_feasible_depth, surrogate_screen, variant_params, variants_co2
+from app.visualization import cached_render_frame_glb, render_frame_glb
 from app.visualization import sections_db
+from app.result_store import ResultStore, store_version
+from app.timing import Timer, save_trace, span, summary
 
 SF = 20
 COLOR_BY = "component"
 COLUMN_HEIGHT = 6000
+# Area loads [kN/m2] of the load sensitivity table, derived from the single analysis by superposition
+LOAD_SWEEP = (1.5, 2, 3, 4, 5, 6, 7)
+# Worker submissions per run_worker call; after a partial failure only the unfinished models are resubmitted
+MAX_SUBMISSIONS = 2
 color_dict = {
     "Truss": vkt.Material(color=vkt.Color(r=255, g=105, b=180)),  # Bright Pastel Pink
     "Column": vkt.Material(color=vkt.Color(r=100, g=200, b=250)),  # Bright Pastel Blue
@@ -45,6 +50,17 @@ class Parametrization(vkt.Parametrization):
     step_1.section = vkt.OptionField("Cross Section", options= list(sections_db.keys()), default =list(sections_db.keys())[0]) 
 
     step_2 = vkt.Step("Run Analysis", views=["run_model"], width=30)
+    step_2.analysis_backend = vkt.OptionField(
+        "Analysis Engine",
+        options=list(BACKENDS.keys()),
+        default=DEFAULT_BACKEND,
+        description="ETABS runs on the worker. The local solver is a linear-elastic frame analysis in the app, for fast screening.",
+    )
+    step_2.use_symmetry = vkt.BooleanField(
+        "Analyze Symmetric Part Only",
+        default=False,
+        description="Analyzes a half or quarter model cut on the symmetry planes of the bay and mirrors the results to the full model.",
+    )
 
     step_3 = vkt.Step("Optimize", width=40)
     step_3.txt_tile = vkt.Text("# Optimization Settings")
@@ -60,7 +76,25 @@ class Parametrization(vkt.Parametrization):
     step_3.delta_truss = vkt.NumberField("Step size (mm)", default=200)
 
     step_3.suptitle3 = vkt.Text("## Number of Variants")
-    step_3.total_variants = vkt.OutputField("Total Number of Variants", value=calculate_variants)
+    step_3.search_mode = vkt.OptionField(
+        "Search Mode",
+        options=["Grid", "Adaptive", "Surrogate"],
+        default="Grid",
+        description="Grid: every combination. Adaptive: shallowest feasible depth per number of joists. Surrogate: analyzes only combinations a regression cannot classify, or marks them Uncertain.",
+    )
+    step_3.depth_tolerance = vkt.NumberField(
+        "Depth Tolerance (mm)", default=10, min=1, visible=vkt.IsEqual(vkt.Lookup("step_3.search_mode"), "Adaptive")
+    )
+    # The adaptive search analyzes a few depths per number of joists, not the grid
+    step_3.total_variants = vkt.OutputField(
+        "Total Number of Variants",
+        value=calculate_variants,
+        visible=vkt.IsNotEqual(vkt.Lookup("step_3.search_mode"), "Adaptive"),
+    )
+    step_3.emissions_range = vkt.OutputField("Emissions Range (kg Co2)", value=emissions_range)
+    step_3.timing_summary = vkt.BooleanField(
+        "Show Timing Summary", default=False, description="Shows where the optimization spent its time."
+    )
     step_3.lb = vkt.LineBreak()
     step_3.button = vkt.OptimizationButton("Optimize", method="optimal_curve", longpoll=True)
 
@@ -71,7 +105,7 @@ class Controller(vkt.Controller):
 
     @vkt.GeometryView("3D model", duration_guess=1, x_axis_to_right=True)
     def create_render(self, params, **kwargs) -> vkt.GeometryResult:
-        nodes, lines, nodes_with_load, supports, point_load = generate_model(
+        nodes, lines, nodes_with_load, supports, point_load = cached_generate_model(
             params.step_1.truss_depth,
             params.step_1.x_bay_width,
             params.step_1.y_bay_width,
@@ -83,27 +117,32 @@ class Controller(vkt.Controller):
         # Render Structure
         selected_section = sections_db[params.step_1.section]["depth"]
         section_dict = {"Truss":selected_section , "Column": 300, "Joist": selected_section}
-        sections_group = render_frame_elements(lines, nodes, color_dict, section_dict, COLOR_BY)
-        # Render loads
-        for node_id in nodes_with_load:
-            loads_arrow = create_load_arrow(
-                nodes[node_id], magnitude=point_load, material=vkt.Material(color=vkt.Color(r=255, g=10, b=10), opacity=0.8)
-            )
-            sections_group.append(loads_arrow)
-
-        return vkt.GeometryResult(geometry=sections_group)
-
-    @vkt.GeometryAndDataView("Deformed model", duration_guess=1, x_axis_to_right=True)
-    def run_model(self, params, **kwargs) -> vkt.GeometryResult:
-        nodes, lines, nodes_with_load, supports, point_load = generate_model(
+        model_key = geometry_key(
             params.step_1.truss_depth,
             params.step_1.x_bay_width,
             params.step_1.y_bay_width,
             params.step_1.n_joist + 1,
             COLUMN_HEIGHT,
             params.step_1.joist_n_diags,
-            params.step_1.area_load,
         )
+        # Render structure and loads as one glTF file
+        geometry = cached_render_frame_glb(model_key, lines, nodes, color_dict, section_dict, COLOR_BY, nodes_with_load, point_load)
+
+        return vkt.GeometryResult(geometry=geometry, geometry_type="gltf")
+
+    @vkt.GeometryAndDataView("Deformed model", duration_guess=1, x_axis_to_right=True)
+    def run_model(self, params, **kwargs) -> vkt.GeometryResult:
+        timer = Timer()
+        with timer.span("generate_model"):
+            nodes, lines, nodes_with_load, supports, point_load = cached_generate_model(
+                params.step_1.truss_depth,
+                params.step_1.x_bay_width,
+                params.step_1.y_bay_width,
+                params.step_1.n_joist + 1,
+                COLUMN_HEIGHT,
+                params.step_1.joist_n_diags,
+                params.step_1.area_load,
+            )
         models = []
         models.append(
             {
@@ -117,16 +156,27 @@ class Controller(vkt.Controller):
             }
         )
         # Run Etabs model with worker
-        results_data = self.run_worker(models)
+        design = {
+            "joist_value": params.step_1.n_joist + 1,
+            "truss_depth_value": params.step_1.truss_depth,
+            "x_bay_width": params.step_1.x_bay_width,
+            "y_bay_width": params.step_1.y_bay_width,
+            "section_name": params.step_1.section,
+        }
+        with timer.activate(), timer.span("run_worker"):
+            results_data = self.run_worker(
+                models, designs=[design], backend=params.step_2.analysis_backend, symmetry=params.step_2.use_symmetry
+            )
         opt_model = models[0]
 
         for node_id, _ in opt_model["nodes"].items():
             defo = SF * results_data[0]["deformations"][str(node_id)]
             opt_model["nodes"][node_id]["z"] = opt_model["nodes"][node_id]["z"] + defo
+            opt_model["nodes"][node_id]["deformation"] = abs(results_data[0]["deformations"][str(node_id)])
 
         for line_id, dict_vals in opt_model["lines"].items():
             ni = str(dict_vals["nodeI"])
-            nj = str(dict_vals["nodeI"])
+            nj = str(dict_vals["nodeJ"])
             defo_ni = results_data[0]["deformations"][str(ni)]
             defo_nj = results_data[0]["deformations"][str(nj)]
             opt_model["lines"][line_id].update({"deformation": 0.5 * (abs(defo_ni) + abs(defo_nj))})
@@ -134,19 +184,37 @@ class Controller(vkt.Controller):
         max_defo = abs(results_data[0]["max_defo"])
         selected_section = sections_db[params.step_1.section]["depth"]
         section_dict = {"Truss":selected_section , "Column": 300, "Joist": selected_section}
-        sections_group = render_frame_elements(
-            lines=opt_model["lines"],
-            nodes=opt_model["nodes"],
-            color_dict=color_dict,
-            section_dict=section_dict,
-            COLOR_BY=COLOR_BY,
-            deformation=True,
-            max_defo=max_defo,
-        )
+        with timer.span("render"):
+            glb = render_frame_glb(
+                lines=opt_model["lines"],
+                nodes=opt_model["nodes"],
+                color_dict=color_dict,
+                section_dict=section_dict,
+                COLOR_BY=COLOR_BY,
+                deformation=True,
+                max_defo=max_defo,
+            )
 
 
         #Data results
         total_mass, element_count, total_co2_emission  = mass_co2_from_model(lines=opt_model["lines"], nodes = opt_model["nodes"], section_name=params.step_1.section, sections_db=sections_db)
+        # Member forces are only returned by workers with bulk results extraction
+        member_force_items = []
+        if "frame_forces" in results_data[0]:
+            axial_forces = results_data[0]["frame_forces"]["p"]
+            member_force_items = [
+                vkt.DataItem("Max. Tension Force", max(max(axial_forces), 0) / 1000, suffix="kN", number_of_decimals=2),
+                vkt.DataItem("Max. Compression Force", max(-min(axial_forces), 0) / 1000, suffix="kN", number_of_decimals=2),
+            ]
+        sweep_loads = [
+            area_to_point_load(area_load, params.step_1.x_bay_width, params.step_1.y_bay_width, len(nodes_with_load))
+            for area_load in LOAD_SWEEP
+        ]
+        sweep_results = load_sweep(results_data[0], point_load, nodes_with_load, sweep_loads)
+        sweep_items = [
+            vkt.DataItem(f"Area load {area_load} kN/m2", abs(result["max_defo"]), suffix="mm", number_of_decimals=3)
+            for area_load, result in zip(LOAD_SWEEP, sweep_results, strict=True)
+        ]
 
         data_result = vkt.DataGroup(
             vkt.DataItem("Output","Model Results", subgroup=vkt.DataGroup(
@@ -154,68 +222,192 @@ class Controller(vkt.Controller):
                     vkt.DataItem("Number of Steel Members", element_count, suffix="-", number_of_decimals=2),
                     vkt.DataItem("Total Co2 Emissions", total_co2_emission, suffix="Co2(kg)", number_of_decimals=2),
                     vkt.DataItem("Max. Displacement", max_defo, suffix="mm", number_of_decimals=3),
+                    *member_force_items,
                     )
-            )
+            ),
+            vkt.DataItem("Load Sensitivity", "Max. Displacement", subgroup=vkt.DataGroup(*sweep_items)),
+            vkt.DataItem("Timings", "Time per stage", subgroup=self.timing_data(timer)),
         )
+        save_trace(timer, "run_model")
 
-        return vkt.GeometryAndDataResult(sections_group,data_result)
+        return vkt.GeometryAndDataResult(vkt.File.from_data(glb), data_result, geometry_type="gltf")
 
     def optimal_curve(self, params, **kwargs) -> vkt.OptimizationResult:
-        variants = generate_variants(params, **kwargs)
-        models = []
-        co2s = []
-        for variant in variants:
-            nodes, lines, nodes_with_load, supports, point_load = generate_model(
-                variant["truss_depth_value"],
-                variant["x_bay_width"],
-                variant["y_bay_width"],
-                variant["joist_value"],
-                COLUMN_HEIGHT,
-                variant["joist_n_diags"],
-                variant["area_load"],
+        timer = Timer()
+        show_timings = params.step_3.timing_summary
+        # Variants with the same number of joists share their topology, build it once per joist count
+        templates = {}
+        variants = []
+        results_data = []
+        statuses = []
+
+        def evaluate(batch: list[dict]) -> list[dict]:
+            with timer.span("generate_model", models=len(batch)):
+                models = self.variant_models(params, batch, templates)
+            with timer.activate(), timer.span("run_worker", models=len(batch)):
+                batch_results = self.run_worker(
+                    models=models,
+                    designs=[{**variant, "section_name": params.step_1.section} for variant in batch],
+                    backend=params.step_2.analysis_backend,
+                    symmetry=params.step_2.use_symmetry,
+                )
+            variants.extend(batch)
+            results_data.extend(batch_results)
+            statuses.extend(["Analyzed"] * len(batch))
+            return batch_results
+
+        if params.step_3.search_mode == "Adaptive":
+            # One worker submission per search round, with one probe per joist count still searching
+            joist_values = range(int(params.step_3.min_jst), int(params.step_3.max_jst) + 1, int(params.step_3.delta_jst))
+            optimum, _ = search_min_feasible_depth(
+                joist_values,
+                int(params.step_3.min_truss),
+                int(params.step_3.max_truss),
+                params.step_3.allowable_disp,
+                params.step_3.depth_tolerance,
+                lambda probes: [
+                    abs(result["max_defo"])
+                    for result in evaluate([variant_params(params, joist_value, depth) for joist_value, depth in probes])
+                ],
             )
-            models.append(
-                {
-                "nodes": nodes,
-                "lines": lines,
-                "nodes_with_load": nodes_with_load,
-                "load_magnitud": point_load,
-                "supports": supports,
-                "section_name": params.step_1.section,
-                "section_props": sections_db[params.step_1.section]
-            })
-            _, _, total_co2_emission  = mass_co2_from_model(lines=lines, nodes = nodes, section_name=params.step_1.section, sections_db=sections_db)
-            co2s.append(total_co2_emission)
-        # Run multiple models
-        results_data = self.run_worker(models=models)
+            # variant_params stores the number of joists plus one as joist_value
+            for index, variant in enumerate(variants):
+                if optimum.get(variant["joist_value"] - 1) == variant["truss_depth_value"]:
+                    statuses[index] = "Minimum feasible"
+        elif params.step_3.search_mode == "Surrogate":
+            candidates = generate_variants(params, **kwargs)
+            # Candidates with stored results come back from the result store without an analysis and seed the surrogate
+            stored = self.stored_variants(params, candidates, templates)
+            known = [abs(result["max_defo"]) for result in evaluate([candidates[index] for index in stored])] if stored else []
+            _, predicted, uncertain = surrogate_screen(
+                candidates,
+                params.step_3.allowable_disp,
+                lambda batch: [abs(result["max_defo"]) for result in evaluate(batch)],
+                known=dict(zip(stored, known, strict=True)),
+            )
+            # Uncertain variants were still too close to the allowable displacement when the rounds ran out
+            for status, displacements in (("Predicted", predicted), ("Uncertain", uncertain)):
+                variants.extend(candidates[index] for index in displacements)
+                results_data.extend({"max_defo": -displacement} for displacement in displacements.values())
+                statuses.extend([status] * len(displacements))
+        else:
+            evaluate(generate_variants(params, **kwargs))
+
+        co2s = variants_co2(variants, sections_db[params.step_1.section]["weight/m"]).tolist()
         # Generate optimization result image.
-        image_path = plot_displacement_vs_truss_depth(
-            model_data=variants, results_data=results_data, allowable_displacement=params.step_3.allowable_disp
-        )
+        with timer.span("chart"):
+            image = plot_displacement_vs_truss_depth(
+                model_data=variants, results_data=results_data, allowable_displacement=params.step_3.allowable_disp, statuses=statuses
+            )
         # Generate OptimizationResult: includes images and tables
         results = []
-        for model, result,co2 in zip(variants, results_data, co2s,strict=True):
+        for model, result,co2,status in zip(variants, results_data, co2s,statuses,strict=True):
             joist_number = model["joist_value"] - 1
             truss_depth = model["truss_depth_value"]
             max_defo = abs(result["max_defo"])
 
             params = {"step_1": {"truss_depth": truss_depth, "n_joist": joist_number}}
-            results.append(vkt.OptimizationResultElement(params, {"Deformation": round(max_defo, 2),"Emissions (kg Co2)":round(co2,2)}))
+            results.append(
+                vkt.OptimizationResultElement(
+                    params, {"Deformation": round(max_defo, 2), "Emissions (kg Co2)": round(co2, 2), "Status": status}
+                )
+            )
         # Pack results
-        output_headers = {"Deformation": "Deformation","Emissions (kg Co2)":"Emissions (kg Co2)"}
+        output_headers = {"Deformation": "Deformation","Emissions (kg Co2)":"Emissions (kg Co2)","Status":"Status"}
+        save_trace(timer, "optimal_curve")
+        if show_timings:
+            vkt.UserMessage.info(f"Optimization timings:\n{summary(timer)}")
         return vkt.OptimizationResult(
             results,
             ["step_1.truss_depth", "step_1.n_joist"],
             output_headers=output_headers,
-            image=vkt.ImageResult.from_path(image_path),
+            image=vkt.ImageResult(BytesIO(image)),
         )
 
-    def run_worker(self, models: list[dict]) -> list[dict]:
-        input_json = json.dumps(models)
-        script_path = Path(__file__).parent / "run_etabs_model.py"
-        files = [("inputs.json", BytesIO(bytes(input_json, "utf8"))), ("run_etabs_model.py", File.from_path(script_path))]
-        generic_analysis = GenericAnalysis(files=files, executable_key="run_etabs", output_filenames=["output.json"])
-        generic_analysis.execute(timeout=36000)
-        output_file = generic_analysis.get_output_file("output.json", as_file=True)
-        results_data = json.loads(output_file.getvalue())
-        return results_data
+    @staticmethod
+    def timing_data(timer: Timer) -> vkt.DataGroup:
+        """Total seconds per timed stage of a request"""
+        items = []
+        for name, total in timer.totals().items():
+            label = name if total["count"] == 1 else f"{name} ({total['count']}x)"
+            items.append(vkt.DataItem(label, total["seconds"], suffix="s", number_of_decimals=3))
+        return vkt.DataGroup(*items)
+
+    @staticmethod
+    def stored_variants(params, variants: list[dict], templates: dict) -> list[int]:
+        """Indices of the variants with results of the selected backend in the result store, under the keys run_worker uses"""
+        analysis_backend = get_backend(params.step_2.analysis_backend, params.step_2.use_symmetry)
+        store = ResultStore(version=store_version(analysis_backend.name, sections_db))
+        keys = [store.model_key(to_unit_model(model)[0]) for model in Controller.variant_models(params, variants, templates)]
+        stored = store.get_many(keys)
+        return [index for index, key in enumerate(keys) if key in stored]
+
+    @staticmethod
+    def variant_models(params, variants: list[dict], templates: dict) -> list[dict]:
+        """Worker model dicts of the variants, templates caches one ModelTemplate per joist value"""
+        models = []
+        for variant in variants:
+            if variant["joist_value"] not in templates:
+                templates[variant["joist_value"]] = ModelTemplate(
+                    variant["x_bay_width"],
+                    variant["y_bay_width"],
+                    variant["joist_value"],
+                    COLUMN_HEIGHT,
+                    variant["joist_n_diags"],
+                )
+            nodes, lines, nodes_with_load, supports, point_load = templates[variant["joist_value"]].instantiate(
+                variant["truss_depth_value"], variant["area_load"]
+            )
+            models.append(
+                {
+                "nodes": nodes,
+                "lines": lines,
+                "nodes_with_load": nodes_with_load,
+                "load_magnitud": point_load,
+                "supports": supports,
+                "section_name": params.step_1.section,
+                "section_props": sections_db[params.step_1.section]
+            })
+        return models
+
+    def run_worker(
+        self, models: list[dict], designs: list[dict] | None = None, backend: str | None = None, symmetry: bool = False
+    ) -> list[dict]:
+        """
+        Runs the models on the analysis backend, except those whose results are already in the result store.
+        Every model is analyzed under a unit load and its results are scaled, so load changes reuse earlier analyses.
+        With symmetry only the symmetric part of every model is analyzed, see app/symmetry.py.
+        """
+        analysis_backend = get_backend(backend, symmetry)
+        with span("result_store_lookup", models=len(models)):
+            store = ResultStore(version=store_version(analysis_backend.name, sections_db))
+            unit_models, factors = zip(*(to_unit_model(model) for model in models), strict=True)
+            keys = [store.model_key(model) for model in unit_models]
+            stored = store.get_many(keys)
+
+        missing = {key: index for index, key in enumerate(keys) if key not in stored}
+        for attempt in range(MAX_SUBMISSIONS):
+            if not missing:
+                break
+            submitted = list(missing.items())
+            try:
+                finished = dict(enumerate(analysis_backend.run([unit_models[index] for _, index in submitted])))
+                failure = None
+            except PartialResultsError as error:
+                # Keep what finished, so the next submission only contains the unfinished models
+                finished, failure = error.completed, error
+            # Timings of partial results the backend did not collect are not stored with the results
+            for result in finished.values():
+                result.pop("timings", None)
+            finished_keys = [submitted[position][0] for position in finished]
+            finished_designs = [designs[submitted[position][1]] for position in finished] if designs else None
+            with span("result_store_write", models=len(finished)):
+                store.put_many(finished_keys, list(finished.values()), finished_designs)
+            stored.update(zip(finished_keys, finished.values(), strict=True))
+            missing = {key: index for key, index in missing.items() if key not in stored}
+            if failure is not None and attempt == MAX_SUBMISSIONS - 1:
+                raise failure.cause or failure
+
+        return [
+            scale_result(stored[key], factor, model["nodes_with_load"]) for key, factor, model in zip(keys, factors, models, strict=True)
+        ]
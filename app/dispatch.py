@@ -0,0 +1,98 @@
+import contextvars
+import math
+import time
+
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PartialResultsError(Exception):
+    def __init__(self, completed: dict[int, dict], cause: BaseException | None = None) -> None:
+        """A batch failed after some models finished; completed maps model indices to their results"""
+        super().__init__(f"Batch failed with {len(completed)} models completed: {cause!r}")
+        self.completed = completed
+        self.cause = cause
+
+
+def model_size(model: dict) -> int:
+    """Cost estimate of a model, the number of members"""
+    return len(model["lines"])
+
+
+def shard_count(sizes: list[int], max_shards: int, target_shard_size: int) -> int:
+    """Enough shards to keep each near target_shard_size members, at most max_shards and one per model"""
+    return max(1, min(max_shards, len(sizes), math.ceil(sum(sizes) / target_shard_size)))
+
+
+def split_shards(sizes: list[int], n_shards: int) -> list[list[int]]:
+    """Greedy largest-first assignment of model indices to the least loaded shard. Indices stay sorted per shard"""
+    loads = [0] * n_shards
+    shards = [[] for _ in range(n_shards)]
+    for index in sorted(range(len(sizes)), key=lambda index: -sizes[index]):
+        lightest = loads.index(min(loads))
+        shards[lightest].append(index)
+        loads[lightest] += sizes[index]
+    return [sorted(shard) for shard in shards if shard]
+
+
+class ShardedDispatcher:
+    def __init__(self, run_shard: Callable[[list[dict]], list[dict]], max_shards: int = 4, target_shard_size: int = 5000) -> None:
+        """
+        Splits a list of models into shards and runs them concurrently, e.g. one worker job per shard.
+
+        Args:
+            run_shard (Callable): Runs a list of models and returns their results in the same order.
+            max_shards (int): Upper bound of concurrent shards, typically the number of available workers.
+            target_shard_size (int): Number of members per shard below which no extra shard is opened.
+        """
+        self.run_shard = run_shard
+        self.max_shards = max_shards
+        self.target_shard_size = target_shard_size
+        self.shard_timings = []
+
+    def run(self, models: list[dict]) -> list[dict]:
+        """Results of all models in their original order. Per-shard timings are kept in shard_timings"""
+        if not models:
+            self.shard_timings = []
+            return []
+        sizes = [model_size(model) for model in models]
+        shards = split_shards(sizes, shard_count(sizes, self.max_shards, self.target_shard_size))
+
+        def timed_run(shard_index: int, indices: list[int]) -> tuple[list[dict], dict]:
+            start = time.perf_counter()
+            results = self.run_shard([models[index] for index in indices])
+            timing = {
+                "shard": shard_index,
+                "models": len(indices),
+                "size": sum(sizes[index] for index in indices),
+                "seconds": time.perf_counter() - start,
+            }
+            return results, timing
+
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            # Shards run in a copy of the calling context, e.g. with the timer of the request
+            futures = [
+                executor.submit(contextvars.copy_context().run, timed_run, shard_index, indices)
+                for shard_index, indices in enumerate(shards)
+            ]
+
+        # Collect what finished, also from shards that failed part way, before raising
+        completed = {}
+        failure = None
+        self.shard_timings = []
+        for indices, future in zip(shards, futures, strict=True):
+            try:
+                results, timing = future.result()
+            except PartialResultsError as error:
+                completed.update((indices[index], result) for index, result in error.completed.items())
+                failure = failure or error.cause or error
+                continue
+            except Exception as error:
+                failure = failure or error
+                continue
+            completed.update(zip(indices, results, strict=True))
+            self.shard_timings.append(timing)
+
+        if failure is not None:
+            raise PartialResultsError(completed, failure) from failure
+        return [completed[index] for index in range(len(models))]
@@ -0,0 +1,292 @@
+"""
+Long-lived ETABS job server for the worker machine, so ETABS is started once instead of once per job.
+
+The server keeps a pool of started ETABS instances. Each instance is owned by one thread, which is also the COM
+apartment it was created in, and takes jobs from a shared queue. Between jobs the model is reset with
+InitializeNewModel; an instance is restarted after max_jobs jobs or after a job failed. Jobs arrive over a
+multiprocessing.connection socket as JSON, run_etabs_model.py forwards its job to the server when the
+ETABS_SERVER_ADDRESS environment variable is set.
+
+Clients authenticate with the secret in ETABS_SERVER_AUTHKEY; without it the server only listens on localhost. A job
+is checkpointed in a directory of the server, the client sends its checkpoint lines and gets the new ones back.
+
+    python etabs_server.py --instances 2 --port 6000 --max-jobs 50
+"""
+
+import argparse
+import ipaddress
+import json
+import os
+import queue
+import shutil
+import socket
+import tempfile
+import threading
+import traceback
+
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+
+try:
+    from app import timing
+    from app.run_etabs_model import run_models, start_etabs
+except ImportError:
+    import timing
+    from run_etabs_model import run_models, start_etabs
+
+DEFAULT_PORT = 6000
+DEFAULT_INSTANCES = 1
+# Jobs after which an instance is restarted, to release memory ETABS accumulates
+DEFAULT_MAX_JOBS = 50
+# Shared secret of server and clients, the connection is refused without it
+AUTHKEY = os.environ.get("ETABS_SERVER_AUTHKEY", "").encode("utf8")
+# Secret of a server without ETABS_SERVER_AUTHKEY, which only listens on the loopback interface
+LOCAL_AUTHKEY = b"etabs-job-server"
+# Directory of the job directories, the checkpoints of running jobs
+JOB_ROOT = Path(os.environ.get("ETABS_SERVER_JOB_ROOT", Path(tempfile.gettempdir()) / "etabs_server_jobs"))
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    """ "host:port" or "port" as a (host, port) tuple, the host defaults to localhost"""
+    host, _, port = address.rpartition(":")
+    return host or "localhost", int(port)
+
+
+def is_loopback(host: str) -> bool:
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        pass
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except OSError:
+        return False
+
+
+def server_authkey(host: str, authkey: bytes) -> bytes:
+    """The secret to serve on host with, a server reachable from other machines needs an explicit one"""
+    if authkey:
+        return authkey
+    if is_loopback(host):
+        return LOCAL_AUTHKEY
+    raise ValueError(f"Set ETABS_SERVER_AUTHKEY to serve on {host}, without it the server only listens on localhost")
+
+
+class JobError(Exception):
+    def __init__(self, cause: BaseException, checkpoint: list[str]) -> None:
+        """A failed job, with the checkpoint lines of the models it finished"""
+        super().__init__(f"{type(cause).__name__}: {cause}")
+        self.cause = cause
+        self.checkpoint = checkpoint
+
+
+class Instance(threading.Thread):
+    def __init__(self, jobs: queue.Queue, start, max_jobs: int, name: str, job_root: Path = JOB_ROOT) -> None:
+        """
+        One ETABS application, started, used and exited on this thread.
+
+        Args:
+            jobs (queue.Queue): (models, checkpoint lines, future) tuples, None stops the thread. The future gets the
+                results and the new checkpoint lines, or a JobError.
+            start (Callable): Returns a started (SapModel, application) pair, like start_etabs.
+            max_jobs (int): Jobs after which the application is restarted.
+            job_root (Path): Directory in which every job gets a directory for its checkpoint.
+        """
+        super().__init__(name=name, daemon=True)
+        self.jobs = jobs
+        self.start_engine = start
+        self.max_jobs = max_jobs
+        self.job_root = Path(job_root)
+        self.EtabsObject = None
+        self.EtabsEngine = None
+        self.jobs_done = 0
+        self.restarts = 0
+
+    def run(self) -> None:
+        while (job := self.jobs.get()) is not None:
+            models, checkpoint, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.job_root.mkdir(parents=True, exist_ok=True)
+            job_directory = Path(tempfile.mkdtemp(dir=self.job_root))
+            checkpoint_path = job_directory / "output.jsonl"
+            checkpoint_path.write_text("".join(line + "\n" for line in checkpoint))
+            timer = timing.Timer()
+            failure = None
+            try:
+                with timer.activate():
+                    results = self.run_job(models, checkpoint_path)
+            except BaseException as error:
+                failure = error
+            finally:
+                # The job directory is gone before the client hears back
+                new_lines = checkpoint_path.read_text().splitlines()[len(checkpoint) :]
+                shutil.rmtree(job_directory, ignore_errors=True)
+            if failure is not None:
+                future.set_exception(JobError(failure, new_lines))
+                self.stop_engine()
+                continue
+            if results:
+                job_spans = [entry for entry in timer.spans if entry["name"] in ("start_etabs", "reset_model")]
+                results[0]["timings"] = job_spans + results[0].get("timings", [])
+            future.set_result((results, new_lines))
+            if self.jobs_done >= self.max_jobs:
+                self.stop_engine()
+        self.stop_engine()
+
+    def run_job(self, models: list[dict], checkpoint_path: Path) -> list[dict]:
+        if self.EtabsObject is None:
+            with timing.span("start_etabs"):
+                self.EtabsObject, self.EtabsEngine = self.start_engine()
+            self.jobs_done = 0
+        elif self.jobs_done:
+            # Same state as a fresh start_etabs
+            with timing.span("reset_model"):
+                self.EtabsObject.InitializeNewModel(9)
+                self.EtabsObject.File.NewBlank()
+        self.jobs_done += 1
+        return run_models(self.EtabsObject, models, checkpoint_path=checkpoint_path)
+
+    def stop_engine(self) -> None:
+        """Exits the application, it is started again for the next job"""
+        if self.EtabsEngine is None:
+            return
+        try:
+            self.EtabsEngine.ApplicationExit(False)
+        except Exception:
+            traceback.print_exc()
+        self.EtabsObject = self.EtabsEngine = None
+        self.restarts += 1
+
+
+class EtabsJobServer:
+    def __init__(
+        self,
+        address: tuple[str, int] = ("localhost", DEFAULT_PORT),
+        instances: int = DEFAULT_INSTANCES,
+        max_jobs: int = DEFAULT_MAX_JOBS,
+        start=start_etabs,
+        authkey: bytes = AUTHKEY,
+        job_root: Path = JOB_ROOT,
+    ) -> None:
+        """
+        Pool of ETABS instances serving jobs from clients, at most one job per instance at a time.
+        Port 0 picks a free port, the bound address is in self.address. Without an authkey only a loopback
+        address can be served.
+        """
+        authkey = server_authkey(address[0], authkey)
+        self.jobs = queue.Queue()
+        self.instances = [Instance(self.jobs, start, max_jobs, f"etabs-{index}", job_root) for index in range(instances)]
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self._closed = threading.Event()
+
+    def submit(self, models: list[dict], checkpoint: list[str] | None = None) -> Future:
+        """
+        Queues a job on the pool, for use in the server process. Models in the checkpoint lines are not analyzed
+        again. The future gets the results and the checkpoint lines of the analyzed models.
+        """
+        future = Future()
+        self.jobs.put((models, checkpoint or [], future))
+        return future
+
+    def serve_forever(self) -> None:
+        for instance in self.instances:
+            instance.start()
+        while not self._closed.is_set():
+            try:
+                connection = self.listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                # Closed listener, or a client that failed authentication
+                continue
+            if self._closed.is_set():
+                connection.close()
+                break
+            threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+
+    def handle(self, connection) -> None:
+        """One request per connection: {"models", "checkpoint"} in, {"results"} or {"error"} with the new "checkpoint" out"""
+        with connection:
+            try:
+                request = json.loads(connection.recv_bytes())
+                results, checkpoint = self.submit(request["models"], request.get("checkpoint")).result()
+                reply = {"results": results, "checkpoint": checkpoint}
+            except JobError as error:
+                trace = "".join(traceback.format_exception(error.cause))
+                reply = {"error": str(error), "traceback": trace, "checkpoint": error.checkpoint}
+            except Exception as error:
+                reply = {"error": f"{type(error).__name__}: {error}", "traceback": traceback.format_exc()}
+            try:
+                connection.send_bytes(json.dumps(reply).encode("utf8"))
+            except OSError:
+                # The client is gone, e.g. its job timed out
+                pass
+
+    def close(self) -> None:
+        """Stops accepting jobs, lets the instances finish their current job and exits ETABS"""
+        self._closed.set()
+        # Wakes up the accept of serve_forever
+        try:
+            socket.create_connection(self.address, timeout=1).close()
+        except OSError:
+            pass
+        self.listener.close()
+        for _ in self.instances:
+            self.jobs.put(None)
+        for instance in self.instances:
+            if instance.is_alive():
+                instance.join()
+
+
+def submit_job(
+    address: tuple[str, int], models: list[dict], checkpoint_path: str | None = None, authkey: bytes = AUTHKEY
+) -> list[dict]:
+    """
+    Runs the models on the job server and returns run_models results. Raises ConnectionError if no server listens
+    at address, and RuntimeError if the job failed on the server.
+
+    checkpoint_path is a file of this machine: models in it are not analyzed again, and the server's checkpoint lines
+    of the job are appended to it, also when the job failed.
+    """
+    checkpoint_path = Path(checkpoint_path) if checkpoint_path else None
+    text = checkpoint_path.read_text() if checkpoint_path and checkpoint_path.exists() else ""
+    with Client(address, authkey=authkey or LOCAL_AUTHKEY) as connection:
+        connection.send_bytes(json.dumps({"models": models, "checkpoint": text.splitlines()}).encode("utf8"))
+        reply = json.loads(connection.recv_bytes())
+    if checkpoint_path and reply.get("checkpoint"):
+        with open(checkpoint_path, "a") as checkpoint:
+            # A line cut off by a crash stays a line of its own
+            checkpoint.write("\n" if text and not text.endswith("\n") else "")
+            checkpoint.write("".join(line + "\n" for line in reply["checkpoint"]))
+    if "error" in reply:
+        raise RuntimeError(f"ETABS job server: {reply['error']}\n{reply.get('traceback', '')}")
+    return reply["results"]
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Serves ETABS jobs from a pool of running ETABS instances")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--instances", type=int, default=DEFAULT_INSTANCES)
+    parser.add_argument("--max-jobs", type=int, default=DEFAULT_MAX_JOBS, help="jobs after which an instance is restarted")
+    parser.add_argument("--fake", action="store_true", help="serve with the in-process stand-in of app/fake_etabs.py")
+    args = parser.parse_args(argv)
+
+    start = start_etabs
+    if args.fake:
+        from app.fake_etabs import start_fake_etabs as start
+
+    server = EtabsJobServer((args.host, args.port), args.instances, args.max_jobs, start)
+    print(f"ETABS job server on {server.address[0]}:{server.address[1]} with {args.instances} instance(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
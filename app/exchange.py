@@ -0,0 +1,141 @@
+"""
+Binary exchange format between the app and the ETABS worker.
+
+A compressed NumPy archive holding every distinct topology once (node IDs, base coordinates, connectivity),
+and per variant only the coordinate rows that differ from the base. All other model keys travel as JSON
+metadata. Results come back as typed arrays. This module is shipped next to run_etabs_model.py, so it only
+depends on NumPy.
+"""
+
+import hashlib
+import io
+import json
+
+import numpy as np
+
+EXCHANGE_VERSION = 1
+# Columns of the result tables holding names instead of numbers
+LABEL_COLUMNS = ("joint", "frame")
+
+
+def _json_array(obj) -> np.ndarray:
+    return np.frombuffer(json.dumps(obj).encode("utf8"), dtype=np.uint8)
+
+
+def _from_json_array(array: np.ndarray):
+    return json.loads(array.tobytes().decode("utf8"))
+
+
+def _check_version(archive) -> None:
+    version = int(archive["version"][0])
+    if version != EXCHANGE_VERSION:
+        raise ValueError(f"Unsupported exchange format version {version}, expected {EXCHANGE_VERSION}")
+
+
+def _topology_signature(model: dict) -> str:
+    topology = [list(map(int, model["nodes"])), [(line["nodeI"], line["nodeJ"]) for line in model["lines"].values()]]
+    topology.append([list(map(int, model["lines"])), [line.get("component") for line in model["lines"].values()]])
+    return hashlib.sha256(json.dumps(topology).encode("utf8")).hexdigest()
+
+
+def pack_models(models: list[dict]) -> bytes:
+    """Compressed archive of the model dicts sent to the worker, each distinct topology is stored once"""
+    arrays = {"version": np.array([EXCHANGE_VERSION])}
+    topologies = {}
+    variants = []
+    for index, model in enumerate(models):
+        node_ids = np.fromiter(map(int, model["nodes"]), dtype=np.int64, count=len(model["nodes"]))
+        coords = np.array([(node["x"], node["y"], node["z"]) for node in model["nodes"].values()], dtype=np.float64).reshape(-1, 3)
+        signature = _topology_signature(model)
+        if signature not in topologies:
+            topology = len(topologies)
+            topologies[signature] = topology
+            line_values = list(model["lines"].values())
+            component_names = list(dict.fromkeys(line.get("component") for line in line_values))
+            row_of_id = {node_id: row for row, node_id in enumerate(node_ids.tolist())}
+            arrays[f"t{topology}_node_ids"] = node_ids
+            arrays[f"t{topology}_coords"] = coords
+            arrays[f"t{topology}_line_ids"] = np.fromiter(map(int, model["lines"]), dtype=np.int64, count=len(line_values))
+            arrays[f"t{topology}_connectivity"] = np.array(
+                [(row_of_id[line["nodeI"]], row_of_id[line["nodeJ"]]) for line in line_values], dtype=np.int64
+            ).reshape(-1, 2)
+            arrays[f"t{topology}_components"] = np.array([component_names.index(line.get("component")) for line in line_values])
+            arrays[f"t{topology}_component_names"] = _json_array(component_names)
+        topology = topologies[signature]
+        changed = np.flatnonzero(np.any(coords != arrays[f"t{topology}_coords"], axis=1))
+        arrays[f"v{index}_changed_rows"] = changed
+        arrays[f"v{index}_changed_coords"] = coords[changed]
+        variants.append({"topology": topology, "model": {key: value for key, value in model.items() if key not in ("nodes", "lines")}})
+
+    arrays["variants"] = _json_array(variants)
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def unpack_models(data) -> list[dict]:
+    """Model dicts as json.load would return them from inputs.json: string keys for nodes and lines"""
+    with np.load(io.BytesIO(data) if isinstance(data, bytes) else data) as archive:
+        _check_version(archive)
+        variants = _from_json_array(archive["variants"])
+        models = []
+        for index, variant in enumerate(variants):
+            topology = variant["topology"]
+            node_ids = archive[f"t{topology}_node_ids"].tolist()
+            coords = archive[f"t{topology}_coords"].copy()
+            coords[archive[f"v{index}_changed_rows"]] = archive[f"v{index}_changed_coords"]
+            component_names = _from_json_array(archive[f"t{topology}_component_names"])
+            end_ids = np.asarray(node_ids, dtype=np.int64)[archive[f"t{topology}_connectivity"]].tolist()
+            nodes = {
+                str(node_id): {"id": node_id, "x": x, "y": y, "z": z}
+                for node_id, (x, y, z) in zip(node_ids, coords.tolist(), strict=True)
+            }
+            lines = {
+                str(line_id): {"id": line_id, "nodeI": node_i, "nodeJ": node_j, "component": component_names[code]}
+                for line_id, (node_i, node_j), code in zip(
+                    archive[f"t{topology}_line_ids"].tolist(), end_ids, archive[f"t{topology}_components"].tolist(), strict=True
+                )
+            }
+            models.append({"nodes": nodes, "lines": lines, **variant["model"]})
+    return models
+
+
+def pack_results(results: list[dict]) -> bytes:
+    """Compressed archive of worker results: deformations and every result table as typed column arrays"""
+    arrays = {"version": np.array([EXCHANGE_VERSION])}
+    layout = []
+    for index, result in enumerate(results):
+        arrays[f"r{index}_deformation_joints"] = np.array(list(result["deformations"]), dtype=str)
+        arrays[f"r{index}_deformations"] = np.array(list(result["deformations"].values()), dtype=np.float64)
+        tables = {}
+        scalars = {}
+        for key, value in result.items():
+            if key == "deformations":
+                continue
+            if isinstance(value, dict):
+                tables[key] = list(value)
+                for column, values in value.items():
+                    dtype = str if column in LABEL_COLUMNS else np.float64
+                    arrays[f"r{index}_{key}_{column}"] = np.array(values, dtype=dtype)
+            else:
+                scalars[key] = value
+        layout.append({"tables": tables, "scalars": scalars})
+    arrays["layout"] = _json_array(layout)
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def unpack_results(data) -> list[dict]:
+    """Result dicts with the same content as output.json"""
+    with np.load(io.BytesIO(data) if isinstance(data, bytes) else data) as archive:
+        _check_version(archive)
+        results = []
+        for index, entry in enumerate(_from_json_array(archive["layout"])):
+            joints = archive[f"r{index}_deformation_joints"].tolist()
+            result = {"deformations": dict(zip(joints, archive[f"r{index}_deformations"].tolist(), strict=True))}
+            result.update(entry["scalars"])
+            for key, columns in entry["tables"].items():
+                result[key] = {column: archive[f"r{index}_{key}_{column}"].tolist() for column in columns}
+            results.append(result)
+    return results
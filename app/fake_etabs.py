@@ -0,0 +1,360 @@
+"""
+In-process stand-in for the ETABS COM API, for running the worker of app/run_etabs_model.py without Windows or ETABS.
+
+FakeEtabs implements the subset of cOAPI and cSapModel calls the worker makes, with the return values of the real API.
+Every call counts as one COM round trip and can sleep a configurable latency, so COM call volume and worker throughput
+can be measured on any machine. RunAnalysis solves the model with the local frame solver, so displacements, reactions
+and frame forces are those of a linear-elastic analysis, not placeholders.
+
+    EtabsObject, EtabsEngine = start_fake_etabs(latency=0.002)
+    results = run_models(EtabsObject, models)
+    EtabsEngine.round_trips, EtabsEngine.calls.most_common(3)
+"""
+
+import time
+
+from collections import Counter
+
+import numpy as np
+
+from app.components.array_model import ArrayModel
+from app.frame_solver import DOFS_PER_NODE, internal_forces, solve_frame, tube_section_properties
+
+# Item types of the Results calls: eItemTypeElm.ObjectElm and eItemTypeElm.GroupElm
+OBJECT_ELM = 0
+GROUP_ELM = 2
+ALL_GROUP = "All"
+
+
+class FakeEtabs:
+    def __init__(self, latency: float = 0.0, call_latency: dict[str, float] | None = None) -> None:
+        """
+        Fake ETABS application, the object start_etabs returns as EtabsEngine.
+
+        Args:
+            latency (float): Seconds every COM call takes.
+            call_latency (dict | None): Seconds per call name like "Analyze.RunAnalysis", replacing latency for that call.
+        """
+        self.latency = latency
+        self.call_latency = call_latency or {}
+        self.calls = Counter()
+        self.running = False
+        self.SapModel = FakeSapModel(self)
+
+    @property
+    def round_trips(self) -> int:
+        return sum(self.calls.values())
+
+    def round_trip(self, name: str) -> None:
+        self.calls[name] += 1
+        delay = self.call_latency.get(name, self.latency)
+        if delay:
+            time.sleep(delay)
+
+    def ApplicationStart(self) -> int:
+        self.round_trip("ApplicationStart")
+        self.running = True
+        return 0
+
+    def ApplicationExit(self, FileSave: bool) -> int:
+        self.round_trip("ApplicationExit")
+        self.running = False
+        return 0
+
+
+def start_fake_etabs(latency: float = 0.0, call_latency: dict[str, float] | None = None):
+    """Same as run_etabs_model.start_etabs: a started application with a new blank model, as (SapModel, engine)"""
+    engine = FakeEtabs(latency, call_latency)
+    engine.ApplicationStart()
+    engine.SapModel.InitializeNewModel(9)
+    engine.SapModel.File.NewBlank()
+    return engine.SapModel, engine
+
+
+class _Interface:
+    def __init__(self, model: "FakeSapModel", name: str) -> None:
+        self._model = model
+        self._name = name
+
+    def _call(self, method: str) -> None:
+        self._model.engine.round_trip(f"{self._name}.{method}")
+
+
+class FakeSapModel:
+    def __init__(self, engine: FakeEtabs) -> None:
+        self.engine = engine
+        self.PointObj = _PointObj(self, "PointObj")
+        self.EditPoint = _EditPoint(self, "EditPoint")
+        self.FrameObj = _FrameObj(self, "FrameObj")
+        self.PropMaterial = _PropMaterial(self, "PropMaterial")
+        self.PropFrame = _PropFrame(self, "PropFrame")
+        self.LoadPatterns = _LoadPatterns(self, "LoadPatterns")
+        self.File = _File(self, "File")
+        self.View = _View(self, "View")
+        self.Analyze = _Analyze(self, "Analyze")
+        self.Results = _Results(self, "Results")
+        self._reset()
+
+    def _reset(self) -> None:
+        self.points = {}
+        self.frames = {}
+        self.materials = {}
+        self.sections = {}
+        self.load_patterns = set()
+        self.restraints = {}
+        self.loads = {}
+        self.locked = False
+        self.solutions = {}
+        self.saved_path = None
+
+    def _call(self, method: str) -> None:
+        self.engine.round_trip(method)
+
+    def InitializeNewModel(self, Units: int = 9) -> int:
+        self._call("InitializeNewModel")
+        self._reset()
+        return 0
+
+    def SetPresentUnits(self, Units: int) -> int:
+        self._call("SetPresentUnits")
+        # Only N, mm, C (9) is modelled
+        return 0 if Units == 9 else 1
+
+    def SetModelIsLocked(self, LockIt: bool) -> int:
+        self._call("SetModelIsLocked")
+        self.locked = bool(LockIt)
+        if not self.locked:
+            self.solutions = {}
+        return 0
+
+    def analyze(self) -> None:
+        """Solves every load pattern with the local frame solver"""
+        names = list(self.points)
+        rows = {name: row for row, name in enumerate(names)}
+        frame_names = list(self.frames)
+        connectivity = [(rows[frame["point_i"]], rows[frame["point_j"]]) for frame in self.frames.values()]
+        model = ArrayModel(
+            np.arange(len(names)),
+            [self.points[name] for name in names],
+            np.arange(len(frame_names)),
+            connectivity,
+            np.zeros(len(frame_names)),
+        )
+        section_names = {frame["section"] for frame in self.frames.values()}
+        if len(section_names) > 1:
+            raise ValueError(f"The fake ETABS model supports one frame section, got {sorted(section_names)}")
+        section = self.sections[section_names.pop()] if section_names else tube_section_properties(1, 0.1)
+
+        modifiers = [frame["modifier"] for frame in self.frames.values()]
+
+        restrained = np.zeros((len(names), DOFS_PER_NODE), dtype=bool)
+        for name, restraint in self.restraints.items():
+            restrained[rows[name]] = restraint
+        self.solutions = {}
+        for pattern in self.load_patterns:
+            loads = np.zeros((len(names), DOFS_PER_NODE))
+            for (name, load_pattern), values in self.loads.items():
+                if load_pattern == pattern:
+                    loads[rows[name]] += values
+            solution = solve_frame(model, section, loads, restrained, modifiers)
+            self.solutions[pattern] = {"point_names": names, "frame_names": frame_names, "model": model, **solution}
+        self.locked = True
+
+
+class _PointObj(_Interface):
+    def AddCartesian(self, X: float, Y: float, Z: float, Name: str = "", UserName: str = "", CSys: str = "Global"):
+        self._call("AddCartesian")
+        if self._model.locked:
+            return 1, ""
+        name = UserName or str(len(self._model.points) + 1)
+        self._model.points[name] = (float(X), float(Y), float(Z))
+        return 0, name
+
+    def SetRestraint(self, Name: str, Value: list) -> int:
+        self._call("SetRestraint")
+        if self._model.locked or Name not in self._model.points:
+            return 1
+        self._model.restraints[Name] = np.asarray(Value, dtype=bool)
+        return 0
+
+    def SetLoadForce(self, Name: str, LoadPat: str, Value: list, Replace: bool = False, CSys: str = "Global") -> int:
+        self._call("SetLoadForce")
+        if self._model.locked or Name not in self._model.points or LoadPat not in self._model.load_patterns:
+            return 1
+        key = (Name, LoadPat)
+        previous = 0 if Replace else self._model.loads.get(key, 0)
+        self._model.loads[key] = previous + np.asarray(Value, dtype=float)
+        return 0
+
+
+class _EditPoint(_Interface):
+    def ChangeCoordinates_1(self, Name: str, X: float, Y: float, Z: float, NoRefresh: bool = False) -> int:
+        self._call("ChangeCoordinates_1")
+        if self._model.locked or Name not in self._model.points:
+            return 1
+        self._model.points[Name] = (float(X), float(Y), float(Z))
+        return 0
+
+
+class _FrameObj(_Interface):
+    def AddByPoint(self, Point1: str, Point2: str, Name: str = "", PropName: str = "Default", UserName: str = ""):
+        self._call("AddByPoint")
+        if self._model.locked or Point1 not in self._model.points or Point2 not in self._model.points:
+            return 1, ""
+        name = Name or str(len(self._model.frames) + 1)
+        self._model.frames[name] = {"point_i": Point1, "point_j": Point2, "section": PropName, "modifier": 1.0}
+        return 0, name
+
+    def SetModifiers(self, Name: str, Value: list, ItemType: int = 0) -> int:
+        self._call("SetModifiers")
+        if self._model.locked or Name not in self._model.frames:
+            return 1
+        # One factor on the whole element stiffness, as the frame solver applies it
+        if len(set(Value[:6])) > 1:
+            raise ValueError(f"The fake ETABS model supports equal stiffness modifiers, got {list(Value[:6])}")
+        self._model.frames[Name]["modifier"] = float(Value[0])
+        return 0
+
+
+class _PropMaterial(_Interface):
+    def SetMaterial(self, Name: str, MatType: int) -> int:
+        self._call("SetMaterial")
+        self._model.materials[Name] = {"type": MatType}
+        return 0
+
+    def SetMPIsotropic(self, Name: str, E: float, U: float, A: float) -> int:
+        # Recorded only, the frame solver analyzes with its own S355 properties, the values the worker sets
+        self._call("SetMPIsotropic")
+        if Name not in self._model.materials:
+            return 1
+        self._model.materials[Name].update({"E": E, "U": U, "A": A})
+        return 0
+
+
+class _PropFrame(_Interface):
+    def SetTube_1(self, Name: str, MatProp: str, T3: float, T2: float, Tf: float, Tw: float, Twt: float) -> int:
+        self._call("SetTube_1")
+        if MatProp not in self._model.materials:
+            return 1
+        # Square hollow sections only, like the worker defines
+        self._model.sections[Name] = tube_section_properties(T3, Tf)
+        return 0
+
+
+class _LoadPatterns(_Interface):
+    def Add(self, Name: str, MyType: int, SelfWTMultiplier: float = 0, AddAnalysisCase: bool = True) -> int:
+        self._call("Add")
+        if Name in self._model.load_patterns:
+            return 1
+        self._model.load_patterns.add(Name)
+        return 0
+
+
+class _File(_Interface):
+    def NewBlank(self) -> int:
+        self._call("NewBlank")
+        self._model._reset()
+        return 0
+
+    def Save(self, FileName: str = "") -> int:
+        # Nothing is written, the path is kept for inspection
+        self._call("Save")
+        self._model.saved_path = FileName
+        return 0
+
+
+class _View(_Interface):
+    def RefreshView(self, Window: int = 0, Zoom: bool = True) -> int:
+        self._call("RefreshView")
+        return 0
+
+
+class _Analyze(_Interface):
+    def RunAnalysis(self) -> int:
+        self._call("RunAnalysis")
+        self._model.analyze()
+        return 0
+
+
+class _Setup(_Interface):
+    def __init__(self, model: FakeSapModel, name: str) -> None:
+        super().__init__(model, name)
+        self.selected = set()
+
+    def DeselectAllCasesAndCombosForOutput(self) -> int:
+        self._call("DeselectAllCasesAndCombosForOutput")
+        self.selected.clear()
+        return 0
+
+    def SetCaseSelectedForOutput(self, Name: str, Selected: bool = True) -> int:
+        self._call("SetCaseSelectedForOutput")
+        if Name not in self._model.load_patterns:
+            return 1
+        if Selected:
+            self.selected.add(Name)
+        else:
+            self.selected.discard(Name)
+        return 0
+
+
+class _Results(_Interface):
+    def __init__(self, model: FakeSapModel, name: str) -> None:
+        super().__init__(model, name)
+        self.Setup = _Setup(model, f"{name}.Setup")
+
+    def _selected_solutions(self) -> list[tuple[str, dict]]:
+        return [(case, self._model.solutions[case]) for case in sorted(self.Setup.selected) if case in self._model.solutions]
+
+    @staticmethod
+    def _rows(names: list[str], Name: str, ItemTypeElm: int) -> np.ndarray:
+        if ItemTypeElm == GROUP_ELM and Name == ALL_GROUP:
+            return np.arange(len(names))
+        if ItemTypeElm == OBJECT_ELM and Name in names:
+            return np.array([names.index(Name)])
+        return np.zeros(0, dtype=int)
+
+    def _joint_table(self, key: str, Name: str, ItemTypeElm: int, restrained_only: bool = False):
+        columns = [[] for _ in range(5 + DOFS_PER_NODE)]
+        for case, solution in self._selected_solutions():
+            rows = self._rows(solution["point_names"], Name, ItemTypeElm)
+            if restrained_only:
+                restraints = self._model.restraints
+                rows = np.array([row for row in rows if restraints.get(solution["point_names"][row], np.zeros(1)).any()], dtype=int)
+            names = [solution["point_names"][row] for row in rows]
+            n = len(names)
+            for column, values in zip(columns, [names, names, [case] * n, ["LinStatic"] * n, [0.0] * n], strict=False):
+                column.extend(values)
+            for dof in range(DOFS_PER_NODE):
+                columns[5 + dof].extend(solution[key][rows, dof].tolist())
+        return len(columns[0]), *columns, 0
+
+    def JointDispl(self, Name: str, ItemTypeElm: int):
+        """NumberResults, Obj, Elm, LoadCase, StepType, StepNum, U1, U2, U3, R1, R2, R3 and the return code"""
+        self._call("JointDispl")
+        return self._joint_table("displacements", Name, ItemTypeElm)
+
+    def JointReact(self, Name: str, ItemTypeElm: int):
+        """NumberResults, Obj, Elm, LoadCase, StepType, StepNum, F1, F2, F3, M1, M2, M3 and the return code"""
+        self._call("JointReact")
+        return self._joint_table("reactions", Name, ItemTypeElm, restrained_only=True)
+
+    def FrameForce(self, Name: str, ItemTypeElm: int):
+        """
+        NumberResults, Obj, ObjSta, Elm, ElmSta, LoadCase, StepType, StepNum, P, V2, V3, T, M2, M3 and the return code,
+        at the two ends of every frame in its local axes, tension positive
+        """
+        self._call("FrameForce")
+        columns = [[] for _ in range(7 + DOFS_PER_NODE)]
+        for case, solution in self._selected_solutions():
+            rows = self._rows(solution["frame_names"], Name, ItemTypeElm)
+            internal = internal_forces(solution["end_forces"][rows])
+            names = np.repeat([solution["frame_names"][row] for row in rows], 2).tolist()
+            stations = np.column_stack([np.zeros(len(rows)), solution["model"].lengths()[rows]]).ravel().tolist()
+            n = len(names)
+            for column, values in zip(
+                columns, [names, stations, names, stations, [case] * n, ["LinStatic"] * n, [0.0] * n], strict=False
+            ):
+                column.extend(values)
+            for dof in range(DOFS_PER_NODE):
+                columns[7 + dof].extend(internal[:, dof].tolist())
+        return len(columns[0]), *columns, 0
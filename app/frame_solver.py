@@ -0,0 +1,194 @@
+import numpy as np
+
+from scipy.sparse import coo_matrix
+from scipy.sparse.linalg import spsolve
+
+from app.components.array_model import ArrayModel
+
+# Same material as the ETABS worker: S355, units N and mm
+YOUNGS_MODULUS = 210000
+POISSON_RATIO = 0.3
+DOFS_PER_NODE = 6
+# ETABS local axes 1, 2 and 3 of a frame in the local x, y and z of rotation_matrices: 1 along the member, 2 upward in
+# the vertical plane through it, global +X for vertical members, and 3 = 1 x 2
+ETABS_AXES = np.array([[1.0, 0.0, 0.0], [0.0, 0.0, 1.0], [0.0, -1.0, 0.0]])
+
+
+def tube_section_properties(depth: float, thickness: float) -> dict:
+    """Area, bending inertia and torsion constant of a square hollow section"""
+    inner = depth - 2 * thickness
+    area = depth**2 - inner**2
+    inertia = (depth**4 - inner**4) / 12
+    # Thin-walled closed section: J = 4 * Am^2 * t / perimeter along the mid line
+    torsion = thickness * (depth - thickness) ** 3
+    return {"A": area, "Iy": inertia, "Iz": inertia, "J": torsion}
+
+
+def local_stiffness(lengths: np.ndarray, E: float, G: float, A, Iy, Iz, J) -> np.ndarray:
+    """(M, 12, 12) Euler-Bernoulli 3D frame element stiffness in local axes. Section values are scalars or (M,) arrays"""
+    L = lengths
+    k = np.zeros((len(L), 12, 12))
+    EA_L = E * np.asarray(A) / L
+    GJ_L = G * np.asarray(J) / L
+    k[:, 0, 0] = k[:, 6, 6] = EA_L
+    k[:, 0, 6] = k[:, 6, 0] = -EA_L
+    k[:, 3, 3] = k[:, 9, 9] = GJ_L
+    k[:, 3, 9] = k[:, 9, 3] = -GJ_L
+
+    # Bending in the local x-y plane (about z): v at 1 / 7, rotation at 5 / 11
+    # Bending in the local x-z plane (about y): w at 2 / 8, rotation at 4 / 10, with opposite coupling signs
+    for inertia, (v1, r1, v2, r2), sign in ((Iz, (1, 5, 7, 11), 1), (Iy, (2, 4, 8, 10), -1)):
+        EI = E * np.asarray(inertia)
+        a = 12 * EI / L**3
+        b = 6 * EI / L**2 * sign
+        c = 4 * EI / L
+        d = 2 * EI / L
+        k[:, v1, v1] = k[:, v2, v2] = a
+        k[:, v1, v2] = k[:, v2, v1] = -a
+        k[:, v1, r1] = k[:, r1, v1] = k[:, v1, r2] = k[:, r2, v1] = b
+        k[:, v2, r1] = k[:, r1, v2] = k[:, v2, r2] = k[:, r2, v2] = -b
+        k[:, r1, r1] = k[:, r2, r2] = c
+        k[:, r1, r2] = k[:, r2, r1] = d
+    return k
+
+
+def rotation_matrices(coords: np.ndarray, connectivity: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(M, 3, 3) direction cosines with local x along the member, and the member lengths"""
+    delta = coords[connectivity[:, 1]] - coords[connectivity[:, 0]]
+    lengths = np.linalg.norm(delta, axis=1)
+    local_x = delta / lengths[:, None]
+    # Reference vector for the local y axis, global Z unless the member is vertical
+    vertical = np.abs(local_x[:, 2]) > 1 - 1e-9
+    reference = np.where(vertical[:, None], [1.0, 0.0, 0.0], [0.0, 0.0, 1.0])
+    local_y = np.cross(reference, local_x)
+    local_y /= np.linalg.norm(local_y, axis=1)[:, None]
+    local_z = np.cross(local_x, local_y)
+    return np.stack([local_x, local_y, local_z], axis=1), lengths
+
+
+def element_matrices(model: ArrayModel, section: dict, E: float = YOUNGS_MODULUS, nu: float = POISSON_RATIO, modifiers=None):
+    """(M, 12, 12) local stiffness and local-to-global transformation of every member"""
+    rotation, lengths = rotation_matrices(model.coords, model.connectivity)
+    G = E / (2 * (1 + nu))
+    k_local = local_stiffness(lengths, E, G, section["A"], section["Iy"], section["Iz"], section["J"])
+    if modifiers is not None:
+        k_local *= np.asarray(modifiers)[:, None, None]
+
+    transform = np.zeros((model.n_lines, 12, 12))
+    for block in range(4):
+        transform[:, 3 * block : 3 * block + 3, 3 * block : 3 * block + 3] = rotation
+    return k_local, transform
+
+
+def element_dofs(model: ArrayModel) -> np.ndarray:
+    return (DOFS_PER_NODE * model.connectivity[:, :, None] + np.arange(DOFS_PER_NODE)).reshape(-1, 12)
+
+
+def assemble_stiffness(model: ArrayModel, k_local: np.ndarray, transform: np.ndarray):
+    """Sparse global stiffness matrix from the element matrices"""
+    k_global = np.einsum("mji,mjk,mkl->mil", transform, k_local, transform, optimize=True)
+    dofs = element_dofs(model)
+    rows = np.broadcast_to(dofs[:, :, None], k_global.shape).ravel()
+    cols = np.broadcast_to(dofs[:, None, :], k_global.shape).ravel()
+    n_dofs = DOFS_PER_NODE * model.n_nodes
+    return coo_matrix((k_global.ravel(), (rows, cols)), shape=(n_dofs, n_dofs)).tocsr()
+
+
+def solve_frame(model: ArrayModel, section: dict, loads: np.ndarray, restrained: np.ndarray, modifiers=None) -> dict:
+    """
+    Linear static solution of a 3D frame.
+
+    Args:
+        model (ArrayModel): Geometry and connectivity.
+        section (dict): A, Iy, Iz and J shared by all members.
+        loads (np.ndarray): (N, 6) nodal forces and moments in global axes.
+        restrained (np.ndarray): (N, 6) True for fixed degrees of freedom.
+        modifiers: Optional (M,) stiffness factor per member.
+
+    Returns:
+        dict: "displacements" and "reactions" as (N, 6) arrays in global axes, and "end_forces" as a (M, 12) array
+        with the forces and moments each member applies on its end nodes, in local member axes.
+    """
+    k_local, transform = element_matrices(model, section, modifiers=modifiers)
+    stiffness = assemble_stiffness(model, k_local, transform)
+    loads = np.asarray(loads, dtype=float).ravel()
+    free = np.flatnonzero(~np.asarray(restrained, dtype=bool).ravel())
+    displacements = np.zeros(DOFS_PER_NODE * model.n_nodes)
+    displacements[free] = spsolve(stiffness[free][:, free].tocsc(), loads[free])
+
+    reactions = stiffness @ displacements - loads
+    reactions[free] = 0
+    local_displacements = np.einsum("mij,mj->mi", transform, displacements[element_dofs(model)])
+    end_forces = np.einsum("mij,mj->mi", k_local, local_displacements)
+    return {
+        "displacements": displacements.reshape(-1, DOFS_PER_NODE),
+        "reactions": reactions.reshape(-1, DOFS_PER_NODE),
+        "end_forces": end_forces,
+    }
+
+
+def analyze_model(data: dict) -> dict:
+    """
+    Analyzes a worker model dict and returns the same payload as the ETABS worker. Like the worker it takes the
+    optional keys "restraints" (node ID to six 0/1 flags), "frame_modifiers" (line ID to stiffness factor) and
+    "load_factors" (node ID to load factor), keyed on string IDs.
+    """
+    model = ArrayModel.from_dicts(data["nodes"], data["lines"])
+    section = tube_section_properties(data["section_props"]["depth"], data["section_props"]["thickness"])
+
+    numbering = model.numbering()
+    loaded_rows = numbering.index([int(node_id) for node_id in data["nodes_with_load"]])
+    loads = np.zeros((model.n_nodes, DOFS_PER_NODE))
+    load_factors = data.get("load_factors", {})
+    loads[loaded_rows, 2] = [-data["load_magnitud"] * load_factors.get(str(node_id), 1.0) for node_id in data["nodes_with_load"]]
+
+    restrained = np.zeros((model.n_nodes, DOFS_PER_NODE), dtype=bool)
+    support_rows = numbering.index([int(node_id) for node_id in data["supports"]])
+    restrained[support_rows] = True
+    # Optional extra restraints per node, e.g. those of a symmetry plane
+    restraints = data.get("restraints")
+    if restraints:
+        restrained[numbering.index(list(map(int, restraints)))] |= np.array(list(restraints.values()), dtype=bool)
+
+    frame_modifiers = data.get("frame_modifiers")
+    modifiers = [frame_modifiers.get(str(line_id), 1.0) for line_id in data["lines"]] if frame_modifiers else None
+
+    solution = solve_frame(model, section, loads, restrained, modifiers)
+    return results_payload(model, solution, loaded_rows, support_rows)
+
+
+def internal_forces(end_forces: np.ndarray) -> np.ndarray:
+    """
+    (2M, 6) internal forces and moments at end I and end J of every member in ETABS local axes, as the ETABS
+    FrameForce table reports them: the negated end I forces and the end J forces, tension positive
+    """
+    internal = np.stack([-end_forces[:, :DOFS_PER_NODE], end_forces[:, DOFS_PER_NODE:]], axis=1)
+    return (internal.reshape(-1, 2, 3) @ ETABS_AXES.T).reshape(-1, DOFS_PER_NODE)
+
+
+def results_payload(model: ArrayModel, solution: dict, loaded_rows: np.ndarray, support_rows: np.ndarray) -> dict:
+    """Same columnar layout as the ETABS worker output"""
+    node_names = list(map(str, model.node_ids.tolist()))
+    displacements = solution["displacements"]
+    joint_displacements = {"joint": node_names}
+    joint_displacements.update({name: displacements[:, dof].tolist() for dof, name in enumerate(("u1", "u2", "u3", "r1", "r2", "r3"))})
+
+    support_reactions = solution["reactions"][support_rows]
+    reactions = {"joint": [node_names[row] for row in support_rows]}
+    reactions.update({name: support_reactions[:, dof].tolist() for dof, name in enumerate(("f1", "f2", "f3", "m1", "m2", "m3"))})
+
+    internal = internal_forces(solution["end_forces"])
+    frame_forces = {
+        "frame": np.repeat(model.line_ids.astype(str), 2).tolist(),
+        "station": np.column_stack([np.zeros(model.n_lines), model.lengths()]).ravel().tolist(),
+    }
+    frame_forces.update({name: internal[:, dof].tolist() for dof, name in enumerate(("p", "v2", "v3", "t", "m2", "m3"))})
+
+    uz = displacements[:, 2]
+    return {
+        "deformations": dict(zip(node_names, uz.tolist(), strict=True)),
+        "max_defo": float(uz[loaded_rows].min()),
+        "joint_displacements": joint_displacements,
+        "reactions": reactions,
+        "frame_forces": frame_forces,
+    }
@@ -0,0 +1,229 @@
+"""
+Batched triangle meshes written as a single binary glTF 2.0 (GLB) file.
+
+Every mesh group holds the vertex positions, per-vertex RGBA colors and triangle indices of many parts, built with
+numpy in one pass, and becomes one mesh of a few primitives with 16-bit indices. The IDs of the parts are kept in the
+extras of the primitives. Coordinates are written as given:
+mm with Z up, like the geometry VIKTOR exports for its own primitives.
+"""
+
+import json
+import struct
+
+import numpy as np
+
+from app.frame_solver import rotation_matrices
+
+GLB_MAGIC = 0x46546C67
+JSON_CHUNK = 0x4E4F534A
+BIN_CHUNK = 0x004E4942
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+FLOAT = 5126
+UNSIGNED_BYTE = 5121
+UNSIGNED_SHORT = 5123
+
+# Corners of a unit square section in the local (y, z) axes, and the triangles of the four side faces of a
+# prism between two such sections. Vertex k of the start section is k, of the end section 4 + k
+_SQUARE = np.array([(-0.5, -0.5), (0.5, -0.5), (0.5, 0.5), (-0.5, 0.5)])
+_SIDES = np.array([(k, (k + 1) % 4, 4 + (k + 1) % 4, k, 4 + (k + 1) % 4, 4 + k) for k in range(4)]).ravel()
+_CAPS = np.array([0, 2, 1, 0, 3, 2, 4, 5, 6, 4, 6, 7])
+# Square pyramid: base corners 0-3 and apex 4
+_PYRAMID = np.array([0, 1, 4, 1, 2, 4, 2, 3, 4, 3, 0, 4, 0, 2, 1, 0, 3, 2])
+
+
+def _repeat_indices(pattern: np.ndarray, n_parts: int, vertices_per_part: int) -> np.ndarray:
+    return (pattern[None, :] + vertices_per_part * np.arange(n_parts)[:, None]).ravel()
+
+
+def prisms(starts: np.ndarray, ends: np.ndarray, sizes, caps: bool = False) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Square prisms along the (M, 3) start to end segments, with (M,) or scalar section sizes.
+    Local axes follow the frame solver: the section is aligned with global Z unless the segment is vertical.
+    Without caps the prisms are open tubes, 8 vertices and 8 triangles each.
+    """
+    coords = np.concatenate([starts, ends])
+    connectivity = np.column_stack([np.arange(len(starts)), len(starts) + np.arange(len(starts))])
+    rotation, _ = rotation_matrices(coords, connectivity)
+    sizes = np.broadcast_to(np.asarray(sizes, dtype=float), len(starts))
+    # (M, 4, 3) corner offsets from the segment ends
+    offsets = sizes[:, None, None] * (
+        _SQUARE[None, :, 0, None] * rotation[:, None, 1] + _SQUARE[None, :, 1, None] * rotation[:, None, 2]
+    )
+    positions = np.concatenate([starts[:, None] + offsets, ends[:, None] + offsets], axis=1).reshape(-1, 3)
+    pattern = np.concatenate([_SIDES, _CAPS]) if caps else _SIDES
+    return positions, _repeat_indices(pattern, len(starts), 8)
+
+
+def cubes(centers: np.ndarray, size: float) -> tuple[np.ndarray, np.ndarray]:
+    """Axis aligned cubes with edge size around the (N, 3) centers"""
+    half = np.array([0, 0, size / 2])
+    return prisms(centers - half, centers + half, size, caps=True)
+
+
+def arrows(tips: np.ndarray, direction, length: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Arrows pointing in direction with their tip at the (N, 3) tips: a square pyramid head of half the length and
+    a shaft of the other half, like create_load_arrow. 13 vertices per arrow.
+    """
+    direction = np.asarray(direction, dtype=float) / np.linalg.norm(direction)
+    head_bases = tips - 0.5 * length * direction
+    # The section axes of the head are taken from its shaft
+    rotation, _ = rotation_matrices(np.array([[0.0, 0.0, 0.0], direction]), np.array([[0, 1]]))
+    corners = 0.5 * length / 1.5 * (_SQUARE[:, 0, None] * rotation[0, 1] + _SQUARE[:, 1, None] * rotation[0, 2])
+    head_positions = np.concatenate([head_bases[:, None] + corners, tips[:, None]], axis=1)
+    shaft_positions, _ = prisms(tips - length * direction, head_bases, 0.5 * length / 7)
+    positions = np.concatenate([head_positions, shaft_positions.reshape(-1, 8, 3)], axis=1).reshape(-1, 3)
+    pattern = np.concatenate([_PYRAMID, 5 + _SIDES, 5 + _CAPS])
+    return positions, _repeat_indices(pattern, len(tips), 13)
+
+
+class MeshGroup:
+    def __init__(self, name: str, opacity: float = 1.0) -> None:
+        """Parts that become a single glTF mesh, sharing one material with the given opacity"""
+        self.name = name
+        self.opacity = opacity
+        self._batches = []
+
+    def add(self, positions: np.ndarray, indices: np.ndarray, colors, vertices_per_part: int, ids=None) -> None:
+        """
+        Adds a batch of parts with vertices_per_part consecutive vertices each, and their triangles in the same order.
+        colors is one RGB(A) tuple, one row per part or one row per vertex, as 0-255 integers.
+        ids is an optional identifier per part, e.g. the member IDs.
+        """
+        colors = np.atleast_2d(np.asarray(colors, dtype=np.uint8))
+        if colors.shape[1] == 3:
+            colors = np.column_stack([colors, np.full(len(colors), 255, dtype=np.uint8)])
+        if len(colors) == 1:
+            colors = np.broadcast_to(colors, (len(positions), 4))
+        elif len(colors) != len(positions):
+            colors = np.repeat(colors, vertices_per_part, axis=0)
+        if len(positions):
+            ids = None if ids is None else np.asarray(ids).tolist()
+            self._batches.append((np.asarray(positions, dtype=np.float32), np.asarray(indices), colors, vertices_per_part, ids))
+
+    def primitives(self, max_vertices: int = 2**16) -> list[tuple[np.ndarray, np.ndarray, np.ndarray, list[dict]]]:
+        """
+        Positions, colors and uint16 triangle indices of one or more primitives, split at part boundaries so that no
+        primitive has more than max_vertices vertices, and the {"first_vertex", "vertices_per_part", "ids"} of the
+        batches with IDs in each primitive.
+        """
+        chunks, current, n_current = [], [], 0
+        for positions, indices, colors, per_part, ids in self._batches:
+            n_parts = len(positions) // per_part
+            indices_per_part = len(indices) // n_parts
+            parts_per_piece = max_vertices // per_part
+            for first in range(0, n_parts, parts_per_piece):
+                last = min(first + parts_per_piece, n_parts)
+                if n_current + (last - first) * per_part > max_vertices:
+                    chunks.append(current)
+                    current, n_current = [], 0
+                vertices = slice(first * per_part, last * per_part)
+                piece_indices = indices[first * indices_per_part : last * indices_per_part] - first * per_part + n_current
+                part_ids = None if ids is None else {"first_vertex": n_current, "vertices_per_part": per_part, "ids": ids[first:last]}
+                current.append((positions[vertices], colors[vertices], piece_indices, part_ids))
+                n_current += (last - first) * per_part
+        if current:
+            chunks.append(current)
+        return [
+            (
+                np.concatenate([piece[0] for piece in chunk]),
+                np.ascontiguousarray(np.concatenate([piece[1] for piece in chunk])),
+                np.concatenate([piece[2] for piece in chunk]).astype(np.uint16),
+                [piece[3] for piece in chunk if piece[3] is not None],
+            )
+            for chunk in chunks
+        ]
+
+
+def to_glb(groups: list[MeshGroup]) -> bytes:
+    """Binary glTF with one mesh per non-empty group, all in one buffer"""
+    document = {
+        "asset": {"version": "2.0", "generator": "etabs-truss-parametrisation"},
+        "scene": 0,
+        "scenes": [{"nodes": []}],
+        "nodes": [],
+        "meshes": [],
+        "materials": [],
+        "accessors": [],
+        "bufferViews": [],
+    }
+    binary = bytearray()
+
+    def add_view(data: np.ndarray, target: int) -> int:
+        # Every buffer view starts 4-byte aligned
+        binary.extend(b"\x00" * (-len(binary) % 4))
+        document["bufferViews"].append({"buffer": 0, "byteOffset": len(binary), "byteLength": data.nbytes, "target": target})
+        binary.extend(data.tobytes())
+        return len(document["bufferViews"]) - 1
+
+    def add_accessor(accessor: dict) -> int:
+        document["accessors"].append(accessor)
+        return len(document["accessors"]) - 1
+
+    for group in groups:
+        primitives = []
+        for positions, colors, indices, parts in group.primitives():
+            position_accessor = add_accessor(
+                {
+                    "bufferView": add_view(positions, ARRAY_BUFFER),
+                    "componentType": FLOAT,
+                    "count": len(positions),
+                    "type": "VEC3",
+                    "min": positions.min(axis=0).tolist(),
+                    "max": positions.max(axis=0).tolist(),
+                }
+            )
+            color_accessor = add_accessor(
+                {
+                    "bufferView": add_view(colors, ARRAY_BUFFER),
+                    "componentType": UNSIGNED_BYTE,
+                    "normalized": True,
+                    "count": len(colors),
+                    "type": "VEC4",
+                }
+            )
+            index_accessor = add_accessor(
+                {
+                    "bufferView": add_view(indices, ELEMENT_ARRAY_BUFFER),
+                    "componentType": UNSIGNED_SHORT,
+                    "count": len(indices),
+                    "type": "SCALAR",
+                }
+            )
+            primitive = {
+                "attributes": {"POSITION": position_accessor, "COLOR_0": color_accessor},
+                "indices": index_accessor,
+                "mode": 4,
+                "material": len(document["materials"]),
+            }
+            if parts:
+                primitive["extras"] = {"parts": parts}
+            primitives.append(primitive)
+        if not primitives:
+            continue
+        material = {
+            "pbrMetallicRoughness": {"baseColorFactor": [1.0, 1.0, 1.0, group.opacity], "metallicFactor": 0.5, "roughnessFactor": 1.0},
+            "doubleSided": True,
+        }
+        if group.opacity < 1:
+            material["alphaMode"] = "BLEND"
+        document["materials"].append(material)
+        document["meshes"].append({"name": group.name, "primitives": primitives})
+        document["nodes"].append({"mesh": len(document["meshes"]) - 1, "name": group.name})
+        document["scenes"][0]["nodes"].append(len(document["nodes"]) - 1)
+
+    binary.extend(b"\x00" * (-len(binary) % 4))
+    if binary:
+        document["buffers"] = [{"byteLength": len(binary)}]
+    else:
+        document["scenes"] = [{}]
+    # glTF does not allow empty top level arrays
+    document = {key: value for key, value in document.items() if value != []}
+    json_chunk = json.dumps(document, separators=(",", ":")).encode("utf8")
+    json_chunk += b" " * (-len(json_chunk) % 4)
+    chunks = [struct.pack("<II", len(json_chunk), JSON_CHUNK), json_chunk]
+    if binary:
+        chunks += [struct.pack("<II", len(binary), BIN_CHUNK), bytes(binary)]
+    length = 12 + sum(len(chunk) for chunk in chunks)
+    return b"".join([struct.pack("<III", GLB_MAGIC, 2, length), *chunks])
@@ -1,7 +1,22 @@
+import math
+from functools import cache
+
+import numpy as np
 import plotly.graph_objects as go
 from plotly.colors import sequential
-from pathlib import Path
+from scipy.stats import norm
+
+from app.cache import LRUCache, canonical_hash
+from app.visualization import sections_db
 COLUMN_HEIGHT = 6000
+# Surrogate prescreening: design parameters it regresses on, analyses per round, rounds, and the number of standard
+# deviations every predicted displacement must be away from the allowable one before the search stops
+SURROGATE_FEATURES = ("joist_value", "truss_depth_value", "x_bay_width", "y_bay_width", "area_load")
+SURROGATE_BATCH = 4
+SURROGATE_MAX_ROUNDS = 10
+SURROGATE_CONFIDENCE = 2.0
+# PNG charts of optimization results
+CHART_CACHE = LRUCache(maxsize=32, max_weight=32 * 2**20, weigher=len)
 
 def calculate_variants(params, **kwargs):
     # Calculate the number of variants for JST
@@ -29,35 +44,228 @@ def generate_variants(params, **kwargs):
     variants = []
     for joist_value in joist_values:
         for truss_depth_value in truss_values:
-            variant_params = {
-                "truss_depth_value": truss_depth_value,
-                "joist_value": joist_value + 1,
-                "x_bay_width": params.step_1.x_bay_width,
-                "y_bay_width": params.step_1.y_bay_width,
-                "columns_height":COLUMN_HEIGHT,
-                "joist_n_diags": params.step_1.joist_n_diags,
-                "area_load": params.step_1.area_load,
-            }
-            variants.append(variant_params)
+            variants.append(variant_params(params, joist_value, truss_depth_value))
 
     return variants
 
 
-def plot_displacement_vs_truss_depth(model_data, results_data, allowable_displacement):
-    # Organize data by joist_number
-    data_by_joist = {}
-    for model, result in zip(model_data, results_data, strict=True):
-        joist_number = model["joist_value"] - 1  # Adjust joist_value to joist_number
-        truss_depth = model["truss_depth_value"]
-        max_defo = abs(result["max_defo"])  # Use absolute value
+def variant_params(params, joist_value, truss_depth_value):
+    return {
+        "truss_depth_value": truss_depth_value,
+        "joist_value": joist_value + 1,
+        "x_bay_width": params.step_1.x_bay_width,
+        "y_bay_width": params.step_1.y_bay_width,
+        "columns_height":COLUMN_HEIGHT,
+        "joist_n_diags": params.step_1.joist_n_diags,
+        "area_load": params.step_1.area_load,
+    }
+
+
+def search_min_feasible_depth(joist_values, min_depth, max_depth, allowable, tolerance, evaluate):
+    """
+    Shallowest truss depth whose displacement is within allowable, for each joist value. Assumes the displacement
+    decreases with depth, brackets it between min_depth and max_depth and narrows the bracket with secant steps on a
+    log-log scale (Illinois variant of regula falsi). All joist values advance together, so every round is a single
+    call of evaluate.
+
+    Args:
+        evaluate: Takes a list of (joist_value, depth) probes and returns their absolute displacements in order.
+
+    Returns:
+        tuple: joist_value to its minimum feasible depth (None if max_depth is not feasible either),
+        and the list of all probes as (joist_value, depth, displacement)
+    """
+    probed = []
+
+    def run_round(probes):
+        displacements = evaluate(probes) if probes else []
+        probed.extend((joist, depth, displacement) for (joist, depth), displacement in zip(probes, displacements, strict=True))
+        return displacements
+
+    depths = [min_depth] if min_depth == max_depth else [min_depth, max_depth]
+    displacements = iter(run_round([(joist, depth) for joist in joist_values for depth in depths]))
+    optimum = {}
+    brackets = {}
+    for joist in joist_values:
+        d_min = next(displacements)
+        d_max = next(displacements) if len(depths) == 2 else d_min
+        if d_min <= allowable:
+            optimum[joist] = min_depth
+        elif d_max > allowable:
+            optimum[joist] = None
+        else:
+            brackets[joist] = {"lo": min_depth, "d_lo": d_min, "hi": max_depth, "d_hi": d_max, "moved": None}
+
+    while brackets:
+        probes = []
+        for joist, bracket in list(brackets.items()):
+            width = bracket["hi"] - bracket["lo"]
+            if width <= max(tolerance, 1):
+                optimum[joist] = bracket["hi"]
+                del brackets[joist]
+                continue
+            if min(bracket["lo"], bracket["d_hi"]) > 0:
+                # Displacement follows roughly a power of the depth, so the secant is taken on a log-log scale
+                fraction = math.log(bracket["d_lo"] / allowable) / math.log(bracket["d_lo"] / bracket["d_hi"])
+                depth = bracket["lo"] * (bracket["hi"] / bracket["lo"]) ** fraction
+            else:
+                depth = bracket["lo"] + width / 2
+            probes.append((joist, min(max(round(depth), bracket["lo"] + 1), bracket["hi"] - 1)))
+
+        for (joist, depth), displacement in zip(probes, run_round(probes), strict=True):
+            bracket = brackets[joist]
+            side = "hi" if displacement <= allowable else "lo"
+            if side == bracket["moved"]:
+                # Illinois step: the other end went stale, halve its log distance to allowable so the secant moves past it
+                stale = "lo" if side == "hi" else "hi"
+                bracket[f"d_{stale}"] = (bracket[f"d_{stale}"] * allowable) ** 0.5
+            bracket[side], bracket[f"d_{side}"], bracket["moved"] = depth, displacement, side
+
+    return optimum, probed
+
+
+def surrogate_features(variants):
+    # Displacement follows roughly a power law of each parameter, so features and target are on a log scale
+    return np.log([[float(variant[name]) for name in SURROGATE_FEATURES] for variant in variants])
+
+
+class GaussianProcess:
+    def __init__(self, length_scales=(0.25, 0.5, 1.0, 2.0, 4.0), noise=1e-6):
+        """
+        Gaussian-process regression with a squared exponential kernel on standardized inputs and target.
+        The length scale is picked from length_scales by the marginal likelihood when fitting.
+        """
+        self.length_scales = length_scales
+        self.noise = noise
+
+    def _kernel(self, a, b):
+        squared_distance = ((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=2)
+        return np.exp(-0.5 * squared_distance / self.length_scale**2)
+
+    def fit(self, X, y):
+        self.x_mean = X.mean(axis=0)
+        self.x_scale = np.where(X.std(axis=0) > 0, X.std(axis=0), 1)
+        self.y_mean = y.mean()
+        self.y_scale = y.std() or 1
+        self.X = (X - self.x_mean) / self.x_scale
+        target = (y - self.y_mean) / self.y_scale
+
+        best = None
+        for length_scale in self.length_scales:
+            self.length_scale = length_scale
+            cholesky = np.linalg.cholesky(self._kernel(self.X, self.X) + self.noise * np.eye(len(self.X)))
+            alpha = np.linalg.solve(cholesky.T, np.linalg.solve(cholesky, target))
+            log_likelihood = -0.5 * target @ alpha - np.log(np.diag(cholesky)).sum()
+            if best is None or log_likelihood > best[0]:
+                best = (log_likelihood, length_scale, cholesky, alpha)
+        _, self.length_scale, self.cholesky, self.alpha = best
+        return self
+
+    def predict(self, X):
+        """Mean and standard deviation of the target at X"""
+        cross = self._kernel((X - self.x_mean) / self.x_scale, self.X)
+        mean = cross @ self.alpha
+        v = np.linalg.solve(self.cholesky, cross.T)
+        variance = np.clip(1 - (v**2).sum(axis=0), 0, None)
+        return self.y_mean + self.y_scale * mean, self.y_scale * np.sqrt(variance)
+
+
+def expected_feasibility(mean, std, threshold):
+    """
+    Expected feasibility function (Bichon et al. 2008): the expected improvement analogue for locating where the
+    prediction crosses threshold. Large for points predicted near the threshold or with a large uncertainty.
+    """
+    std = np.maximum(std, 1e-12)
+    epsilon = 2 * std
+    t0, t_minus, t_plus = (threshold - mean) / std, (threshold - epsilon - mean) / std, (threshold + epsilon - mean) / std
+    return (
+        (mean - threshold) * (2 * norm.cdf(t0) - norm.cdf(t_minus) - norm.cdf(t_plus))
+        - std * (2 * norm.pdf(t0) - norm.pdf(t_minus) - norm.pdf(t_plus))
+        + epsilon * (norm.cdf(t_plus) - norm.cdf(t_minus))
+    )
+
+
+def seed_indices(variants):
+    """Variants at the lowest, middle and highest joist value and truss depth, the first analyses of the surrogate"""
+    index_of = {(variant["joist_value"], variant["truss_depth_value"]): index for index, variant in enumerate(variants)}
+    seeds = []
+    for name in ("joist_value", "truss_depth_value"):
+        values = sorted({variant[name] for variant in variants})
+        seeds.append({values[0], values[len(values) // 2], values[-1]})
+    return sorted({index_of[key] for key in ((joist, depth) for joist in seeds[0] for depth in seeds[1]) if key in index_of})
+
+
+def surrogate_screen(
+    variants,
+    allowable,
+    evaluate,
+    known=None,
+    batch_size=SURROGATE_BATCH,
+    max_rounds=SURROGATE_MAX_ROUNDS,
+    confidence=SURROGATE_CONFIDENCE,
+):
+    """
+    Analyzes only the variants a Gaussian-process surrogate cannot classify as within or beyond the allowable
+    displacement. Starts from the known displacements, adding the analyses of seed_indices if there are fewer known
+    than seeds, refits after each round and picks the next batch by expected feasibility. Stops when every remaining
+    variant is predicted at least confidence standard deviations from allowable, or after max_rounds.
+
+    Args:
+        evaluate: Takes a list of variants and returns their absolute displacements in order.
+        known: Optional variant index to its displacement from earlier analyses, e.g. in the result store.
 
-        if joist_number not in data_by_joist:
-            data_by_joist[joist_number] = {"truss_depth": [], "displacement": []}
-        data_by_joist[joist_number]["truss_depth"].append(truss_depth)
-        data_by_joist[joist_number]["displacement"].append(max_defo)
+    Returns:
+        tuple: variant index to its analyzed or known displacement, variant index to its predicted displacement for
+        the variants the surrogate classifies, and the same for the variants it still could not classify when
+        max_rounds ran out
+    """
+    if allowable <= 0:
+        raise ValueError("The allowable displacement must be positive")
+    X = surrogate_features(variants)
+    threshold = math.log(allowable)
+    analyzed = dict(known or {})
+    seeds = seed_indices(variants)
+    batch = [] if len(analyzed) >= len(seeds) else [index for index in seeds if index not in analyzed]
+    predicted, unclassified = {}, {}
+    for _ in range(max_rounds):
+        if batch:
+            analyzed.update(zip(batch, evaluate([variants[index] for index in batch]), strict=True))
+        pending = [index for index in range(len(variants)) if index not in analyzed]
+        predicted, unclassified = {}, {}
+        if not pending:
+            break
+        indices = list(analyzed)
+        displacements = np.maximum([analyzed[index] for index in indices], 1e-12)
+        mean, std = GaussianProcess().fit(X[indices], np.log(displacements)).predict(X[pending])
+        uncertain = np.abs(mean - threshold) < confidence * std
+        for index, value, flag in zip(pending, np.exp(mean).tolist(), uncertain.tolist(), strict=True):
+            (unclassified if flag else predicted)[index] = value
+        if not unclassified:
+            break
+        ranking = np.argsort(-expected_feasibility(mean, std, threshold), kind="stable")
+        batch = [pending[position] for position in ranking[:batch_size]]
+    return analyzed, predicted, unclassified
+
+
+def group_points(model_data, results_data, statuses):
+    """
+    Chart points grouped by joist number in one sort: the unique joist numbers, the start of each group and the
+    truss depths, displacements and statuses ordered by joist number and then truss depth
+    """
+    joist_numbers = np.array([model["joist_value"] - 1 for model in model_data])  # Adjust joist_value to joist_number
+    truss_depths = np.array([model["truss_depth_value"] for model in model_data], dtype=float)
+    displacements = np.abs([result["max_defo"] for result in results_data])  # Use absolute value
+    order = np.lexsort((truss_depths, joist_numbers))
+    groups, starts = np.unique(joist_numbers[order], return_index=True)
+    return groups, starts, truss_depths[order], displacements[order], np.asarray(statuses)[order]
+
+
+def displacement_chart(model_data, results_data, allowable_displacement, statuses=None) -> go.Figure:
+    statuses = statuses or ["Analyzed"] * len(model_data)
+    joist_numbers, starts, truss_depths, displacements, statuses = group_points(model_data, results_data, statuses)
 
     # Get shades of blue for each joist_number
-    num_joists = len(data_by_joist)
+    num_joists = len(joist_numbers)
     blues_scale = sequential.Blues[2:]  # Exclude the lightest shades for better distinction
 
     # Ensure we have enough colors
@@ -65,47 +273,42 @@ def plot_displacement_vs_truss_depth(model_data, results_data, allowable_displac
         # If there are more joist_numbers than colors in the scale, interpolate colors
         from plotly.colors import sample_colorscale
 
-        blues_scale = [sample_colorscale("Blues", i / (num_joists - 1)) for i in range(num_joists)]
+        blues_scale = sample_colorscale("Blues", [i / (num_joists - 1) for i in range(num_joists)])
     else:
         blues_scale = blues_scale[-num_joists:]  # Take the darkest 'num_joists' shades
 
-    line_colors = {}
-    for idx, joist_number in enumerate(sorted(data_by_joist.keys())):
-        line_colors[joist_number] = blues_scale[idx]
-
     # Initialize figure
     fig = go.Figure()
 
-    # Collect all truss_depths for min_x and max_x
-    all_truss_depths = []
-    for data in data_by_joist.values():
-        all_truss_depths.extend(data["truss_depth"])
-    min_x = min(all_truss_depths)
-    max_x = max(all_truss_depths)
-
-    # Add traces for each joist_number
-    for joist_number in sorted(data_by_joist.keys()):
-        truss_depths = data_by_joist[joist_number]["truss_depth"]
-        displacements = data_by_joist[joist_number]["displacement"]
-        # Sort the data by truss_depths to make the lines look smooth
-        sorted_pairs = sorted(zip(truss_depths, displacements, strict=True))
-        truss_depths_sorted, displacements_sorted = zip(*sorted_pairs, strict=True)
+    # Add traces for each joist_number, sorted by truss depth to make the lines look smooth
+    groups = zip(
+        np.split(truss_depths, starts[1:]), np.split(displacements, starts[1:]), np.split(statuses, starts[1:]), strict=True
+    )
+    for joist_number, color, (depths, displacement, status) in zip(joist_numbers, blues_scale, groups, strict=True):
         # Determine marker colors based on allowable_displacement
-        marker_colors = ["red" if disp > allowable_displacement else "green" for disp in displacements_sorted]
+        marker_colors = np.where(displacement > allowable_displacement, "red", "green")
+        # Open markers for surrogate predictions that were not analyzed, diamonds for those it could not classify
+        # and large stars for the minimum feasible depths of the adaptive search
+        marker_symbols = np.select(
+            [status == "Predicted", status == "Uncertain", status == "Minimum feasible"],
+            ["circle-open", "diamond-open", "star"],
+            "circle",
+        )
+        marker_sizes = np.where(status == "Minimum feasible", 14, 6)
         trace = go.Scatter(
-            x=truss_depths_sorted,
-            y=displacements_sorted,
+            x=depths,
+            y=displacement,
             mode="lines+markers",
             name=f"Joist Number {joist_number}",
-            line=dict(color=line_colors[joist_number]),
-            marker=dict(color=marker_colors),
+            line=dict(color=color),
+            marker=dict(color=marker_colors, symbol=marker_symbols, size=marker_sizes),
         )
         fig.add_trace(trace)
 
     # Add horizontal line for allowable_displacement
     fig.add_trace(
         go.Scatter(
-            x=[min_x, max_x],
+            x=[truss_depths.min(), truss_depths.max()],
             y=[allowable_displacement, allowable_displacement],
             mode="lines",
             line=dict(color="red", dash="dash"),
@@ -128,11 +331,39 @@ def plot_displacement_vs_truss_depth(model_data, results_data, allowable_displac
             bordercolor="rgba(0,0,0,0)",
         ),
     )
-    file_path = Path.cwd() / "app" / "result.png"
-    file_path.parent.mkdir(parents=True, exist_ok=True)
-    fig.write_image(str(file_path), format="png")
+    return fig
+
+
+@cache
+def start_renderer() -> None:
+    """
+    Keeps one kaleido process for all charts of this worker. kaleido 0.2 already keeps the process plotly starts on
+    the first export; kaleido 1 starts a new browser per export unless its sync server runs.
+    """
+    import kaleido
+
+    if hasattr(kaleido, "start_sync_server"):
+        kaleido.start_sync_server(silence_warnings=True)
+
+
+def plot_displacement_vs_truss_depth(model_data, results_data, allowable_displacement, statuses=None) -> bytes:
+    """
+    PNG of displacement_chart, rendered in memory so concurrent optimizations do not share a file.
+    Charts are cached by their points and allowable displacement.
+    """
+    statuses = statuses or ["Analyzed"] * len(model_data)
+    points = [
+        (model["joist_value"], model["truss_depth_value"], abs(result["max_defo"]), status)
+        for model, result, status in zip(model_data, results_data, statuses, strict=True)
+    ]
+    key = canonical_hash({"points": points, "allowable": allowable_displacement})
+
+    def render() -> bytes:
+        start_renderer()
+        fig = displacement_chart(model_data, results_data, allowable_displacement, statuses)
+        return fig.to_image(format="png")
 
-    return file_path
+    return CHART_CACHE.get_or_compute(key, render)
 
 def mass_co2_from_model(lines: dict, nodes: dict, sections_db: dict, section_name: str, co2_factor: float = 1.85):
     weight_per_meter = sections_db[section_name]["weight/m"]
@@ -153,4 +384,85 @@ def mass_co2_from_model(lines: dict, nodes: dict, sections_db: dict, section_nam
 
     total_co2_emission = total_mass * co2_factor
 
-    return total_mass, element_count, total_co2_emission
\ No newline at end of file
+    return total_mass, element_count, total_co2_emission
+
+
+def truss_takeoff(width, n_diagonals, depth):
+    """
+    Member count and total length of a Truss: 2n chord panels of width / n, n diagonals and n + 1 verticals.
+    Arguments broadcast as numpy arrays.
+    """
+    n_diagonals = np.asarray(n_diagonals)
+    panel = np.asarray(width) / n_diagonals
+    length = 2 * np.asarray(width) + n_diagonals * np.hypot(panel, depth) + (n_diagonals + 1) * np.asarray(depth)
+    return 4 * n_diagonals + 1, length
+
+
+def _per_component(value, component):
+    return value[component] if isinstance(value, dict) else value
+
+
+def batch_takeoff(
+    truss_depth,
+    x_bay_width,
+    y_bay_width,
+    n_diagonals,
+    joist_n_diags,
+    columns_height=COLUMN_HEIGHT,
+    weight_per_meter=1.0,
+    co2_factor=1.85,
+):
+    """
+    Mass, member count and CO2 of whole variant grids without generating geometry, the closed form of
+    mass_co2_from_model for the model of structure.generate_model. Geometry arguments broadcast as numpy arrays.
+    Two trusses span x with n_diagonals, two span y with joist_n_diags, n_diagonals - 1 joists span y,
+    and the four columns are split in two at the bottom chord.
+
+    Args:
+        weight_per_meter: kg/m, a number or a dict with a value per component ("Truss", "Column", "Joist").
+        co2_factor: kg CO2 per kg steel, a number or a dict with a value per component.
+
+    Returns:
+        tuple: total mass [kg], member count and total CO2 emission [kg] as arrays
+    """
+    x_members, x_length = truss_takeoff(x_bay_width, n_diagonals, truss_depth)
+    y_members, y_length = truss_takeoff(y_bay_width, joist_n_diags, truss_depth)
+    n_joists = np.asarray(n_diagonals) - 1
+    components = {
+        "Truss": (2 * (x_members + y_members), 2 * (x_length + y_length)),
+        "Column": (np.full(np.shape(columns_height), 8), 4 * np.asarray(columns_height, dtype=float)),
+        "Joist": (n_joists * y_members, n_joists * y_length),
+    }
+    total_mass, element_count, total_co2_emission = 0, 0, 0
+    for component, (members, length) in components.items():
+        mass = length * _per_component(weight_per_meter, component) / 1000  # /1000 to m
+        total_mass = total_mass + mass
+        element_count = element_count + members
+        total_co2_emission = total_co2_emission + mass * _per_component(co2_factor, component)
+    # The member count does not depend on the depth or spans, broadcast it to the shape of the grid
+    total_mass, element_count, total_co2_emission = np.broadcast_arrays(total_mass, element_count, total_co2_emission)
+    return total_mass, element_count, total_co2_emission
+
+
+def variants_co2(variants, weight_per_meter, co2_factor=1.85):
+    """CO2 emission [kg] of every variant dict of generate_variants, in one vectorized pass"""
+    if not variants:
+        return np.zeros(0)
+    columns = {name: np.array([variant[name] for variant in variants], dtype=float) for name in variants[0]}
+    _, _, total_co2_emission = batch_takeoff(
+        columns["truss_depth_value"],
+        columns["x_bay_width"],
+        columns["y_bay_width"],
+        columns["joist_value"],
+        columns["joist_n_diags"],
+        columns["columns_height"],
+        weight_per_meter,
+        co2_factor,
+    )
+    return total_co2_emission
+
+
+def emissions_range(params, **kwargs):
+    # Step 3 preview of the emissions over the variant grid, computed without building any model
+    co2 = variants_co2(generate_variants(params), sections_db[params.step_1.section]["weight/m"])
+    return f"{co2.min():,.0f} - {co2.max():,.0f}" if len(co2) else "-"
@@ -0,0 +1,134 @@
+import json
+import sqlite3
+import tempfile
+import time
+
+from contextlib import closing
+from pathlib import Path
+
+from app.cache import canonical_hash
+
+# Bump when the worker script or the result payload changes, so stored results are no longer used
+RESULT_STORE_VERSION = "5"
+DEFAULT_STORE_PATH = Path(tempfile.gettempdir()) / "etabs_truss_results.sqlite"
+DESIGN_COLUMNS = ("joist_value", "truss_depth_value", "x_bay_width", "y_bay_width", "section_name")
+# Bump when the table layout changes, stores with another layout are emptied when they are opened
+_SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT NOT NULL,
+    version TEXT NOT NULL,
+    joist_value INTEGER,
+    truss_depth_value REAL,
+    x_bay_width REAL,
+    y_bay_width REAL,
+    section_name TEXT,
+    payload TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (key, version)
+);
+CREATE INDEX IF NOT EXISTS results_design ON results (
+    version, section_name, joist_value, truss_depth_value, x_bay_width, y_bay_width
+);
+CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+"""
+
+
+def store_version(solver: str, sections_db: dict) -> str:
+    """Version tag of stored results: changes with the solver, the section database or RESULT_STORE_VERSION"""
+    return f"{solver}:{canonical_hash(sections_db)[:16]}:{RESULT_STORE_VERSION}"
+
+
+def solver_of(version: str) -> str:
+    """Solver part of a store_version tag"""
+    return version.split(":", 1)[0]
+
+
+class ResultStore:
+    def __init__(self, path: Path | None = None, version: str = RESULT_STORE_VERSION, max_bytes: int = 512 * 2**20) -> None:
+        """
+        Analysis results on disk, keyed on the canonical hash of the model dict sent to the worker and the version.
+        Only entries of this version are read. Entries of the same solver with another version can no longer be used
+        and are dropped when the store is opened; those of other solvers are kept until they are evicted.
+        """
+        self.path = Path(path or DEFAULT_STORE_PATH)
+        self.version = version
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            if connection.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+                connection.executescript(f"DROP TABLE IF EXISTS results; PRAGMA user_version = {_SCHEMA_VERSION};")
+            connection.executescript(_SCHEMA)
+            versions = [row[0] for row in connection.execute("SELECT DISTINCT version FROM results")]
+            outdated = [
+                (version,) for version in versions if version != self.version and solver_of(version) == solver_of(self.version)
+            ]
+            connection.executemany("DELETE FROM results WHERE version = ?", outdated)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def model_key(model: dict) -> str:
+        return canonical_hash(model)
+
+    def get_many(self, keys: list[str]) -> dict[str, dict]:
+        unique_keys = list(dict.fromkeys(keys))
+        found = {}
+        with closing(self._connect()) as connection, connection:
+            # Stay below the SQLite limit on bound parameters
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = connection.execute(
+                    f"SELECT key, payload FROM results WHERE version = ? AND key IN ({placeholders})", (self.version, *chunk)
+                ).fetchall()
+                found.update((key, json.loads(payload)) for key, payload in rows)
+            connection.executemany(
+                "UPDATE results SET last_used = ? WHERE key = ? AND version = ?", [(time.time(), key, self.version) for key in found]
+            )
+        return found
+
+    def put_many(self, keys: list[str], results: list[dict], designs: list[dict | None] | None = None) -> None:
+        designs = designs or [None] * len(keys)
+        rows = []
+        for key, result, design in zip(keys, results, designs, strict=True):
+            payload = json.dumps(result)
+            design = design or {}
+            rows.append((key, self.version, *(design.get(column) for column in DESIGN_COLUMNS), payload, len(payload), time.time()))
+        with closing(self._connect()) as connection, connection:
+            connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._evict(connection)
+
+    def find(self, **design) -> list[dict]:
+        """Stored results matching the given design parameters, e.g. find(joist_value=7, section_name="SHS50X3")"""
+        unknown = set(design) - set(DESIGN_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown design parameters: {sorted(unknown)}")
+        conditions = "".join(f" AND {column} = ?" for column in design)
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                f"SELECT {', '.join(DESIGN_COLUMNS)}, payload FROM results WHERE version = ?{conditions}",
+                (self.version, *design.values()),
+            ).fetchall()
+        return [{"design": dict(zip(DESIGN_COLUMNS, row[:-1], strict=True)), "result": json.loads(row[-1])} for row in rows]
+
+    def size(self) -> int:
+        with closing(self._connect()) as connection:
+            return connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        """Deletes the least recently used entries until the payloads fit in max_bytes"""
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        stale = []
+        for key, version, size in connection.execute("SELECT key, version, size FROM results ORDER BY last_used"):
+            if total - freed <= self.max_bytes:
+                break
+            stale.append((key, version))
+            freed += size
+        connection.executemany("DELETE FROM results WHERE key = ? AND version = ?", stale)
@@ -1,11 +1,41 @@
-import comtypes.client
-import pythoncom
+import hashlib
 import json
+import math
+import multiprocessing
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.util import Finalize
 from pathlib import Path
-import json
+
+# Binary exchange format, shipped next to this script. It needs numpy, inputs.json works without it
+try:
+    from app import exchange
+except ImportError:
+    try:
+        import exchange
+    except ImportError:
+        exchange = None
+# Timing spans, shipped next to this script as well
+try:
+    from app import timing
+except ImportError:
+    import timing
+
+LOAD_PATTERN_NAME = "MyLoadPattern"
+# host:port of a running etabs_server.py; jobs are forwarded to it instead of starting ETABS
+ETABS_SERVER_ADDRESS = os.environ.get("ETABS_SERVER_ADDRESS", "")
+# ETABS instances analyzing the models of one job side by side, each in a process of its own
+ETABS_INSTANCES = int(os.environ.get("ETABS_INSTANCES", 1))
 
 
 def start_etabs():
+    """Starts ETABS through COM with a new blank model, returns (SapModel, application)"""
+    # Imported here so the worker functions can run with app.fake_etabs where there is no COM
+    import comtypes.client
+    import pythoncom
+
     program_path = r"C:\Program Files\Computers and Structures\ETABS 22\ETABS.exe"
     pythoncom.CoInitialize()
     helper = comtypes.client.CreateObject("ETABSv1.Helper")
@@ -19,9 +49,14 @@ def start_etabs():
 
 
 def create_etabs_model(EtabsObject, data: dict):
+    with timing.span("create_model"):
+        define_etabs_model(EtabsObject, data)
+    return analyze_etabs_model(EtabsObject, data)
+
+
+def define_etabs_model(EtabsObject, data: dict) -> None:
     nodes = data["nodes"]
     lines = data["lines"]
-    nodes_with_load = data["nodes_with_load"]
     section_name = data["section_name"]
     cross_section = data["section_props"]
 
@@ -50,63 +85,424 @@ def create_etabs_model(EtabsObject, data: dict):
         point_i = line["nodeI"]
         point_j = line["nodeJ"]
         ret, _ = EtabsObject.FrameObj.AddByPoint(str(point_i), str(point_j), str(id), section_name, "Global")
+    # Optional stiffness factor per line, e.g. for members on a symmetry plane: area, shear, torsion, inertia, mass, weight
+    for id, factor in data.get("frame_modifiers", {}).items():
+        ret = EtabsObject.FrameObj.SetModifiers(str(id), [factor] * 8)
 
-    load_pattern_name = "MyLoadPattern"
-    ret = EtabsObject.LoadPatterns.Add(load_pattern_name, 8, 0)
+    ret = EtabsObject.LoadPatterns.Add(LOAD_PATTERN_NAME, 8, 0)
     EtabsObject.SetPresentUnits(9)
+    set_point_loads(EtabsObject, data)
 
-    load_magnitude = data["load_magnitud"]
-    for node_id in nodes_with_load:
-        node_name = str(node_id)
-        load_values = [0, 0, -load_magnitude, 0, 0, 0]
-        ret = EtabsObject.PointObj.SetLoadForce(node_name, load_pattern_name, load_values, True, "Global")
-
+    # Optional restraints per node, e.g. those of a symmetry plane. Supports are set after them and stay fixed
+    for node_id, restraint in data.get("restraints", {}).items():
+        ret = EtabsObject.PointObj.SetRestraint(str(node_id), [int(value) for value in restraint])
     supports = data["supports"]
     for node_id in supports:
         ret = EtabsObject.PointObj.SetRestraint(str(node_id), [1, 1, 1, 1, 1, 1])
 
-    EtabsObject.View.RefreshView(0, False)
-    file_path = Path.cwd() / "etabsmodel.edb"
-    EtabsObject.File.Save(str(file_path))
-    EtabsObject.Analyze.RunAnalysis()
-    ret = EtabsObject.Analyze.RunAnalysis()
-
-    ret = EtabsObject.Results.Setup.DeselectAllCasesAndCombosForOutput()
-    ret = EtabsObject.Results.Setup.SetCaseSelectedForOutput(load_pattern_name)
-    deformations = {}
-    joist_deformation = []
-    for node_name, vals in nodes.items():
-        node_id = vals["id"]
-        number_results, obj, elm, load_case, step_type, step_num, u1, u2, u3, r1, r2, r3, ret = EtabsObject.Results.JointDispl(
-            Name=node_name,
-            ItemTypeElm=0,
-        )
-        deformations[node_id] = u3[0]
-        if node_id in nodes_with_load:
-            joist_deformation.append(u3[0])
-
-    return {"deformations": deformations, "max_defo": min(joist_deformation)}
-
-
-def run_n_times():
-    result_list = []
-
-    input_json = Path.cwd() / "inputs.json"
-    with open(input_json) as jsonfile:
-        data = json.load(jsonfile)
-
-    EtabsObject, EtabsEngine = start_etabs()
-    for model in data:
-        results = create_etabs_model(EtabsObject, model)
-        result_list.append(results)
-        EtabsObject.InitializeNewModel(9)
-        EtabsObject.File.NewBlank()
-
-    output = Path.cwd() / "output.json"
-    with open(output, "w") as jsonfile:
-        json.dump(result_list, jsonfile)
-
-    ret = EtabsEngine.ApplicationExit(False)
+
+def set_point_loads(EtabsObject, data: dict) -> None:
+    load_magnitude = data["load_magnitud"]
+    load_factors = data.get("load_factors", {})
+    for node_id in data["nodes_with_load"]:
+        node_name = str(node_id)
+        load_values = [0, 0, -load_magnitude * load_factors.get(node_name, 1.0), 0, 0, 0]
+        # Replace any load set by a previous variant
+        ret = EtabsObject.PointObj.SetLoadForce(node_name, LOAD_PATTERN_NAME, load_values, True, "Global")
+
+
+def update_etabs_model(EtabsObject, data: dict, previous: dict) -> None:
+    """Edits an analyzed model with the same topology in place: moves the changed joints and resets changed loads"""
+    EtabsObject.SetModelIsLocked(False)
+    EtabsObject.SetPresentUnits(9)
+    previous_nodes = previous["nodes"]
+    for id, node in data["nodes"].items():
+        old = previous_nodes[id]
+        if (node["x"], node["y"], node["z"]) != (old["x"], old["y"], old["z"]):
+            ret = EtabsObject.EditPoint.ChangeCoordinates_1(str(id), node["x"], node["y"], node["z"], True)
+    if data["load_magnitud"] != previous["load_magnitud"]:
+        set_point_loads(EtabsObject, data)
+
+
+def analyze_etabs_model(EtabsObject, data: dict) -> dict:
+    nodes_with_load = data["nodes_with_load"]
+
+    with timing.span("save_model"):
+        EtabsObject.View.RefreshView(0, False)
+        file_path = Path.cwd() / "etabsmodel.edb"
+        EtabsObject.File.Save(str(file_path))
+    with timing.span("run_analysis"):
+        ret = EtabsObject.Analyze.RunAnalysis()
+
+    with timing.span("extract_results"):
+        ret = EtabsObject.Results.Setup.DeselectAllCasesAndCombosForOutput()
+        ret = EtabsObject.Results.Setup.SetCaseSelectedForOutput(LOAD_PATTERN_NAME)
+        return extract_results(EtabsObject, nodes_with_load)
+
+
+def extract_results(EtabsObject, nodes_with_load: list) -> dict:
+    """
+    Pulls joint displacements, support reactions and frame end forces for every object of the "All" group
+    in one call each, instead of one JointDispl call per joint. Tables are returned as columns.
+    """
+    # Results are requested for a group: eItemTypeElm.GroupElm
+    GROUP_ELM = 2
+    number_results, obj, elm, load_case, step_type, step_num, u1, u2, u3, r1, r2, r3, ret = EtabsObject.Results.JointDispl(
+        "All", GROUP_ELM
+    )
+    joint_displacements = {
+        "joint": list(obj),
+        "u1": list(u1),
+        "u2": list(u2),
+        "u3": list(u3),
+        "r1": list(r1),
+        "r2": list(r2),
+        "r3": list(r3),
+    }
+
+    number_results, obj, elm, load_case, step_type, step_num, f1, f2, f3, m1, m2, m3, ret = EtabsObject.Results.JointReact(
+        "All", GROUP_ELM
+    )
+    reactions = {"joint": list(obj), "f1": list(f1), "f2": list(f2), "f3": list(f3), "m1": list(m1), "m2": list(m2), "m3": list(m3)}
+
+    number_results, obj, obj_sta, elm, elm_sta, load_case, step_type, step_num, p, v2, v3, t, m2, m3, ret = (
+        EtabsObject.Results.FrameForce("All", GROUP_ELM)
+    )
+    frame_forces = end_stations(
+        {
+            "frame": list(obj),
+            "station": list(obj_sta),
+            "p": list(p),
+            "v2": list(v2),
+            "v3": list(v3),
+            "t": list(t),
+            "m2": list(m2),
+            "m3": list(m3),
+        }
+    )
+
+    deformations = dict(zip(joint_displacements["joint"], joint_displacements["u3"], strict=True))
+    max_defo = min(deformations[str(node_id)] for node_id in nodes_with_load)
+    return {
+        "deformations": deformations,
+        "max_defo": max_defo,
+        "joint_displacements": joint_displacements,
+        "reactions": reactions,
+        "frame_forces": frame_forces,
+    }
+
+
+def end_stations(table: dict) -> dict:
+    """Keeps the first and last output station of every frame"""
+    first, last = {}, {}
+    for row, (frame, station) in enumerate(zip(table["frame"], table["station"], strict=True)):
+        if frame not in first or station < table["station"][first[frame]]:
+            first[frame] = row
+        if frame not in last or station > table["station"][last[frame]]:
+            last[frame] = row
+    rows = sorted(set(first.values()) | set(last.values()))
+    return {column: [values[row] for row in rows] for column, values in table.items()}
+
+
+def topology_key(model: dict) -> str:
+    """Everything except coordinates and load magnitude; models with the same key can be edited into each other"""
+    topology = {
+        "nodes": sorted(model["nodes"]),
+        "lines": model["lines"],
+        "nodes_with_load": model["nodes_with_load"],
+        "supports": model["supports"],
+        "section_name": model["section_name"],
+        "section_props": model["section_props"],
+        "restraints": model.get("restraints"),
+        "frame_modifiers": model.get("frame_modifiers"),
+        "load_factors": model.get("load_factors"),
+    }
+    return hashlib.sha256(json.dumps(topology, sort_keys=True).encode("utf8")).hexdigest()
+
+
+def model_hash(model: dict) -> str:
+    """Hash of the model as parsed from inputs.json, matches canonical_hash of the app"""
+    return hashlib.sha256(json.dumps(model, sort_keys=True, separators=(",", ":")).encode("utf8")).hexdigest()
+
+
+def checkpoint_line(index: int, model_hash: str, result: dict) -> str:
+    """
+    output.jsonl line of a finished model. Its timings are left out: they belong to the run that measured them,
+    a resumed run would place them on its own worker track
+    """
+    result = {key: value for key, value in result.items() if key != "timings"}
+    return json.dumps({"index": index, "hash": model_hash, "result": result}) + "\n"
+
+
+def read_checkpoint(checkpoint_path: Path) -> dict[str, dict]:
+    """Results of an earlier partial run by model hash. A line cut off by a crash is ignored"""
+    completed = {}
+    if checkpoint_path.exists():
+        with open(checkpoint_path) as checkpoint:
+            for line in checkpoint:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                completed[entry["hash"]] = entry["result"]
+    return completed
+
+
+def run_models(EtabsObject, models: list[dict], checkpoint_path: Path | None = None) -> list[dict]:
+    """
+    Analyzes the models grouped by topology. Within a group the model is edited in place,
+    a new blank model is only created when the topology changes. Results are in input order.
+
+    Every result is appended to checkpoint_path as soon as it is available, and models already
+    in that file are not analyzed again, so an interrupted batch can be resumed.
+
+    Within a timed request every analyzed result has the spans of its model under "timings".
+    """
+    timer = timing.current_timer()
+    hashes = [model_hash(model) for model in models]
+    completed = read_checkpoint(checkpoint_path) if checkpoint_path else {}
+    keys = [topology_key(model) for model in models]
+    first_seen = {}
+    for index, key in enumerate(keys):
+        first_seen.setdefault(key, index)
+    order = sorted(range(len(models)), key=lambda index: (first_seen[keys[index]], index))
+
+    results = [completed.get(digest) for digest in hashes]
+    checkpoint = open(checkpoint_path, "a") if checkpoint_path else None
+    try:
+        previous_index = None
+        for index in order:
+            if results[index] is not None:
+                continue
+            model = models[index]
+            first_span = len(timer.spans) if timer else 0
+            if previous_index is not None and keys[previous_index] == keys[index]:
+                with timing.span("update_model"):
+                    update_etabs_model(EtabsObject, model, models[previous_index])
+                results[index] = analyze_etabs_model(EtabsObject, model)
+            else:
+                if previous_index is not None:
+                    with timing.span("new_model"):
+                        EtabsObject.InitializeNewModel(9)
+                        EtabsObject.File.NewBlank()
+                results[index] = create_etabs_model(EtabsObject, model)
+            if timer:
+                results[index]["timings"] = [{**entry, "args": {"model": index}} for entry in timer.spans[first_span:]]
+            previous_index = index
+            if checkpoint:
+                checkpoint.write(checkpoint_line(index, hashes[index], results[index]))
+                checkpoint.flush()
+                os.fsync(checkpoint.fileno())
+    finally:
+        if checkpoint:
+            checkpoint.close()
+    return results
+
+
+def run_n_times(start=start_etabs, server_address: str = ETABS_SERVER_ADDRESS, instances: int = ETABS_INSTANCES):
+    """
+    Analyzes the models of inputs.npz or inputs.json in the working directory and writes output.npz or output.json.
+    start returns the (SapModel, application) pair to use, start_etabs or e.g. app.fake_etabs.start_fake_etabs.
+    With a server_address the models are analyzed by the etabs_server.py listening there, if it runs.
+    With more than one instance the models are spread over that many ETABS instances, see run_parallel.
+
+    Every result has the timing spans of its model under "timings", the first result also those of reading the
+    inputs and starting ETABS. Span starts are seconds since the worker started.
+    """
+    timer = timing.Timer()
+    with timer.activate():
+        with timing.span("read_inputs"):
+            input_npz = Path.cwd() / "inputs.npz"
+            binary = input_npz.exists()
+            if binary:
+                if exchange is None:
+                    raise RuntimeError("inputs.npz needs numpy and exchange.py on the worker, set ETABS_EXCHANGE_FORMAT=json in the app")
+                data = exchange.unpack_models(input_npz.read_bytes())
+            else:
+                with open(Path.cwd() / "inputs.json") as jsonfile:
+                    data = json.load(jsonfile)
+
+        result_list = forward_to_server(server_address, data, Path.cwd() / "output.jsonl") if server_address else None
+        EtabsEngine = None
+        if result_list is None and instances > 1 and len(data) > 1:
+            job_spans = list(timer.spans)
+            result_list = run_parallel(start, data, instances, checkpoint_path=Path.cwd() / "output.jsonl")
+            if result_list:
+                result_list[0]["timings"] = job_spans + result_list[0].get("timings", [])
+        elif result_list is None:
+            with timing.span("start_etabs"):
+                EtabsObject, EtabsEngine = start()
+            job_spans = list(timer.spans)
+            result_list = run_models(EtabsObject, data, checkpoint_path=Path.cwd() / "output.jsonl")
+            if result_list:
+                result_list[0]["timings"] = job_spans + result_list[0].get("timings", [])
+
+    if binary:
+        (Path.cwd() / "output.npz").write_bytes(exchange.pack_results(result_list))
+    else:
+        with open(Path.cwd() / "output.json", "w") as jsonfile:
+            json.dump(result_list, jsonfile)
+
+    if EtabsEngine is not None:
+        ret = EtabsEngine.ApplicationExit(False)
+
+
+def model_cost(model: dict) -> int:
+    """Estimated analysis time of a model, its number of members"""
+    return len(model["lines"])
+
+
+def plan_batches(models: list[dict], instances: int) -> list[list[int]]:
+    """
+    Indices of the models in batches for run_parallel, costliest batch first. A batch is (part of) a topology group,
+    so its models are edited in place by one instance. A group costing more than an even share of the total is cut
+    in as many parts as shares, and the largest batches are halved while there are fewer batches than instances.
+    """
+    groups = {}
+    for index, model in enumerate(models):
+        groups.setdefault(topology_key(model), []).append(index)
+
+    def cost(batch: list[int]) -> int:
+        return sum(model_cost(models[index]) for index in batch)
+
+    share = sum(model_cost(model) for model in models) / instances
+    batches = []
+    for group in groups.values():
+        parts = min(len(group), math.ceil(cost(group) / share))
+        batches += [group[part * len(group) // parts : (part + 1) * len(group) // parts] for part in range(parts)]
+    while 0 < len(batches) < instances:
+        largest = max(batches, key=cost)
+        if len(largest) < 2:
+            break
+        batches.remove(largest)
+        batches += [largest[: len(largest) // 2], largest[len(largest) // 2 :]]
+    return sorted(batches, key=cost, reverse=True)
+
+
+# ETABS of a run_parallel process: [SapModel, application, seconds since the epoch it started, start seconds, batches run]
+_instance = None
+
+
+def start_instance(start, directory: Path) -> None:
+    """Initializer of a run_parallel process: starts its ETABS in a working directory of its own"""
+    global _instance
+    instance_directory = Path(directory) / f"instance-{os.getpid()}"
+    instance_directory.mkdir(parents=True, exist_ok=True)
+    # analyze_etabs_model saves etabsmodel.edb to the working directory
+    os.chdir(instance_directory)
+    started = time.time()
+    EtabsObject, EtabsEngine = start()
+    _instance = [EtabsObject, EtabsEngine, started, time.time() - started, 0]
+    # Exits ETABS when the pool shuts the process down
+    Finalize(None, EtabsEngine.ApplicationExit, args=(False,), exitpriority=10)
+
+
+def run_batch(models: list[dict], wall_origin: float) -> list[dict]:
+    """
+    run_models on the ETABS of this process, with span starts in seconds since wall_origin. The first batch of an
+    instance has its start_etabs span, later batches start with a new blank model.
+    """
+    EtabsObject, EtabsEngine, started, start_seconds, batches = _instance
+    timer = timing.Timer()
+    with timer.activate():
+        if batches:
+            with timing.span("new_model"):
+                EtabsObject.InitializeNewModel(9)
+                EtabsObject.File.NewBlank()
+        job_spans = list(timer.spans)
+        results = run_models(EtabsObject, models)
+    _instance[4] += 1
+    if not batches:
+        job_spans.insert(0, {"name": "start_etabs", "start": started - timer.wall_origin, "seconds": start_seconds})
+    if results:
+        results[0]["timings"] = job_spans + results[0].get("timings", [])
+    offset = timer.wall_origin - wall_origin
+    for result in results:
+        for entry in result.get("timings", []):
+            entry["start"] += offset
+    return results
+
+
+def run_parallel(start, models: list[dict], instances: int, checkpoint_path: Path | None = None) -> list[dict]:
+    """
+    Analyzes the models on several ETABS instances at once, each started by start in a process with a working
+    directory of its own under the current one. Batches of plan_batches are handed out costliest first to the
+    instance that becomes free, results are in input order. start must be picklable, e.g. a module level function.
+
+    Results are appended to checkpoint_path per finished batch, models already in it are not analyzed again. A failed
+    batch does not stop the others: the first error is raised once every batch has finished.
+    """
+    timer = timing.current_timer()
+    hashes = [model_hash(model) for model in models]
+    completed = read_checkpoint(checkpoint_path) if checkpoint_path else {}
+    results = [completed.get(digest) for digest in hashes]
+    pending = [index for index, result in enumerate(results) if result is None]
+    batches = [[pending[index] for index in batch] for batch in plan_batches([models[index] for index in pending], instances)]
+    if not batches:
+        return results
+
+    wall_origin = timer.wall_origin if timer else time.time()
+    checkpoint = open(checkpoint_path, "a") if checkpoint_path else None
+    # spawn on every platform: ETABS and COM do not survive a fork
+    context = multiprocessing.get_context("spawn")
+    failure = None
+    try:
+        with ProcessPoolExecutor(
+            max_workers=min(instances, len(batches)), mp_context=context, initializer=start_instance, initargs=(start, Path.cwd())
+        ) as executor:
+            futures = {executor.submit(run_batch, [models[index] for index in batch], wall_origin): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    batch_results = future.result()
+                except Exception as error:
+                    # The other instances finish their batches, which are checkpointed before the first error is raised
+                    failure = failure or error
+                    continue
+                for index, result in zip(batch, batch_results, strict=True):
+                    if timer:
+                        for entry in result.get("timings", []):
+                            if "args" in entry:
+                                entry["args"] = {**entry["args"], "model": index}
+                    else:
+                        result.pop("timings", None)
+                    results[index] = result
+                    if checkpoint:
+                        checkpoint.write(checkpoint_line(index, hashes[index], result))
+                if checkpoint:
+                    checkpoint.flush()
+                    os.fsync(checkpoint.fileno())
+    finally:
+        if checkpoint:
+            checkpoint.close()
+    if failure is not None:
+        raise failure
+    return results
+
+
+def forward_to_server(server_address: str, models: list[dict], checkpoint_path: Path) -> list[dict] | None:
+    """
+    Results of the models from the job server, with its spans moved to the clock of this job.
+    None if no server is reachable or the connection to it drops, the caller then starts ETABS itself.
+    """
+    try:
+        from app import etabs_server
+    except ImportError:
+        import etabs_server
+
+    timer = timing.current_timer()
+    job_spans = list(timer.spans)
+    submitted = timer.now()
+    try:
+        result_list = etabs_server.submit_job(etabs_server.parse_address(server_address), models, str(checkpoint_path))
+    except (ConnectionError, EOFError, OSError):
+        return None
+    for result in result_list:
+        for entry in result.get("timings", []):
+            entry["start"] += submitted
+    if result_list:
+        result_list[0]["timings"] = job_spans + result_list[0].get("timings", [])
+    return result_list
 
 
 if __name__ == "__main__":
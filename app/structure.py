@@ -1,9 +1,13 @@
+import numpy as np
+
+from app.cache import LRUCache, canonical_hash
+from app.components.array_model import ArrayModel
+from app.components.clean_model import MERGE_TOLERANCE
 from app.components.components import Truss, Columns, create_joists
 from app.components.model import Model
-from app.components.clean_model import clean_model, get_nodes_by_z
 
 
-def generate_model(truss_depth, x_bay_width, y_bay_width, n_diagonals, columns_height, joist_n_diags, area_load):
+def create_components(truss_depth, x_bay_width, y_bay_width, n_diagonals, columns_height, joist_n_diags) -> list:
     truss1 = Truss(
         height=truss_depth,
         width=x_bay_width,
@@ -62,15 +66,113 @@ def generate_model(truss_depth, x_bay_width, y_bay_width, n_diagonals, columns_h
     joist_list = create_joists(ref_truss=truss1, height=truss_depth, width=y_bay_width, n_diagonal=joist_n_diags)
     components.extend(joist_list)
 
-    model = Model(components=components)
-    model.build()
+    return components
+
+
+def generate_array_model(truss_depth, x_bay_width, y_bay_width, n_diagonals, columns_height, joist_n_diags, area_load):
+    components = create_components(truss_depth, x_bay_width, y_bay_width, n_diagonals, columns_height, joist_n_diags)
+    model = Model(components=components).build_arrays()
     # Clean repeated nodes
-    nodes, lines = clean_model(Nodes=model.nodes, Lines=model.lines)
+    model.merge_coincident_nodes()
+    # The component counters leave node rows scattered over the model, order them along the member graph
+    model.renumber_nodes()
     # Nodes with load
-    nodes_with_load = get_nodes_by_z(nodes, columns_height)
+    nodes_with_load = model.node_ids_at_z(columns_height)
     # Supports
-    supports = get_nodes_by_z(nodes, 0)
+    supports = model.node_ids_at_z(0)
+
+    point_load = area_to_point_load(area_load, x_bay_width, y_bay_width, len(nodes_with_load))
+
+    return model, nodes_with_load, supports, point_load
+
 
-    point_load = area_load * 0.001 * (x_bay_width * y_bay_width) / len(nodes_with_load)
+def area_to_point_load(area_load, x_bay_width, y_bay_width, n_loaded_nodes) -> float:
+    """Spreads the area load [kN/m2] over the bay [mm] evenly across the loaded nodes, in N"""
+    return area_load * 0.001 * (x_bay_width * y_bay_width) / n_loaded_nodes
 
+
+def generate_model(truss_depth, x_bay_width, y_bay_width, n_diagonals, columns_height, joist_n_diags, area_load):
+    model, nodes_with_load, supports, point_load = generate_array_model(
+        truss_depth, x_bay_width, y_bay_width, n_diagonals, columns_height, joist_n_diags, area_load
+    )
+    nodes, lines = model.to_dicts()
     return nodes, lines, nodes_with_load, supports, point_load
+
+
+# Geometry does not depend on the load, so entries are keyed on the geometric inputs only
+GEOMETRY_CACHE = LRUCache(maxsize=64, max_weight=256 * 2**20, weigher=lambda entry: entry[0].nbytes)
+
+
+def geometry_key(truss_depth, x_bay_width, y_bay_width, n_diagonals, columns_height, joist_n_diags) -> str:
+    geometry = (truss_depth, x_bay_width, y_bay_width, n_diagonals, columns_height, joist_n_diags)
+    return canonical_hash({"geometry": [float(value) for value in geometry]})
+
+
+def cached_generate_model(truss_depth, x_bay_width, y_bay_width, n_diagonals, columns_height, joist_n_diags, area_load):
+    """Same output as generate_model, reusing the geometry of earlier calls. The returned dicts are fresh copies"""
+    key = geometry_key(truss_depth, x_bay_width, y_bay_width, n_diagonals, columns_height, joist_n_diags)
+    model, nodes_with_load, supports = GEOMETRY_CACHE.get_or_compute(
+        key,
+        lambda: generate_array_model(truss_depth, x_bay_width, y_bay_width, n_diagonals, columns_height, joist_n_diags, 1)[:3],
+    )
+    point_load = area_to_point_load(area_load, x_bay_width, y_bay_width, len(nodes_with_load))
+    nodes, lines = model.to_dicts()
+    return nodes, lines, list(nodes_with_load), list(supports), point_load
+
+
+class ModelTemplate:
+    # Depths used to find the nodes that move with the truss depth, chosen so they never land on a column node
+    REFERENCE_DEPTH_FRACTIONS = (0.3183, 0.3679)
+
+    def __init__(self, x_bay_width, y_bay_width, n_diagonals, columns_height, joist_n_diags) -> None:
+        """
+        Topology of generate_model for a fixed number of joists. Only the z coordinate of the bottom chord nodes
+        depends on the truss depth, so variants are created by copying the coordinates and moving those nodes.
+        Node and line IDs are the same for every depth.
+        """
+        self.x_bay_width = x_bay_width
+        self.y_bay_width = y_bay_width
+        self.n_diagonals = n_diagonals
+        self.columns_height = columns_height
+        self.joist_n_diags = joist_n_diags
+
+        model_a, nodes_with_load, supports, _ = self._generate(columns_height * self.REFERENCE_DEPTH_FRACTIONS[0], 1)
+        model_b, *_ = self._generate(columns_height * self.REFERENCE_DEPTH_FRACTIONS[1], 1)
+        if not (np.array_equal(model_a.node_ids, model_b.node_ids) and np.array_equal(model_a.connectivity, model_b.connectivity)):
+            raise ValueError("Model topology depends on the truss depth, it cannot be templated")
+
+        self.model = model_a
+        self.nodes_with_load = nodes_with_load
+        self.supports = supports
+        self.bottom_chord = model_a.coords[:, 2] != model_b.coords[:, 2]
+        self.fixed_levels = np.unique(model_a.coords[~self.bottom_chord, 2])
+
+    def _generate(self, truss_depth, area_load):
+        return generate_array_model(
+            truss_depth,
+            self.x_bay_width,
+            self.y_bay_width,
+            self.n_diagonals,
+            self.columns_height,
+            self.joist_n_diags,
+            area_load,
+        )
+
+    def instantiate_arrays(self, truss_depth, area_load):
+        """Same output as generate_array_model; the topology arrays are shared between instances"""
+        bottom_z = self.columns_height - truss_depth
+        if np.any(np.abs(self.fixed_levels - bottom_z) <= MERGE_TOLERANCE):
+            # The bottom chord lands on other nodes and would be merged with them, so the topology changes
+            return self._generate(truss_depth, area_load)
+
+        coords = self.model.coords.copy()
+        coords[self.bottom_chord, 2] = bottom_z
+        model = ArrayModel(self.model.node_ids, coords, self.model.line_ids, self.model.connectivity, self.model.components)
+        point_load = area_to_point_load(area_load, self.x_bay_width, self.y_bay_width, len(self.nodes_with_load))
+        return model, list(self.nodes_with_load), list(self.supports), point_load
+
+    def instantiate(self, truss_depth, area_load):
+        """Same output as generate_model"""
+        model, nodes_with_load, supports, point_load = self.instantiate_arrays(truss_depth, area_load)
+        nodes, lines = model.to_dicts()
+        return nodes, lines, nodes_with_load, supports, point_load
@@ -0,0 +1,32 @@
+UNIT_LOAD = 1.0
+# Columns of the result tables that label rows and do not scale with the load
+LABEL_COLUMNS = ("joint", "frame", "station")
+RESULT_TABLES = ("joint_displacements", "reactions", "frame_forces")
+
+
+def to_unit_model(model: dict) -> tuple[dict, float]:
+    """
+    The analysis is linear, so a model is analyzed once under a unit point load and its results are scaled.
+    Returns the unit load model and the factor that scales its results back to the original load.
+    """
+    return {**model, "load_magnitud": UNIT_LOAD}, model["load_magnitud"] / UNIT_LOAD
+
+
+def scale_result(unit_result: dict, factor: float, nodes_with_load: list) -> dict:
+    """Result of the model under factor times the unit load"""
+    deformations = {node_id: factor * value for node_id, value in unit_result["deformations"].items()}
+    # For a negative factor the largest downward displacement moves to another node, so it is looked up again
+    max_defo = min(deformations[str(node_id)] for node_id in nodes_with_load)
+    tables = {
+        table: {
+            column: values if column in LABEL_COLUMNS else [factor * value for value in values] for column, values in columns.items()
+        }
+        for table, columns in unit_result.items()
+        if table in RESULT_TABLES
+    }
+    return {**unit_result, **tables, "deformations": deformations, "max_defo": max_defo}
+
+
+def load_sweep(result: dict, reference_load: float, nodes_with_load: list, point_loads: list[float]) -> list[dict]:
+    """Results for several load magnitudes from a single analysis under reference_load, e.g. UNIT_LOAD"""
+    return [scale_result(result, point_load / reference_load, nodes_with_load) for point_load in point_loads]
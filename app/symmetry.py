@@ -0,0 +1,317 @@
+"""
+Symmetry reduction of worker models.
+
+The bay of generate_model is mirror symmetric about its vertical mid planes: geometry, supports and loads. Such a
+model is analyzed as a half model for one plane or a quarter model for two, with a half or a quarter of the degrees of
+freedom:
+
+    reduction = SymmetryReduction(model)
+    result = reduction.expand(analyze_model(reduction.reduced))
+
+The reduced model keeps the part on the low side of every plane. Nodes on a plane get the symmetry restraints of the
+plane, members lying in it half their stiffness and loads on it half their magnitude, and members crossing it are
+split where they cross it. These travel in the optional "restraints", "frame_modifiers" and "load_factors" model keys,
+which the ETABS worker, app/fake_etabs.py and the local frame solver support. expand mirrors the displacements,
+reactions and member forces the backend reports for the reduced model onto their images in the full model, so the
+expanded result comes from the backend's own element formulation. Members and supports shared with a mirror image
+get the full value back, and split members their far end as the mirror image of the near one.
+"""
+
+import numpy as np
+
+from scipy.spatial import cKDTree
+
+from app.components.array_model import ArrayModel
+from app.components.clean_model import MERGE_TOLERANCE
+from app.frame_solver import DOFS_PER_NODE, ETABS_AXES, rotation_matrices
+
+# Planes normal to the global X and Y axes; gravity loads are never symmetric about a horizontal plane
+SYMMETRY_AXES = (0, 1)
+# Optional model keys of a reduced model
+REDUCTION_KEYS = ("restraints", "frame_modifiers", "load_factors")
+# Result table columns, in global axes for joints and in ETABS local axes for frames
+DISPLACEMENT_COLUMNS = ("u1", "u2", "u3", "r1", "r2", "r3")
+REACTION_COLUMNS = ("f1", "f2", "f3", "m1", "m2", "m3")
+FRAME_FORCE_COLUMNS = ("p", "v2", "v3", "t", "m2", "m3")
+
+
+def plane_restraints(axis: int) -> np.ndarray:
+    """(6,) DOFs a mirror plane normal to axis fixes: the translation along the axis and the rotations about the others"""
+    restraint = np.zeros(DOFS_PER_NODE, dtype=bool)
+    restraint[axis] = True
+    restraint[[3 + other for other in range(3) if other != axis]] = True
+    return restraint
+
+
+def plane_signs(axis: int) -> np.ndarray:
+    """(6,) factors that mirror a displacement vector about a plane normal to axis"""
+    return np.where(plane_restraints(axis), -1.0, 1.0)
+
+
+def plane_reflection(axis: int) -> np.ndarray:
+    """(3, 3) reflection matrix of a plane normal to axis"""
+    reflection = np.eye(3)
+    reflection[axis, axis] = -1
+    return reflection
+
+
+def mirror_factors(axes: np.ndarray, image_axes: np.ndarray, reflection: np.ndarray) -> tuple[float, np.ndarray]:
+    """
+    Direction and (6,) factors that turn the internal forces of a member into those of its mirror image.
+
+    Args:
+        axes (np.ndarray): (3, 3) local axes 1, 2 and 3 of the member as rows.
+        image_axes (np.ndarray): (3, 3) local axes of the image.
+        reflection (np.ndarray): (3, 3) reflection that maps the member onto the image.
+
+    Returns:
+        tuple: 1.0 if the image runs from the image of end I to that of end J, else -1.0, when its first station is
+        the image of the last station of the member. The forces flip with every local axis the reflection reverses,
+        the moments also with the handedness of the reflection, and all of them with the direction.
+    """
+    alignment = np.round(np.einsum("ij,ij->i", image_axes, axes @ reflection.T))
+    direction = alignment[0]
+    handedness = np.round(np.linalg.det(reflection))
+    return direction, direction * np.concatenate([alignment, handedness * alignment])
+
+
+def joint_rows(table: dict, columns: tuple[str, ...]) -> dict[str, np.ndarray]:
+    """(6,) values of every joint of a result table"""
+    values = np.column_stack([table[name] for name in columns])
+    return dict(zip(map(str, table["joint"]), values, strict=True))
+
+
+def frame_end_rows(table: dict) -> dict[str, np.ndarray]:
+    """(2, 6) internal forces at the first and the last station of every frame of a result table"""
+    values = np.column_stack([table[name] for name in FRAME_FORCE_COLUMNS])
+    rows = {}
+    for row, frame in enumerate(table["frame"]):
+        rows.setdefault(str(frame), []).append(row)
+    return {frame: values[[frame_rows[0], frame_rows[-1]]] for frame, frame_rows in rows.items()}
+
+
+def mirror_rows(model: ArrayModel, axis: int, coordinate: float, tol: float = MERGE_TOLERANCE) -> np.ndarray | None:
+    """Row of the mirror image of every node about the plane, None if a node has no image"""
+    mirrored = model.coords.copy()
+    mirrored[:, axis] = 2 * coordinate - mirrored[:, axis]
+    distance, rows = cKDTree(model.coords).query(mirrored, distance_upper_bound=tol)
+    if np.any(np.isinf(distance)):
+        return None
+    return rows
+
+
+def is_symmetric(data: dict, model: ArrayModel, axis: int, coordinate: float, tol: float = MERGE_TOLERANCE) -> bool:
+    """
+    True if the plane maps nodes, lines, loaded nodes and supports onto themselves. Members crossing the plane
+    must be their own mirror image, so that they can be split at it.
+    """
+    mirror = mirror_rows(model, axis, coordinate, tol)
+    if mirror is None:
+        return False
+    ends = np.sort(model.connectivity, axis=1)
+    mirrored_ends = np.sort(mirror[model.connectivity], axis=1)
+    if set(map(tuple, mirrored_ends.tolist())) != set(map(tuple, ends.tolist())):
+        return False
+    for key in ("nodes_with_load", "supports"):
+        rows = model.node_index([int(node_id) for node_id in data[key]])
+        if set(mirror[rows].tolist()) != set(rows.tolist()):
+            return False
+    side = np.sign(np.round((model.coords[:, axis] - coordinate) / tol))
+    crossing = side[model.connectivity[:, 0]] * side[model.connectivity[:, 1]] < 0
+    return bool(np.all(mirror[model.connectivity[crossing, 0]] == model.connectivity[crossing, 1]))
+
+
+def find_symmetry_planes(data: dict, tol: float = MERGE_TOLERANCE) -> list[tuple[int, float]]:
+    """
+    (axis, coordinate) of the vertical mid planes the worker model is symmetric about. Models that already carry
+    restraints, modifiers or load factors are not reduced again.
+    """
+    if any(key in data for key in REDUCTION_KEYS):
+        return []
+    model = ArrayModel.from_dicts(data["nodes"], data["lines"])
+    if model.n_nodes == 0:
+        return []
+    planes = []
+    for axis in SYMMETRY_AXES:
+        coordinate = float(model.coords[:, axis].min() + model.coords[:, axis].max()) / 2
+        if np.ptp(model.coords[:, axis]) > tol and is_symmetric(data, model, axis, coordinate, tol):
+            planes.append((axis, coordinate))
+    return planes
+
+
+class SymmetryReduction:
+    def __init__(self, data: dict, planes: list[tuple[int, float]] | None = None, tol: float = MERGE_TOLERANCE) -> None:
+        """
+        Reduced model of a worker model dict and the mapping of its results back to the full model.
+
+        Args:
+            data (dict): Worker model dict.
+            planes (list | None): (axis, coordinate) symmetry planes, detected with find_symmetry_planes if None.
+                Without planes the reduced model is the model itself.
+            tol (float): Distance within which nodes are on a plane or each other's mirror image.
+        """
+        self.data = data
+        self.tol = tol
+        self.model = ArrayModel.from_dicts(data["nodes"], data["lines"])
+        self.planes = find_symmetry_planes(data, tol) if planes is None else list(planes)
+        # Line ID of every member split at a plane: the index of the plane and whether end I is kept
+        self.split_lines = {}
+        self.reduced = self._reduce() if self.planes else data
+
+    def _on_plane(self, coords: np.ndarray, axis: int, coordinate: float) -> np.ndarray:
+        return np.abs(coords[:, axis] - coordinate) <= self.tol
+
+    def _reduce(self) -> dict:
+        model = self.model
+        kept = np.ones(model.n_nodes, dtype=bool)
+        for axis, coordinate in self.planes:
+            kept &= model.coords[:, axis] <= coordinate + self.tol
+
+        node_ids = model.node_ids[kept].tolist()
+        coords = model.coords[kept].tolist()
+        lines = {}
+        next_id = int(model.node_ids.max()) + 1
+        for (line_id, line), (row_i, row_j) in zip(self.data["lines"].items(), model.connectivity.tolist(), strict=True):
+            if kept[row_i] and kept[row_j]:
+                lines[line_id] = dict(line)
+                continue
+            if not (kept[row_i] or kept[row_j]):
+                continue
+            # One end beyond a plane: a member crossing it is split at the plane, one ending on it is a mirror image
+            inside, outside = (row_i, row_j) if kept[row_i] else (row_j, row_i)
+            for index, (axis, coordinate) in enumerate(self.planes):
+                start, end = model.coords[inside], model.coords[outside]
+                if end[axis] > coordinate + self.tol and start[axis] < coordinate - self.tol:
+                    cut = start + (end - start) * (coordinate - start[axis]) / (end[axis] - start[axis])
+                    node_ids.append(next_id)
+                    coords.append(cut.tolist())
+                    ends = (line["nodeI"], next_id) if inside == row_i else (next_id, line["nodeJ"])
+                    lines[line_id] = {**line, "nodeI": ends[0], "nodeJ": ends[1]}
+                    self.split_lines[str(line_id)] = (index, inside == row_i)
+                    next_id += 1
+                    break
+
+        nodes = {node_id: {"id": node_id, "x": x, "y": y, "z": z} for node_id, (x, y, z) in zip(node_ids, coords, strict=True)}
+        reduced_coords = np.array(coords)
+        on_planes = np.column_stack([self._on_plane(reduced_coords, axis, coordinate) for axis, coordinate in self.planes])
+        row_of_id = {node_id: row for row, node_id in enumerate(node_ids)}
+
+        restraints = {}
+        for row in np.flatnonzero(on_planes.any(axis=1)):
+            restraint = np.zeros(DOFS_PER_NODE, dtype=bool)
+            for index, (axis, _) in enumerate(self.planes):
+                if on_planes[row, index]:
+                    restraint |= plane_restraints(axis)
+            restraints[str(node_ids[row])] = restraint.astype(int).tolist()
+        # A member or load on a plane is shared with its mirror image, on two planes with three images
+        frame_modifiers = {}
+        for line_id, line in lines.items():
+            shared = on_planes[row_of_id[line["nodeI"]]] & on_planes[row_of_id[line["nodeJ"]]]
+            if shared.any():
+                frame_modifiers[str(line_id)] = 0.5 ** int(shared.sum())
+        load_factors = {}
+        nodes_with_load = [node_id for node_id in self.data["nodes_with_load"] if int(node_id) in row_of_id]
+        for node_id in nodes_with_load:
+            shared = on_planes[row_of_id[int(node_id)]]
+            if shared.any():
+                load_factors[str(node_id)] = 0.5 ** int(shared.sum())
+
+        return {
+            **self.data,
+            "nodes": nodes,
+            "lines": lines,
+            "nodes_with_load": nodes_with_load,
+            "supports": [node_id for node_id in self.data["supports"] if int(node_id) in row_of_id],
+            "restraints": restraints,
+            "frame_modifiers": frame_modifiers,
+            "load_factors": load_factors,
+        }
+
+    def representatives(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        For every node of the full model the row of its image in the reduced part and the (6,) factors that turn the
+        displacements of that image into its own
+        """
+        rows = np.arange(self.model.n_nodes)
+        signs = np.ones((self.model.n_nodes, DOFS_PER_NODE))
+        for axis, coordinate in self.planes:
+            beyond = self.model.coords[:, axis] > coordinate + self.tol
+            mirror = mirror_rows(self.model, axis, coordinate, self.tol)
+            rows[beyond] = mirror[rows[beyond]]
+            signs[beyond] *= plane_signs(axis)
+        return rows, signs
+
+    def expand(self, result: dict) -> dict:
+        """Result of the reduced model as the result of the full model, with the payload layout of the worker"""
+        if not self.planes:
+            return result
+        model = self.model
+        rows, signs = self.representatives()
+        node_names = model.node_ids.astype(str)
+        reduced_displacements = joint_rows(result["joint_displacements"], DISPLACEMENT_COLUMNS)
+        displacements = np.array([reduced_displacements[name] for name in node_names[rows]]) * signs
+
+        # A support on a plane also carries the reaction of its images, without the components of the plane restraint
+        support_rows = model.node_index([int(node_id) for node_id in self.data["supports"]])
+        reduced_reactions = joint_rows(result["reactions"], REACTION_COLUMNS)
+        reactions = np.array([reduced_reactions[name] for name in node_names[rows[support_rows]]]).reshape(-1, DOFS_PER_NODE)
+        reactions *= signs[support_rows]
+        for axis, coordinate in self.planes:
+            on_plane = self._on_plane(model.coords[support_rows], axis, coordinate)
+            reactions[on_plane] *= np.where(plane_restraints(axis), 0.0, 2.0)
+
+        loaded_rows = model.node_index([int(node_id) for node_id in self.data["nodes_with_load"]])
+        uz = displacements[:, 2]
+        expanded = {
+            "deformations": dict(zip(node_names.tolist(), uz.tolist(), strict=True)),
+            "max_defo": float(uz[loaded_rows].min()),
+            "joint_displacements": {"joint": node_names.tolist()},
+            "reactions": {"joint": node_names[support_rows].tolist()},
+            "frame_forces": {
+                "frame": np.repeat(model.line_ids.astype(str), 2).tolist(),
+                "station": np.column_stack([np.zeros(model.n_lines), model.lengths()]).ravel().tolist(),
+            },
+        }
+        frame_forces = self._expand_frame_forces(frame_end_rows(result["frame_forces"])).reshape(-1, DOFS_PER_NODE)
+        for table, columns, values in (
+            ("joint_displacements", DISPLACEMENT_COLUMNS, displacements),
+            ("reactions", REACTION_COLUMNS, reactions),
+            ("frame_forces", FRAME_FORCE_COLUMNS, frame_forces),
+        ):
+            expanded[table].update({name: values[:, column].tolist() for column, name in enumerate(columns)})
+        if "timings" in result:
+            expanded["timings"] = result["timings"]
+        return expanded
+
+    def _expand_frame_forces(self, reduced: dict[str, np.ndarray]) -> np.ndarray:
+        """(M, 2, 6) internal forces at both ends of every member of the full model from those of the reduced model"""
+        model = self.model
+        rotation, _ = rotation_matrices(model.coords, model.connectivity)
+        axes = ETABS_AXES @ rotation
+        mirrors = [mirror_rows(model, axis, coordinate, self.tol) for axis, coordinate in self.planes]
+        row_of_ends = {tuple(sorted(ends)): row for row, ends in enumerate(model.connectivity.tolist())}
+        line_names = model.line_ids.astype(str)
+        modifiers = self.reduced["frame_modifiers"]
+
+        forces = np.zeros((model.n_lines, 2, DOFS_PER_NODE))
+        for row, ends in enumerate(model.connectivity):
+            midpoint = model.coords[ends].mean(axis=0)
+            image, reflection = ends, np.eye(3)
+            for (axis, coordinate), mirror in zip(self.planes, mirrors, strict=True):
+                if midpoint[axis] > coordinate + self.tol:
+                    image, reflection = mirror[image], plane_reflection(axis) @ reflection
+            source = row_of_ends[tuple(sorted(image.tolist()))]
+            # Members in a plane carry the force of their images with a fraction of the stiffness
+            name = line_names[source]
+            source_forces = reduced[name] / modifiers.get(name, 1.0)
+            if source != row:
+                direction, factors = mirror_factors(axes[source], axes[row], reflection)
+                forces[row] = (source_forces if direction > 0 else source_forces[::-1]) * factors
+            elif name in self.split_lines:
+                index, keeps_i = self.split_lines[name]
+                _, factors = mirror_factors(axes[row], axes[row], plane_reflection(self.planes[index][0]))
+                near = source_forces[0] if keeps_i else source_forces[-1]
+                forces[row] = (near, near * factors) if keeps_i else (near * factors, near)
+            else:
+                forces[row] = source_forces
+        return forces
@@ -0,0 +1,122 @@
+"""
+Lightweight timing spans of one request, aggregated per stage and exportable as a Chrome trace.
+
+Only the standard library is used, the worker imports this file next to run_etabs_model.py. Code in the app records
+spans on the timer of the current request, if there is one:
+
+    timer = Timer()
+    with timer.activate():
+        with span("generate_model"):
+            ...
+    timer.totals(), timer.write_trace(path)
+"""
+
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from pathlib import Path
+
+# Directory where a Chrome trace of every timed request is written, not written if empty
+TIMING_TRACE_DIR = os.environ.get("TIMING_TRACE_DIR", "")
+
+_CURRENT_TIMER = ContextVar("timer", default=None)
+
+
+class Timer:
+    def __init__(self) -> None:
+        """Spans with their start relative to the creation of the timer, in seconds"""
+        self.origin = time.perf_counter()
+        self.wall_origin = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        return time.perf_counter() - self.origin
+
+    def record(self, name: str, start: float, seconds: float, track: str | None = None, **args) -> None:
+        entry = {"name": name, "start": start, "seconds": seconds, "track": track or threading.current_thread().name}
+        if args:
+            entry["args"] = args
+        with self._lock:
+            self.spans.append(entry)
+
+    @contextmanager
+    def span(self, name: str, **args):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.record(name, start, self.now() - start, **args)
+
+    def add_spans(self, spans: list[dict], offset: float, track: str) -> None:
+        """Adds spans of another timer, e.g. of a worker, shifted by offset seconds onto a track of their own"""
+        for entry in spans:
+            self.record(entry["name"], offset + entry["start"], entry["seconds"], track, **entry.get("args", {}))
+
+    @contextmanager
+    def activate(self):
+        """Makes this the timer of span() calls in this context and in threads started with copy_context"""
+        token = _CURRENT_TIMER.set(self)
+        try:
+            yield self
+        finally:
+            _CURRENT_TIMER.reset(token)
+
+    def totals(self) -> dict[str, dict]:
+        """Summed seconds and number of spans per name, in order of first occurrence"""
+        totals = {}
+        for entry in sorted(self.spans, key=lambda entry: entry["start"]):
+            total = totals.setdefault(entry["name"], {"seconds": 0.0, "count": 0})
+            total["seconds"] += entry["seconds"]
+            total["count"] += 1
+        return totals
+
+    def chrome_trace(self) -> dict:
+        """Trace Event Format document, opens in chrome://tracing and Perfetto. One thread per track"""
+        tracks = {}
+        events = []
+        for entry in sorted(self.spans, key=lambda entry: entry["start"]):
+            tid = tracks.setdefault(entry["track"], len(tracks) + 1)
+            event = {"name": entry["name"], "ph": "X", "pid": 1, "tid": tid, "ts": 1e6 * entry["start"], "dur": 1e6 * entry["seconds"]}
+            if "args" in entry:
+                event["args"] = entry["args"]
+            events.append(event)
+        events += [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": track}} for track, tid in tracks.items()]
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"start": self.wall_origin}}
+
+    def write_trace(self, path: Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.chrome_trace()))
+        return path
+
+
+def current_timer() -> Timer | None:
+    return _CURRENT_TIMER.get()
+
+
+def span(name: str, **args):
+    """Span on the timer of the current request, nothing is recorded outside a timed request"""
+    timer = current_timer()
+    return timer.span(name, **args) if timer is not None else nullcontext()
+
+
+def save_trace(timer: Timer, label: str, directory: str = TIMING_TRACE_DIR) -> Path | None:
+    """Writes the trace of a request to TIMING_TRACE_DIR, if set"""
+    if not directory:
+        return None
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(timer.wall_origin))
+    return timer.write_trace(Path(directory) / f"{label}-{stamp}-{os.getpid()}-{id(timer):x}.json")
+
+
+def summary(timer: Timer) -> str:
+    """One line per stage: name, total seconds and the number of spans if more than one"""
+    lines = []
+    for name, total in timer.totals().items():
+        count = f" ({total['count']}x)" if total["count"] > 1 else ""
+        lines.append(f"{name}: {total['seconds']:.3f} s{count}")
+    return "\n".join(lines)
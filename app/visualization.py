@@ -1,11 +1,21 @@
 import math
 import numpy as np
 import viktor as vkt
-import matplotlib.pyplot as plt
 
-from matplotlib.colors import ListedColormap
+from app.cache import LRUCache, canonical_hash
+from app.colormaps import map_colors
+from app.components.array_model import ArrayModel
+from app.gltf import MeshGroup, arrows, cubes, prisms, to_glb
 
 NODE_RADIUS = 40
+# Deformation coloring: colormap and number of color bands
+DEFORMATION_COLORMAP = "jet"
+DEFORMATION_BANDS = 30
+JOINT_COLOR = (200, 200, 200)
+LOAD_COLOR = (255, 10, 10)
+LOAD_OPACITY = 0.8
+# GLB files of undeformed models with their loads
+RENDER_CACHE = LRUCache(maxsize=16, max_weight=64 * 2**20, weigher=len)
 
 
 def create_load_arrow(point_node: dict, magnitude: float, direction: str = "z", material=None) -> vkt.Group:
@@ -49,7 +59,11 @@ def render_frame_elements(
 ) -> list:
     sections_group = []
     rendered_sphere = set()
-    for line_id, dict_vals in lines.items():
+    if deformation:
+        # All member colors in one lookup
+        deformations = [dict_vals["deformation"] for dict_vals in lines.values()]
+        member_colors = map_colors(deformations, max_defo, DEFORMATION_COLORMAP, DEFORMATION_BANDS).tolist()
+    for line_index, (line_id, dict_vals) in enumerate(lines.items()):
         node_id_i = dict_vals["nodeI"]
         node_id_j = dict_vals["nodeJ"]
 
@@ -74,8 +88,7 @@ def render_frame_elements(
         material = color_dict[dict_vals[COLOR_BY]]
         sec_size = section_dict[dict_vals[COLOR_BY]]
         if deformation:
-            def_val = dict_vals["deformation"]
-            r, g, b = get_color_from_displacement(def_val, max_defo)
+            r, g, b = member_colors[line_index]
             material = vkt.Material(color=vkt.Color(r=r, g=g, b=b))
         section_k = vkt.RectangularExtrusion(sec_size, sec_size, line_k, identifier=str(line_id), material=material)
         sections_group.append(section_k)
@@ -83,15 +96,81 @@ def render_frame_elements(
     return sections_group
 
 
-def get_color_from_displacement(displacement: float, max_displacement: float, partitions: int = 30):
-    # Normalize the displacement value
-    normalized_displacement = displacement / max_displacement if max_displacement != 0 else 0
-    # Generate a colormap with the specified number of partitions
-    base_cmap = plt.get_cmap("jet")
-    discrete_cmap = ListedColormap(base_cmap(np.linspace(0, 1, partitions)))
-    # Get the RGB color from the discrete colormap
-    rgb_color = discrete_cmap(normalized_displacement)[:3]  # Exclude alpha channel
-    return tuple(int(x * 255) for x in rgb_color)
+def render_frame_glb(
+    lines: dict,
+    nodes: dict,
+    color_dict: dict,
+    section_dict: dict,
+    COLOR_BY: str,
+    deformation: bool = False,
+    max_defo: float | None = None,
+    nodes_with_load: list | None = None,
+    load_magnitude: float = 0.0,
+) -> bytes:
+    """
+    The scene of render_frame_elements and create_load_arrow as a single GLB file: a square tube per member,
+    a cube per joint and an arrow per loaded node, batched into one opaque and one transparent mesh.
+    The member and joint IDs are kept in the extras of the mesh primitives, see MeshGroup.primitives.
+    With deformation, every node needs a "deformation": the vertices at the ends of a member get the color of their
+    node, which the viewer interpolates along the member.
+    """
+    model = ArrayModel.from_dicts(nodes, lines)
+    line_values = list(lines.values())
+    sizes = np.array([section_dict[line[COLOR_BY]] for line in line_values], dtype=float)
+    if deformation:
+        deformations = np.array([node["deformation"] for node in nodes.values()], dtype=float)
+        node_colors = map_colors(deformations, max_defo, DEFORMATION_COLORMAP, DEFORMATION_BANDS)
+        # The first 4 vertices of a prism are at nodeI, the last 4 at nodeJ
+        colors = node_colors[model.connectivity[:, np.repeat([0, 1], 4)]].reshape(-1, 3)
+    else:
+        colors = np.array([color_dict[line[COLOR_BY]].color.rgb for line in line_values]).reshape(-1, 3)
+
+    structure = MeshGroup("structure")
+    positions, indices = prisms(model.coords[model.connectivity[:, 0]], model.coords[model.connectivity[:, 1]], sizes)
+    structure.add(positions, indices, colors, vertices_per_part=8, ids=model.line_ids)
+    joints = np.unique(model.connectivity)
+    positions, indices = cubes(model.coords[joints], 2 * NODE_RADIUS)
+    structure.add(positions, indices, JOINT_COLOR, vertices_per_part=8, ids=model.node_ids[joints])
+
+    loads = MeshGroup("loads", opacity=LOAD_OPACITY)
+    if nodes_with_load and load_magnitude:
+        # Same size as create_load_arrow: head and shaft of magnitude / 20 each, pointing to the node along z
+        direction = -np.sign(load_magnitude)
+        tips = model.coords[model.node_index(nodes_with_load)] - direction * np.array([0, 0, NODE_RADIUS])
+        positions, indices = arrows(tips, [0, 0, direction], 2 * abs(load_magnitude / 20))
+        loads.add(positions, indices, LOAD_COLOR, vertices_per_part=13)
+    return to_glb([structure, loads])
+
+
+def cached_render_frame_glb(
+    geometry_key: str,
+    lines: dict,
+    nodes: dict,
+    color_dict: dict,
+    section_dict: dict,
+    COLOR_BY: str,
+    nodes_with_load: list,
+    load_magnitude: float,
+) -> vkt.File:
+    """
+    Undeformed render_frame_glb, reused for the same geometry, sections, coloring and load.
+    color_dict is not part of the key, it is expected to be a constant of the app.
+    """
+    key = canonical_hash({"geometry": geometry_key, "sections": section_dict, "color_by": COLOR_BY, "load": load_magnitude})
+    glb = RENDER_CACHE.get_or_compute(
+        key,
+        lambda: render_frame_glb(
+            lines, nodes, color_dict, section_dict, COLOR_BY, nodes_with_load=nodes_with_load, load_magnitude=load_magnitude
+        ),
+    )
+    return vkt.File.from_data(glb)
+
+
+def get_color_from_displacement(
+    displacement: float, max_displacement: float, partitions: int = DEFORMATION_BANDS, colormap: str = DEFORMATION_COLORMAP
+):
+    # Single value version of map_colors, for whole models call map_colors once
+    return tuple(map_colors([displacement], max_displacement, colormap, partitions)[0].tolist())
 
 
 sections_db = {"SHS50X3": {"depth": 60.0, "thickness": 3.0, "weight/m":4.25},
@@ -0,0 +1,30 @@
+from app.components.array_model import ArrayModel
+from app.components.components import Truss, Columns
+from app.components.model import Model
+from app.structure import generate_array_model
+
+
+def make_components():
+    truss = Truss(height=600, width=8000, n_diagonals=7, xo=0, yo=0, zo=6000, plane="xz", component_name="Truss")
+    column = Columns(height=6000, xo=0, yo=0, zo=0, component_name="Column")
+    return [truss, column]
+
+
+def test_arrays_match_dict_build():
+    dict_model = Model(components=make_components())
+    dict_model.build()
+    array_model = Model(components=make_components()).build_arrays()
+
+    nodes, lines = array_model.to_dicts()
+    assert nodes == dict_model.nodes
+    assert lines == dict_model.lines
+
+
+def test_dict_roundtrip():
+    model, nodes_with_load, supports, _ = generate_array_model(600, 8000, 14000, 7, 6000, 8, 5)
+    nodes, lines = model.to_dicts()
+    roundtrip = ArrayModel.from_dicts(nodes, lines)
+
+    assert roundtrip.to_dicts() == (nodes, lines)
+    assert len(supports) == 4
+    assert set(nodes_with_load) <= set(nodes)
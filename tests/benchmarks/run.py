@@ -0,0 +1,231 @@
+"""
+Benchmarks of model generation, cleaning, rendering and quantity takeoff.
+
+Every case is a structure size; every stage of a case is timed with time.perf_counter (best of a few repeats, fewer
+for stages that take more than the time budget) and measured once more under tracemalloc for its peak memory. Results are compared with baseline.json and stages slower
+than the baseline by more than the threshold are reported as slowdowns.
+
+    python -m tests.benchmarks.run                  # compare with baseline.json, exit code 1 on slowdowns
+    python -m tests.benchmarks.run --update         # write the results as the new baseline
+    python -m tests.benchmarks.run --case small --threshold 0.5
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import viktor as vkt
+
+from app.components.clean_model import MERGE_TOLERANCE, clean_model
+from app.fake_etabs import start_fake_etabs
+from app.optimization import COLUMN_HEIGHT, batch_takeoff, generate_variants, mass_co2_from_model
+from app.run_etabs_model import run_models
+from app.structure import generate_model
+from app.visualization import render_frame_elements, render_frame_glb, sections_db
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_REPEATS = 5
+# Seconds after which a stage is not repeated any more
+TIME_BUDGET = 2.0
+# VIKTOR primitives take about 5 ms per member, larger models are skipped
+MAX_MEMBERS = {"render_frame_elements": 5000, "etabs_worker": 20000}
+SECTION = "SHS50X3"
+COLOR_BY = "component"
+COLORS = {component: vkt.Material(color=vkt.Color(180, 180, 180)) for component in ("Truss", "Column", "Joist")}
+SECTION_SIZES = {"Truss": 60, "Column": 300, "Joist": 60}
+# Structure sizes: bay widths [mm], diagonals of the main trusses (one joist per diagonal) and of the joists
+CASES = {
+    "small": {"x_bay_width": 8000, "y_bay_width": 14000, "n_diagonals": 7, "joist_n_diags": 8},
+    "medium": {"x_bay_width": 24000, "y_bay_width": 18000, "n_diagonals": 40, "joist_n_diags": 12},
+    "large": {"x_bay_width": 60000, "y_bay_width": 24000, "n_diagonals": 200, "joist_n_diags": 16},
+    "wide": {"x_bay_width": 120000, "y_bay_width": 30000, "n_diagonals": 400, "joist_n_diags": 24},
+}
+TRUSS_DEPTH = 1200
+AREA_LOAD = 5
+# Share of the node copies of raw_geometry moved by less than the merge tolerance
+NEAR_COINCIDENT_FRACTION = 0.1
+
+
+def measure(function: Callable, repeats: int, budget: float = TIME_BUDGET) -> dict:
+    """Best and median wall time of repeats runs, or fewer once budget seconds are spent, and peak traced memory of one more run"""
+    times = []
+    while len(times) < max(repeats, 1) and sum(times) < budget:
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    # Traced separately, tracemalloc slows allocations down
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(times), "median_seconds": statistics.median(times), "peak_bytes": peak}
+
+
+def variant_params(case: dict) -> SimpleNamespace:
+    """Optimization parameters with a variant grid of hundreds of joist counts around the case"""
+    step_1 = SimpleNamespace(
+        x_bay_width=case["x_bay_width"], y_bay_width=case["y_bay_width"], joist_n_diags=case["joist_n_diags"], area_load=AREA_LOAD
+    )
+    step_3 = SimpleNamespace(
+        min_jst=2, max_jst=max(case["n_diagonals"], 100), delta_jst=1, min_truss=300, max_truss=3000, delta_truss=100
+    )
+    return SimpleNamespace(step_1=step_1, step_3=step_3)
+
+
+def raw_geometry(nodes: dict, lines: dict, seed: int = 0) -> tuple[dict, dict]:
+    """
+    The model as drawn member by member, before clean_model: every member has its own end nodes, so a joint has one
+    coincident node per member meeting there. NEAR_COINCIDENT_FRACTION of them are moved by up to a quarter of
+    MERGE_TOLERANCE along each axis, which also puts some of them in neighbouring cells of the merge grid.
+    """
+    rng = np.random.default_rng(seed)
+    raw_nodes, raw_lines = {}, {}
+    for line_id, line in lines.items():
+        ends = {}
+        for end in ("nodeI", "nodeJ"):
+            node_id = len(raw_nodes) + 1
+            raw_nodes[node_id] = {**nodes[line[end]], "id": node_id}
+            ends[end] = node_id
+        raw_lines[line_id] = {**line, **ends}
+    moved = rng.random(len(raw_nodes)) < NEAR_COINCIDENT_FRACTION
+    offsets = rng.uniform(-0.25 * MERGE_TOLERANCE, 0.25 * MERGE_TOLERANCE, (len(raw_nodes), 3))
+    for node_id, offset in zip(np.flatnonzero(moved) + 1, offsets[moved], strict=True):
+        node = raw_nodes[node_id]
+        node["x"], node["y"], node["z"] = node["x"] + offset[0], node["y"] + offset[1], node["z"] + offset[2]
+    return raw_nodes, raw_lines
+
+
+def stages(case: dict) -> dict[str, Callable]:
+    """The benchmarked stages of a case, as functions without arguments. Stages above their MAX_MEMBERS are left out"""
+    geometry = (TRUSS_DEPTH, case["x_bay_width"], case["y_bay_width"], case["n_diagonals"], COLUMN_HEIGHT, case["joist_n_diags"])
+    nodes, lines, nodes_with_load, supports, point_load = generate_model(*geometry, AREA_LOAD)
+    raw_nodes, raw_lines = raw_geometry(nodes, lines)
+    weight_per_meter = sections_db[SECTION]["weight/m"]
+    params = variant_params(case)
+    variants = generate_variants(params)
+    depths = [variant["truss_depth_value"] for variant in variants]
+    worker_models = [
+        {
+            "nodes": nodes,
+            "lines": lines,
+            "nodes_with_load": nodes_with_load,
+            "load_magnitud": load_magnitude,
+            "supports": supports,
+            "section_name": SECTION,
+            "section_props": sections_db[SECTION],
+        }
+        for load_magnitude in (point_load, 2 * point_load)
+    ]
+    joists = [variant["joist_value"] for variant in variants]
+    functions = {
+        "generate_model": lambda: generate_model(*geometry, AREA_LOAD),
+        "clean_model": lambda: clean_model(nodes, lines),
+        # clean_model edits its arguments, so every run merges fresh copies of the raw geometry
+        "clean_model_raw": lambda: clean_model(dict(raw_nodes), {line_id: {**line} for line_id, line in raw_lines.items()}),
+        "render_frame_elements": lambda: render_frame_elements(lines, nodes, COLORS, SECTION_SIZES, COLOR_BY),
+        "render_frame_glb": lambda: render_frame_glb(
+            lines, nodes, COLORS, SECTION_SIZES, COLOR_BY, nodes_with_load=nodes_with_load, load_magnitude=point_load
+        ),
+        "mass_co2_from_model": lambda: mass_co2_from_model(lines, nodes, sections_db, SECTION),
+        "generate_variants": lambda: generate_variants(params),
+        # The worker creating and analyzing a model, then editing its load, on the in-process ETABS stand-in
+        "etabs_worker": lambda: run_models(start_fake_etabs()[0], worker_models),
+        "batch_takeoff": lambda: batch_takeoff(
+            depths, case["x_bay_width"], case["y_bay_width"], joists, case["joist_n_diags"], weight_per_meter=weight_per_meter
+        ),
+    }
+    return {name: function for name, function in functions.items() if len(lines) <= MAX_MEMBERS.get(name, len(lines))}
+
+
+def run(case_names: list[str], repeats: int = DEFAULT_REPEATS, stage_names: list[str] | None = None) -> dict:
+    """{"case/stage": measurement} of the selected cases and stages"""
+    results = {}
+    for case_name in case_names:
+        for stage_name, function in stages(CASES[case_name]).items():
+            if stage_names is None or stage_name in stage_names:
+                results[f"{case_name}/{stage_name}"] = measure(function, repeats)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list[dict]:
+    """Rows of every benchmark with its baseline, and whether it slowed down by more than threshold (0.25 is 25%)"""
+    rows = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        ratio = result["seconds"] / reference["seconds"] if reference else None
+        memory_ratio = result["peak_bytes"] / reference["peak_bytes"] if reference and reference["peak_bytes"] else None
+        rows.append(
+            {
+                "name": name,
+                "seconds": result["seconds"],
+                "peak_bytes": result["peak_bytes"],
+                "ratio": ratio,
+                "memory_ratio": memory_ratio,
+                "slowdown": ratio is not None and ratio > 1 + threshold,
+            }
+        )
+    return rows
+
+
+def load_baseline(path: Path = BASELINE_PATH) -> dict:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())["benchmarks"]
+
+
+def save_baseline(results: dict, path: Path = BASELINE_PATH) -> None:
+    # Updating a subset keeps the other entries
+    benchmarks = {**load_baseline(path), **results}
+    document = {"machine": {"python": platform.python_version(), "platform": platform.platform()}, "benchmarks": benchmarks}
+    path.write_text(json.dumps(document, indent=2, sort_keys=True) + "\n")
+
+
+def format_rows(rows: list[dict]) -> str:
+    lines = [f"{'benchmark':<36}{'time [ms]':>12}{'peak [MB]':>12}{'vs base':>10}{'mem vs base':>13}"]
+    for row in rows:
+        ratio = f"{row['ratio']:.2f}x" if row["ratio"] is not None else "new"
+        memory_ratio = f"{row['memory_ratio']:.2f}x" if row["memory_ratio"] is not None else "new"
+        flag = "  SLOWER" if row["slowdown"] else ""
+        lines.append(
+            f"{row['name']:<36}{1000 * row['seconds']:>12.2f}{row['peak_bytes'] / 2**20:>12.2f}{ratio:>10}{memory_ratio:>13}{flag}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--case", action="append", choices=sorted(CASES), help="case to run, all cases if not given")
+    parser.add_argument("--stage", action="append", help="stage to run, all stages if not given")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown, 0.25 is 25%%")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update", action="store_true", help="store the results as the baseline")
+    args = parser.parse_args(argv)
+
+    results = run(args.case or list(CASES), args.repeats, args.stage)
+    rows = compare(results, load_baseline(args.baseline), args.threshold)
+    print(format_rows(rows))
+    if args.update:
+        save_baseline(results, args.baseline)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    slowdowns = [row["name"] for row in rows if row["slowdown"]]
+    if slowdowns:
+        print(f"{len(slowdowns)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
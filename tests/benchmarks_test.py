@@ -0,0 +1,46 @@
+from app.components.clean_model import clean_model
+from app.optimization import COLUMN_HEIGHT
+from app.structure import generate_model
+from tests.benchmarks.run import AREA_LOAD, TRUSS_DEPTH, compare, load_baseline, main, measure, raw_geometry, run, save_baseline
+
+
+def test_measure_reports_time_and_peak_memory():
+    result = measure(lambda: bytearray(2**20), repeats=3)
+
+    assert 0 < result["seconds"] <= result["median_seconds"]
+    assert result["peak_bytes"] >= 2**20
+
+
+def test_slowdowns_beyond_the_threshold_are_flagged(tmp_path):
+    results = run(["small"], repeats=1, stage_names=["generate_model", "batch_takeoff"])
+    assert set(results) == {"small/generate_model", "small/batch_takeoff"}
+
+    path = tmp_path / "baseline.json"
+    save_baseline(results, path)
+    baseline = load_baseline(path)
+    slower = {name: {**result, "seconds": 1.3 * result["seconds"]} for name, result in results.items()}
+    rows = compare({**slower, "small/new": results["small/batch_takeoff"]}, baseline, threshold=0.25)
+
+    assert [row["slowdown"] for row in rows] == [True, True, False]
+    assert rows[-1]["ratio"] is None
+    assert not any(row["slowdown"] for row in compare(slower, baseline, threshold=0.5))
+
+
+def test_main_exit_code(tmp_path):
+    path = tmp_path / "baseline.json"
+    arguments = ["--case", "small", "--stage", "clean_model", "--repeats", "1", "--baseline", str(path)]
+    assert main([*arguments, "--update"]) == 0
+    save_baseline({"small/clean_model": {"seconds": 1e-9, "median_seconds": 1e-9, "peak_bytes": 1}}, path)
+    assert main(arguments) == 1
+
+
+def test_raw_geometry_cleans_back_to_the_model():
+    nodes, lines, *_ = generate_model(TRUSS_DEPTH, 8000, 14000, 7, COLUMN_HEIGHT, 8, AREA_LOAD)
+    raw_nodes, raw_lines = raw_geometry(nodes, lines)
+    assert len(raw_nodes) == 2 * len(lines)
+
+    clean_nodes, clean_lines = clean_model(raw_nodes, raw_lines)
+    assert len(clean_nodes) == len(nodes)
+    joints = {tuple(round(node[axis]) for axis in "xyz") for node in nodes.values()}
+    assert {tuple(round(node[axis]) for axis in "xyz") for node in clean_nodes.values()} == joints
+    assert all(line["nodeI"] in clean_nodes and line["nodeJ"] in clean_nodes for line in clean_lines.values())
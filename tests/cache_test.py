@@ -0,0 +1,29 @@
+from app.cache import LRUCache, canonical_hash
+from app.structure import GEOMETRY_CACHE, cached_generate_model, generate_model
+
+
+def test_lru_eviction_and_counters():
+    cache = LRUCache(maxsize=2, max_weight=10, weigher=len)
+    cache.put("a", "xxxx")
+    cache.put("b", "yyyy")
+    assert cache.get("a") == "xxxx"
+    cache.put("c", "zzzz")  # over max_weight, evicts the least recently used "b"
+
+    assert "b" not in cache and "a" in cache
+    assert cache.get("b") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 2, "weight": 8}
+
+
+def test_canonical_hash_ignores_key_order_and_key_types():
+    assert canonical_hash({1: (1.0, 2), "b": [3]}) == canonical_hash({"b": [3], "1": [1.0, 2]})
+
+
+def test_load_change_reuses_geometry():
+    GEOMETRY_CACHE.clear()
+    hits = GEOMETRY_CACHE.hits
+    first = cached_generate_model(600, 8000, 14000, 7, 6000, 8, 5)
+    second = cached_generate_model(600, 8000, 14000, 7, 6000, 8, 3)
+
+    assert GEOMETRY_CACHE.hits == hits + 1
+    assert second == generate_model(600, 8000, 14000, 7, 6000, 8, 3)
+    assert first[0] is not second[0]
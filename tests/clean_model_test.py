@@ -0,0 +1,69 @@
+import numpy as np
+
+import app.components.clean_model as clean_model_module
+from app.components.clean_model import clean_model, merge_coincident_nodes
+
+
+def test_merges_nodes_a_few_ulps_apart():
+    x = 0.1 + 0.2
+    nodes = {
+        1: {"id": 1, "x": 0.3, "y": 0.0, "z": 0.0},
+        2: {"id": 2, "x": 1.0, "y": 0.0, "z": 0.0},
+        3: {"id": 3, "x": x, "y": 0.0, "z": 0.0},
+    }
+    lines = {1: {"id": 1, "nodeI": 3, "nodeJ": 2, "component": None}}
+    nodes, lines = clean_model(nodes, lines)
+
+    assert list(nodes) == [1, 2]
+    assert lines[1]["nodeI"] == 1
+
+
+def test_merges_nodes_on_both_sides_of_a_grid_boundary():
+    # Rounding to the grid of spacing 1e-6 puts these nodes in neighbouring cells
+    coords = np.array([[4.999e-7, 0, 0], [5.001e-7, 0, 0], [3, -4.999e-7, 4.999e-7], [3, -5.001e-7, 5.001e-7], [3, 0, 0.1]])
+    replacement, n_merged = merge_coincident_nodes(coords, np.array([5, 2, 3, 4, 1]))
+
+    assert n_merged == 2
+    assert replacement.tolist() == [1, 1, 2, 2, 4]
+
+
+def test_hash_collisions_fall_back_to_lexsort(monkeypatch):
+    rng = np.random.default_rng(0)
+    coords = rng.integers(0, 5, (200, 3)).astype(float)
+    node_ids = rng.permutation(200) + 1
+    expected, expected_merged = merge_coincident_nodes(coords, node_ids)
+
+    monkeypatch.setattr(clean_model_module, "_HASH_MULTIPLIERS", np.zeros(3, dtype=np.uint64))
+    replacement, n_merged = merge_coincident_nodes(coords, node_ids)
+
+    assert n_merged == expected_merged == 200 - len(np.unique(coords, axis=0))
+    assert np.array_equal(replacement, expected)
+    assert np.all(node_ids[replacement] <= node_ids)
+
+
+def test_merges_nodes_in_neighbouring_cells_away_from_whole_micrometres():
+    coords = np.array([[1 + 4.999e-7, 2, 0], [1 + 5.001e-7, 2, 0], [1 + 2.5e-6, 2, 0]])
+    replacement, n_merged = merge_coincident_nodes(coords, np.array([3, 1, 2]))
+
+    assert n_merged == 1
+    assert replacement.tolist() == [1, 1, 2]
+
+
+def test_many_exact_duplicates():
+    rng = np.random.default_rng(0)
+    points = np.vstack([rng.uniform(0, 1e4, (9, 3)), [[5e-7, 0, 0]]])
+    coords = np.repeat(points, 10_000, axis=0)
+    # Half of the copies of the last point round to the neighbouring cell
+    coords[-5_000:, 0] += 1e-12
+    coords[-10_000:-5_000, 0] -= 1e-12
+    node_ids = rng.permutation(len(coords))
+    replacement, n_merged = merge_coincident_nodes(coords, node_ids)
+
+    assert n_merged == len(coords) - 10
+    assert len(np.unique(replacement)) == 10
+    assert np.allclose(coords[replacement], coords, rtol=0, atol=1e-6)
+    assert np.all(node_ids[replacement] <= node_ids)
+
+    replacement, n_merged = merge_coincident_nodes(np.zeros((20_000, 3)), np.arange(20_000))
+    assert n_merged == 19_999
+    assert not replacement.any()
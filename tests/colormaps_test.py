@@ -0,0 +1,21 @@
+import numpy as np
+
+from app.colormaps import color_table, map_colors
+
+
+def test_jet_bands_match_matplotlib_reference():
+    # Colors of ListedColormap(plt.get_cmap("jet")(np.linspace(0, 1, 30))), truncated to 0-255
+    table = color_table("jet", 30)
+    assert table.shape == (30, 3)
+    assert table[0].tolist() == [0, 0, 127]
+    assert table[11].tolist() == [24, 255, 221]
+    assert table[-1].tolist() == [127, 0, 0]
+
+
+def test_map_colors_clips_and_handles_zero_and_nan():
+    colors = map_colors([-1.0, 0.0, 10.0, 20.0, np.nan], 10.0)
+    table = color_table("jet", 30)
+
+    assert colors[:4].tolist() == [table[0].tolist(), table[0].tolist(), table[-1].tolist(), table[-1].tolist()]
+    assert colors[4].tolist() == [0, 0, 0]
+    assert map_colors([5.0], 0).tolist() == [table[0].tolist()]
@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+
+from app.dispatch import PartialResultsError, ShardedDispatcher, shard_count, split_shards
+
+
+def test_split_shards_balances_sizes():
+    shards = split_shards([5, 1, 4, 2, 3, 3], 3)
+
+    assert sorted(index for shard in shards for index in shard) == list(range(6))
+    assert sorted(sum([5, 1, 4, 2, 3, 3][index] for index in shard) for shard in shards) == [6, 6, 6]
+    assert shard_count([100] * 10, max_shards=4, target_shard_size=250) == 4
+    assert shard_count([100] * 10, max_shards=4, target_shard_size=1000) == 1
+
+
+def test_dispatch_runs_shards_concurrently_in_order():
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def run_shard(models):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.pop()
+        return [{"index": model["index"]} for model in models]
+
+    models = [{"index": index, "lines": {line: None for line in range(10 + index)}} for index in range(12)]
+    dispatcher = ShardedDispatcher(run_shard, max_shards=4, target_shard_size=10)
+
+    assert dispatcher.run(models) == [{"index": index} for index in range(12)]
+    assert len(dispatcher.shard_timings) == 4 and max(peak) > 1
+    assert sum(timing["models"] for timing in dispatcher.shard_timings) == 12
+
+
+def test_failed_shard_keeps_results_of_other_shards():
+    def run_shard(models):
+        if any(model["index"] == 3 for model in models):
+            raise RuntimeError("worker timed out")
+        return [{"index": model["index"]} for model in models]
+
+    models = [{"index": index, "lines": {line: None for line in range(10)}} for index in range(4)]
+    failed_shard = next(shard for shard in split_shards([10] * 4, 2) if 3 in shard)
+    with pytest.raises(PartialResultsError) as error:
+        ShardedDispatcher(run_shard, max_shards=2, target_shard_size=10).run(models)
+
+    assert sorted(error.value.completed) == [index for index in range(4) if index not in failed_shard]
+    assert isinstance(error.value.cause, RuntimeError)
@@ -0,0 +1,114 @@
+import json
+import socket
+import threading
+
+import pytest
+
+from app.etabs_server import EtabsJobServer, submit_job
+from app.fake_etabs import start_fake_etabs
+from app.frame_solver import analyze_model
+from app.run_etabs_model import run_n_times
+from tests.fake_etabs_test import worker_model
+
+
+@pytest.fixture
+def server():
+    engines = []
+
+    def start():
+        EtabsObject, EtabsEngine = start_fake_etabs()
+        engines.append(EtabsEngine)
+        return EtabsObject, EtabsEngine
+
+    server = EtabsJobServer(("localhost", 0), instances=1, max_jobs=2, start=start)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.engines = engines
+    yield server
+    server.close()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+
+
+def test_instances_are_reused_and_recycled(server):
+    model = worker_model(600)
+    for _ in range(3):
+        results = submit_job(server.address, [model])
+        assert results[0]["max_defo"] == pytest.approx(analyze_model(model)["max_defo"])
+
+    # The second job reuses the running instance, which is restarted after two jobs
+    first, second = server.engines
+    assert first.calls["InitializeNewModel"] == 2 and first.calls["ApplicationExit"] == 1
+    assert second.calls["ApplicationStart"] == 1 and second.running
+
+
+def test_failed_jobs_restart_the_instance(server):
+    with pytest.raises(RuntimeError, match="KeyError"):
+        submit_job(server.address, [{"nodes": {}}])
+    assert sum(instance.restarts for instance in server.instances) == 1
+    assert submit_job(server.address, [worker_model(600)])[0]["max_defo"] < 0
+
+
+def test_worker_forwards_its_job(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "inputs.json").write_text(json.dumps([worker_model(600), worker_model(900)]))
+
+    def start():
+        raise AssertionError("The worker must not start ETABS when the server runs")
+
+    run_n_times(start, server_address=f"{server.address[0]}:{server.address[1]}")
+
+    results = json.loads((tmp_path / "output.json").read_text())
+    assert len(results) == 2 and [entry["name"] for entry in results[0]["timings"]][:2] == ["read_inputs", "start_etabs"]
+    assert len((tmp_path / "output.jsonl").read_text().splitlines()) == 2
+
+
+def test_worker_starts_etabs_without_server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "inputs.json").write_text(json.dumps([worker_model(600)]))
+    with socket.socket() as unused:
+        unused.bind(("localhost", 0))
+        port = unused.getsockname()[1]
+
+    run_n_times(start_fake_etabs, server_address=f"localhost:{port}")
+
+    assert json.loads((tmp_path / "output.json").read_text())[0]["max_defo"] < 0
+
+
+def test_worker_starts_etabs_when_the_server_drops_the_connection(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "inputs.json").write_text(json.dumps([worker_model(600)]))
+    listener = socket.create_server(("localhost", 0))
+
+    def drop_connection():
+        connection, _ = listener.accept()
+        connection.close()
+
+    thread = threading.Thread(target=drop_connection, daemon=True)
+    thread.start()
+    with listener:
+        run_n_times(start_fake_etabs, server_address=f"localhost:{listener.getsockname()[1]}")
+    thread.join(timeout=5)
+
+    assert json.loads((tmp_path / "output.json").read_text())[0]["max_defo"] < 0
+
+
+def test_other_hosts_need_an_authkey(tmp_path):
+    with pytest.raises(ValueError, match="ETABS_SERVER_AUTHKEY"):
+        EtabsJobServer(("0.0.0.0", 0), authkey=b"")
+
+
+def test_checkpoint_stays_on_the_client(server, tmp_path):
+    checkpoint_path = tmp_path / "output.jsonl"
+    # The second model fails when its results are read: its loaded node does not exist
+    models = [worker_model(600), {**worker_model(600, n_diagonals=5), "nodes_with_load": [99999]}]
+
+    with pytest.raises(RuntimeError, match="KeyError"):
+        submit_job(server.address, models, str(checkpoint_path))
+
+    # The finished model is checkpointed here and not analyzed again on resubmission
+    assert [json.loads(line)["index"] for line in checkpoint_path.read_text().splitlines()] == [0]
+    with pytest.raises(RuntimeError):
+        submit_job(server.address, models, str(checkpoint_path))
+    assert server.engines[-1].calls["PointObj.AddCartesian"] == len(models[1]["nodes"])
+    assert not any(server.instances[0].job_root.glob("*/output.jsonl"))
@@ -0,0 +1,39 @@
+import json
+
+from app.cache import canonical_hash
+from app.exchange import pack_models, pack_results, unpack_models, unpack_results
+from app.frame_solver import analyze_model
+from app.structure import ModelTemplate
+
+
+def worker_models() -> list[dict]:
+    template = ModelTemplate(x_bay_width=8000, y_bay_width=14000, n_diagonals=3, columns_height=6000, joist_n_diags=4)
+    models = []
+    for truss_depth in (600, 900, 3000):
+        nodes, lines, nodes_with_load, supports, point_load = template.instantiate(truss_depth, 5)
+        models.append(
+            {
+                "nodes": nodes,
+                "lines": lines,
+                "nodes_with_load": nodes_with_load,
+                "supports": supports,
+                "load_magnitud": point_load,
+                "section_name": "SHS50X3",
+                "section_props": {"depth": 50, "thickness": 3},
+            }
+        )
+    return models
+
+
+def test_models_round_trip_like_json():
+    models = worker_models()
+    unpacked = unpack_models(pack_models(models))
+
+    assert unpacked == json.loads(json.dumps(models))
+    # The worker checkpoints results under the hash of the unpacked model
+    assert [canonical_hash(model) for model in unpacked] == [canonical_hash(model) for model in models]
+
+
+def test_results_round_trip_like_json():
+    results = [analyze_model(model) for model in worker_models()[:2]]
+    assert unpack_results(pack_results(results)) == json.loads(json.dumps(results))
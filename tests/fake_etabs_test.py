@@ -0,0 +1,117 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.fake_etabs import start_fake_etabs
+from app.frame_solver import analyze_model
+from app.run_etabs_model import plan_batches, run_models, run_n_times, run_parallel
+from app.structure import generate_model
+from app.timing import Timer
+from app.visualization import sections_db
+
+
+def worker_model(truss_depth, n_diagonals=7):
+    nodes, lines, nodes_with_load, supports, point_load = generate_model(truss_depth, 8000, 14000, n_diagonals, 6000, 8, 5)
+    model = {
+        "nodes": nodes,
+        "lines": lines,
+        "nodes_with_load": nodes_with_load,
+        "load_magnitud": point_load,
+        "supports": supports,
+        "section_name": "SHS50X3",
+        "section_props": sections_db["SHS50X3"],
+    }
+    # As the worker reads it from inputs.json
+    return json.loads(json.dumps(model))
+
+
+def test_worker_results_match_the_local_solver():
+    models = [worker_model(600), worker_model(900), worker_model(600, n_diagonals=5)]
+    EtabsObject, EtabsEngine = start_fake_etabs()
+
+    results = run_models(EtabsObject, models)
+
+    for model, result in zip(models, results, strict=True):
+        expected = analyze_model(model)
+        assert np.isclose(result["max_defo"], expected["max_defo"])
+        assert np.allclose(result["joint_displacements"]["u3"], expected["joint_displacements"]["u3"])
+        assert np.allclose(result["reactions"]["f3"], expected["reactions"]["f3"])
+        assert np.allclose(result["frame_forces"]["p"], expected["frame_forces"]["p"])
+    # The second model edits the first in place: only its moved joints, no new points or frames
+    n_points = len(models[0]["nodes"]) + len(models[2]["nodes"])
+    assert EtabsEngine.calls["PointObj.AddCartesian"] == n_points
+    assert EtabsEngine.calls["EditPoint.ChangeCoordinates_1"] > 0
+    # One analysis per model
+    assert EtabsEngine.calls["Analyze.RunAnalysis"] == len(models)
+
+
+def test_run_n_times_with_injected_engine(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "inputs.json").write_text(json.dumps([worker_model(600)]))
+    engines = []
+
+    def start():
+        EtabsObject, EtabsEngine = start_fake_etabs(call_latency={"Analyze.RunAnalysis": 0.01})
+        engines.append(EtabsEngine)
+        return EtabsObject, EtabsEngine
+
+    run_n_times(start)
+
+    output = json.loads((tmp_path / "output.json").read_text())
+    assert len(output) == 1 and output[0]["max_defo"] < 0
+    assert not engines[0].running and engines[0].round_trips > len(output[0]["deformations"])
+
+
+def test_plan_batches_splits_groups_over_the_instances():
+    models = [worker_model(600, n_diagonals=9), worker_model(600), worker_model(700), worker_model(800), worker_model(900)]
+
+    batches = plan_batches(models, 3)
+
+    # The group of four same-topology models is cut in parts of at most an even share, costliest batch first
+    assert batches == [[3, 4], [0], [1], [2]]
+    assert plan_batches(models[1:], 1) == [[0, 1, 2, 3]]
+    assert sorted(plan_batches(models[1:], 2)) == [[0, 1], [2, 3]]
+
+
+def test_run_parallel_matches_run_models(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    models = [worker_model(600), worker_model(900, n_diagonals=5), worker_model(700), worker_model(800)]
+    checkpoint_path = tmp_path / "output.jsonl"
+
+    results = run_parallel(start_fake_etabs, models, 2, checkpoint_path)
+
+    expected = run_models(start_fake_etabs()[0], models)
+    assert [result["max_defo"] for result in results] == [result["max_defo"] for result in expected]
+    # One working directory per instance
+    assert len(list(tmp_path.glob("instance-*"))) == 2
+    assert len(checkpoint_path.read_text().splitlines()) == len(models)
+
+
+def test_run_parallel_checkpoints_the_batches_that_finish(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # The second model is a batch of its own that fails when its results are read: its loaded node does not exist
+    models = [worker_model(600), {**worker_model(600, n_diagonals=5), "nodes_with_load": [99999]}, worker_model(700)]
+    checkpoint_path = tmp_path / "output.jsonl"
+
+    with pytest.raises(KeyError):
+        run_parallel(start_fake_etabs, models, 2, checkpoint_path)
+
+    finished = sorted(json.loads(line)["index"] for line in checkpoint_path.read_text().splitlines())
+    assert finished == [0, 2]
+
+
+def test_checkpoint_leaves_out_timings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    models = [worker_model(600), worker_model(900, n_diagonals=5)]
+
+    for name, run in (
+        ("sequential.jsonl", lambda path: run_models(start_fake_etabs()[0], models, path)),
+        ("parallel.jsonl", lambda path: run_parallel(start_fake_etabs, models, 2, path)),
+    ):
+        with Timer().activate():
+            results = run(tmp_path / name)
+
+        assert all(result["timings"] for result in results)
+        entries = [json.loads(line) for line in (tmp_path / name).read_text().splitlines()]
+        assert len(entries) == len(models) and not any("timings" in entry["result"] for entry in entries)
@@ -0,0 +1,44 @@
+import numpy as np
+
+from app.components.array_model import ArrayModel
+from app.frame_solver import YOUNGS_MODULUS, analyze_model, solve_frame, tube_section_properties
+from app.structure import generate_model
+from app.visualization import sections_db
+
+
+def test_inclined_cantilever_matches_closed_form():
+    section = tube_section_properties(depth=100, thickness=5)
+    direction = np.array([1.0, 2.0, 3.0]) / np.sqrt(14)
+    n_elements, length, force = 8, 2000, 1000
+    coords = np.outer(np.linspace(0, length, n_elements + 1), direction)
+    rows = np.arange(n_elements + 1)
+    model = ArrayModel(rows, coords, rows[:-1], np.column_stack([rows[:-1], rows[1:]]), np.zeros(n_elements))
+
+    perpendicular = np.cross(direction, [0, 0, 1])
+    perpendicular /= np.linalg.norm(perpendicular)
+    loads = np.zeros((n_elements + 1, 6))
+    loads[-1, :3] = force * perpendicular
+    restrained = np.zeros((n_elements + 1, 6), dtype=bool)
+    restrained[0] = True
+
+    tip = solve_frame(model, section, loads, restrained)["displacements"][-1, :3] @ perpendicular
+    assert np.isclose(tip, force * length**3 / (3 * YOUNGS_MODULUS * section["Iy"]))
+
+
+def test_analyze_model_payload():
+    nodes, lines, nodes_with_load, supports, point_load = generate_model(600, 8000, 14000, 7, 6000, 8, 5)
+    data = {
+        "nodes": nodes,
+        "lines": lines,
+        "nodes_with_load": nodes_with_load,
+        "supports": supports,
+        "load_magnitud": point_load,
+        "section_props": sections_db["SHS50X3"],
+    }
+    result = analyze_model(data)
+
+    assert set(result["deformations"]) == {str(node_id) for node_id in nodes}
+    assert result["max_defo"] == min(result["deformations"][str(node_id)] for node_id in nodes_with_load) < 0
+    assert all(result["deformations"][str(node_id)] == 0 for node_id in supports)
+    assert np.isclose(sum(result["reactions"]["f3"]), point_load * len(nodes_with_load))
+    assert len(result["frame_forces"]["p"]) == 2 * len(lines)
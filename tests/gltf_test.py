@@ -0,0 +1,75 @@
+import json
+import struct
+
+import numpy as np
+
+from app.colormaps import map_colors
+from app.gltf import MeshGroup, prisms, to_glb
+from app.visualization import DEFORMATION_BANDS, DEFORMATION_COLORMAP, render_frame_glb
+
+
+def read_glb(glb: bytes) -> tuple[dict, bytes]:
+    magic, version, length = struct.unpack_from("<III", glb)
+    assert (magic, version, length) == (0x46546C67, 2, len(glb))
+    json_length, _ = struct.unpack_from("<II", glb, 12)
+    binary_length, _ = struct.unpack_from("<II", glb, 20 + json_length)
+    return json.loads(glb[20 : 20 + json_length]), glb[28 + json_length : 28 + json_length + binary_length]
+
+
+def test_prisms_are_split_into_16_bit_primitives():
+    starts = np.column_stack([np.arange(10000.0), np.zeros(10000), np.zeros(10000)])
+    positions, indices = prisms(starts, starts + [0, 0, 1000], 50)
+    group = MeshGroup("members")
+    group.add(positions, indices, np.tile([[255, 0, 0], [0, 0, 255]], (5000, 1)), vertices_per_part=8)
+
+    document, binary = read_glb(to_glb([group, MeshGroup("empty", opacity=0.5)]))
+
+    primitives = document["meshes"][0]["primitives"]
+    assert len(document["meshes"]) == 1 and len(primitives) == 2
+    counts = [document["accessors"][primitive["attributes"]["POSITION"]]["count"] for primitive in primitives]
+    assert counts == [65536, 80000 - 65536]
+    assert sum(document["accessors"][primitive["indices"]]["count"] for primitive in primitives) == 10000 * 24
+
+    # Indices of the second primitive restart at 0 and stay within its vertices
+    view = document["bufferViews"][document["accessors"][primitives[1]["indices"]]["bufferView"]]
+    second = np.frombuffer(binary, dtype=np.uint16, count=view["byteLength"] // 2, offset=view["byteOffset"])
+    assert second.min() == 0 and second.max() == counts[1] - 1
+
+
+def test_part_ids_follow_the_primitive_split():
+    starts = np.column_stack([np.arange(10000.0), np.zeros(10000), np.zeros(10000)])
+    positions, indices = prisms(starts, starts + [0, 0, 1000], 50)
+    group = MeshGroup("members")
+    group.add(positions, indices, (255, 0, 0), vertices_per_part=8, ids=np.arange(1, 10001))
+    group.add(*prisms(starts[:2], starts[:2] + 1, 50), (0, 0, 255), vertices_per_part=8)
+
+    document, _ = read_glb(to_glb([group]))
+
+    parts = [primitive["extras"]["parts"] for primitive in document["meshes"][0]["primitives"]]
+    assert [[(part["first_vertex"], part["vertices_per_part"], len(part["ids"])) for part in piece] for piece in parts] == [
+        [(0, 8, 8192)],
+        [(0, 8, 10000 - 8192)],
+    ]
+    assert parts[0][0]["ids"][:2] == [1, 2] and parts[1][0]["ids"][-1] == 10000
+
+
+def test_deformed_members_are_colored_per_vertex():
+    nodes = {
+        1: {"id": 1, "x": 0.0, "y": 0.0, "z": 0.0, "deformation": 0.0},
+        2: {"id": 2, "x": 1000.0, "y": 0.0, "z": 0.0, "deformation": 10.0},
+        3: {"id": 3, "x": 2000.0, "y": 0.0, "z": 0.0, "deformation": 0.0},
+    }
+    lines = {
+        7: {"id": 7, "nodeI": 1, "nodeJ": 2, "component": "Truss"},
+        9: {"id": 9, "nodeI": 2, "nodeJ": 3, "component": "Truss"},
+    }
+    glb = render_frame_glb(lines, nodes, {}, {"Truss": 60}, "component", deformation=True, max_defo=10.0)
+
+    document, binary = read_glb(glb)
+    primitive = document["meshes"][0]["primitives"][0]
+    view = document["bufferViews"][document["accessors"][primitive["attributes"]["COLOR_0"]]["bufferView"]]
+    colors = np.frombuffer(binary, dtype=np.uint8, count=view["byteLength"], offset=view["byteOffset"]).reshape(-1, 4)
+    low, high = map_colors([0.0, 10.0], 10.0, DEFORMATION_COLORMAP, DEFORMATION_BANDS)
+    expected = np.concatenate([np.tile(low, (4, 1)), np.tile(high, (8, 1)), np.tile(low, (4, 1))])
+    assert np.array_equal(colors[:16, :3], expected)
+    assert [part["ids"] for part in primitive["extras"]["parts"]] == [[7, 9], [1, 2, 3]]
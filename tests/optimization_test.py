@@ -0,0 +1,129 @@
+import numpy as np
+import plotly.graph_objects as go
+
+from app import optimization
+from app.optimization import batch_takeoff, mass_co2_from_model, search_min_feasible_depth, surrogate_screen
+from app.structure import generate_model
+from app.visualization import sections_db
+
+
+def test_search_finds_min_feasible_depth_in_batched_rounds():
+    # Displacement inversely proportional to depth and to the number of joists: feasible from 1800 / joist mm
+    rounds = []
+
+    def evaluate(probes):
+        rounds.append(probes)
+        return [180000 / (depth * joist) for joist, depth in probes]
+
+    optimum, probed = search_min_feasible_depth([1, 2, 3, 10], 300, 1200, allowable=100, tolerance=5, evaluate=evaluate)
+
+    assert optimum[1] is None
+    assert 900 <= optimum[2] <= 905
+    assert 600 <= optimum[3] <= 605
+    assert optimum[10] == 300
+    # After bracketing, every round probes each joist count at most once, far fewer analyses than a 5 mm grid
+    assert all(len({joist for joist, _ in probes}) == len(probes) for probes in rounds[1:])
+    assert len(probed) < 30
+
+
+def surrogate_variants():
+    return [
+        {"joist_value": joist, "truss_depth_value": depth, "x_bay_width": 8000, "y_bay_width": 14000, "area_load": 5}
+        for joist in range(3, 11)
+        for depth in range(600, 2001, 50)
+    ]
+
+
+def surrogate_displacement(variant):
+    return 4e7 / (variant["truss_depth_value"] ** 1.8 * variant["joist_value"] ** 0.4)
+
+
+def test_surrogate_screen_classifies_unanalyzed_variants():
+    variants = surrogate_variants()
+
+    analyzed, predicted, uncertain = surrogate_screen(
+        variants, 20, lambda batch: [surrogate_displacement(variant) for variant in batch]
+    )
+
+    assert len(analyzed) < len(variants) / 4
+    assert uncertain == {}
+    assert set(analyzed) | set(predicted) == set(range(len(variants)))
+    assert all((value > 20) == (surrogate_displacement(variants[index]) > 20) for index, value in predicted.items())
+
+
+def test_surrogate_screen_returns_the_variants_it_could_not_classify():
+    variants = surrogate_variants()
+
+    # The seed round alone cannot classify every variant with such a confidence
+    analyzed, predicted, uncertain = surrogate_screen(
+        variants, 20, lambda batch: [surrogate_displacement(variant) for variant in batch], max_rounds=1, confidence=50
+    )
+
+    assert uncertain
+    assert set(analyzed) | set(predicted) | set(uncertain) == set(range(len(variants)))
+    assert not set(uncertain) & (set(analyzed) | set(predicted))
+
+
+def test_surrogate_screen_starts_from_known_displacements():
+    variants = surrogate_variants()
+    known = {index: surrogate_displacement(variants[index]) for index in range(0, len(variants), 20)}
+    evaluated = []
+
+    def evaluate(batch):
+        evaluated.extend(variant["truss_depth_value"] for variant in batch)
+        return [surrogate_displacement(variant) for variant in batch]
+
+    analyzed, predicted, uncertain = surrogate_screen(variants, 20, evaluate, known=known)
+
+    # No seed round, and the known variants are not analyzed again
+    assert len(evaluated) == len(analyzed) - len(known) < len(variants) / 4
+    assert known.items() <= analyzed.items()
+    assert set(analyzed) | set(predicted) | set(uncertain) == set(range(len(variants)))
+
+
+def test_batch_takeoff_matches_generated_models():
+    weight_per_meter = sections_db["SHS50X3"]["weight/m"]
+    depths = np.array([600, 1234.5, 3000])
+    mass, count, co2 = batch_takeoff(depths, 8000, 14000, 7, 8, 6000, weight_per_meter)
+
+    for index, truss_depth in enumerate(depths):
+        nodes, lines, *_ = generate_model(truss_depth, 8000, 14000, 7, 6000, 8, 5)
+        expected = mass_co2_from_model(lines, nodes, sections_db, "SHS50X3")
+        assert np.allclose((mass[index], count[index], co2[index]), expected)
+
+
+def test_chart_is_rendered_in_memory_and_cached(monkeypatch, tmp_path):
+    renders = []
+
+    def to_image(fig, format):
+        renders.append(fig)
+        return b"\x89PNG" + bytes(len(renders))
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(optimization, "start_renderer", lambda: None)
+    monkeypatch.setattr(go.Figure, "to_image", to_image)
+    optimization.CHART_CACHE.clear()
+    variants = [{"joist_value": joist, "truss_depth_value": depth} for depth in (900, 300, 600) for joist in (4, 3)]
+    results = [{"max_defo": -depth / joist} for depth in (900, 300, 600) for joist in (4, 3)]
+
+    first = optimization.plot_displacement_vs_truss_depth(variants, results, 150)
+    assert optimization.plot_displacement_vs_truss_depth(variants, results, 150) == first
+    assert optimization.plot_displacement_vs_truss_depth(variants, results, 120) != first
+    assert len(renders) == 2 and not any(tmp_path.iterdir())
+
+    # One trace per joist number sorted by truss depth, and the allowable displacement line
+    traces = renders[0].data
+    assert [trace.name for trace in traces] == ["Joist Number 2", "Joist Number 3", "Allowable Displacement"]
+    assert list(traces[0].x) == [300, 600, 900] and list(traces[0].y) == [100, 200, 300]
+    assert list(traces[1].marker.color) == ["green", "green", "red"]
+
+
+def test_chart_marks_each_status():
+    variants = [{"joist_value": 4, "truss_depth_value": depth} for depth in (300, 600, 900, 1200)]
+    results = [{"max_defo": -30000 / depth} for depth in (300, 600, 900, 1200)]
+    statuses = ["Analyzed", "Minimum feasible", "Predicted", "Uncertain"]
+
+    trace = optimization.displacement_chart(variants, results, 60, statuses).data[0]
+
+    assert list(trace.marker.symbol) == ["circle", "star", "circle-open", "diamond-open"]
+    assert list(trace.marker.size) == [6, 14, 6, 6]
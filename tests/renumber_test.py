@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from app.components.model import Model
+from app.components.renumber import NodeNumbering, bandwidth, rcm_order
+from app.frame_solver import analyze_model
+from app.structure import create_components, generate_array_model
+from tests.fake_etabs_test import worker_model
+
+
+def test_node_numbering_maps_both_ways():
+    numbering = NodeNumbering([40, 7, 12])
+
+    assert numbering.index([12, 40]).tolist() == [2, 0]
+    assert numbering.ids([1, 2]).tolist() == [7, 12]
+    with pytest.raises(KeyError):
+        numbering.index([8])
+
+
+def test_rcm_order_of_a_chain():
+    # A chain numbered 0-3-1-4-2 along its members gets consecutive indices
+    connectivity = np.array([[0, 3], [3, 1], [1, 4], [4, 2]])
+    order = rcm_order(5, connectivity)
+    new_index = np.argsort(order)
+
+    assert sorted(order.tolist()) == list(range(5))
+    assert bandwidth(new_index[connectivity]) == 1
+
+
+def test_generated_model_is_renumbered():
+    merged = Model(components=create_components(900, 30000, 14000, 20, 6000, 12)).build_arrays()
+    merged.merge_coincident_nodes()
+    model, *_ = generate_array_model(900, 30000, 14000, 20, 6000, 12, 5)
+
+    assert bandwidth(model.connectivity) < bandwidth(merged.connectivity) / 10
+    # Same nodes and members under the same IDs, only the rows moved
+    assert sorted(model.node_ids.tolist()) == sorted(merged.node_ids.tolist())
+    assert {tuple(ends) for ends in model.end_node_ids().tolist()} == {tuple(ends) for ends in merged.end_node_ids().tolist()}
+
+
+def test_node_order_does_not_change_results():
+    model = worker_model(800)
+    reversed_model = {**model, "nodes": dict(reversed(model["nodes"].items()))}
+
+    result, expected = analyze_model(reversed_model), analyze_model(model)
+
+    assert np.isclose(result["max_defo"], expected["max_defo"])
+    assert all(np.isclose(result["deformations"][node_id], value) for node_id, value in expected["deformations"].items())
@@ -0,0 +1,168 @@
+import sqlite3
+
+from contextlib import closing
+from types import SimpleNamespace
+
+import pytest
+
+import app.result_store as result_store
+
+from app.backends import BACKENDS, AnalysisBackend
+from app.controller import Controller
+from app.dispatch import PartialResultsError
+from app.result_store import ResultStore
+
+
+def test_get_put_and_version_invalidation(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite", version="a")
+    store.put_many(["k1", "k2"], [{"max_defo": -1.0}, {"max_defo": -2.0}], [{"joist_value": 7, "section_name": "SHS50X3"}, None])
+
+    assert store.get_many(["k2", "k3"]) == {"k2": {"max_defo": -2.0}}
+    assert store.find(joist_value=7) == [
+        {
+            "design": {
+                "joist_value": 7,
+                "truss_depth_value": None,
+                "x_bay_width": None,
+                "y_bay_width": None,
+                "section_name": "SHS50X3",
+            },
+            "result": {"max_defo": -1.0},
+        }
+    ]
+    assert ResultStore(tmp_path / "results.sqlite", version="b").get_many(["k1", "k2"]) == {}
+
+
+def test_other_solvers_keep_their_results(tmp_path):
+    path = tmp_path / "results.sqlite"
+    ResultStore(path, version="etabs-v1:abc:3").put_many(["k1"], [{"max_defo": -1.0}])
+
+    ResultStore(path, version="etabs-v1-symmetric:abc:3").put_many(["k1"], [{"max_defo": -1.1}])
+    assert ResultStore(path, version="etabs-v1:abc:3").get_many(["k1"]) == {"k1": {"max_defo": -1.0}}
+    # A new section database or payload version of the same solver makes them unusable
+    ResultStore(path, version="etabs-v1:def:3")
+    assert ResultStore(path, version="etabs-v1:abc:3").get_many(["k1"]) == {}
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    store = ResultStore(tmp_path / "results.sqlite", max_bytes=40)
+    store.put_many(["old"], [{"max_defo": 1.0}])
+    store.put_many(["new"], [{"max_defo": 2.0}])
+    store.put_many(["newest"], [{"max_defo": 3.0}])
+
+    assert set(store.get_many(["old", "new", "newest"])) == {"new", "newest"}
+    assert store.size() <= 40
+
+
+def test_run_worker_only_submits_misses(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "DEFAULT_STORE_PATH", tmp_path / "results.sqlite")
+    submitted = []
+
+    class RecordingBackend(AnalysisBackend):
+        name = "recording"
+
+        def run(self, models):
+            submitted.append(models)
+            return [{"deformations": {"1": -model["geometry"] * model["load_magnitud"]}} for model in models]
+
+    monkeypatch.setitem(BACKENDS, "Recording", RecordingBackend())
+    controller = Controller()
+    models = [
+        {"geometry": 1, "nodes_with_load": [1], "load_magnitud": 2.0},
+        {"geometry": 2, "nodes_with_load": [1], "load_magnitud": 2.0},
+    ]
+    first = controller.run_worker(models, backend="Recording")
+    # Same geometries under other loads are scaled from the stored unit load results
+    second = controller.run_worker(
+        [{**models[1], "load_magnitud": 3.0}, {"geometry": 3, "nodes_with_load": [1], "load_magnitud": 1.0}, models[0]],
+        backend="Recording",
+    )
+
+    assert [result["max_defo"] for result in first] == [-2.0, -4.0]
+    assert [result["max_defo"] for result in second] == [-6.0, -3.0, -2.0]
+    assert [[model["geometry"] for model in batch] for batch in submitted] == [[1, 2], [3]]
+    assert all(model["load_magnitud"] == 1.0 for batch in submitted for model in batch)
+
+
+def test_run_worker_resubmits_unfinished_models(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "DEFAULT_STORE_PATH", tmp_path / "results.sqlite")
+    submitted = []
+
+    class CrashingBackend(AnalysisBackend):
+        name = "crashing"
+
+        def run(self, models):
+            submitted.append([model["geometry"] for model in models])
+            results = [{"deformations": {"1": -model["geometry"]}} for model in models]
+            if len(submitted) == 1:
+                # The worker finished the first model before it crashed
+                raise PartialResultsError({0: results[0]}, RuntimeError("licence lost"))
+            return results
+
+    monkeypatch.setitem(BACKENDS, "Crashing", CrashingBackend())
+    models = [{"geometry": geometry, "nodes_with_load": [1], "load_magnitud": 1.0} for geometry in (1, 2, 3)]
+    results = Controller().run_worker(models, backend="Crashing")
+
+    assert [result["max_defo"] for result in results] == [-1, -2, -3]
+    assert submitted == [[1, 2, 3], [2, 3]]
+
+
+def test_same_key_under_two_versions(tmp_path):
+    path = tmp_path / "results.sqlite"
+    ResultStore(path, version="etabs-v1:abc:5").put_many(["k1"], [{"max_defo": -1.0}])
+    ResultStore(path, version="local-frame-v1:abc:5").put_many(["k1"], [{"max_defo": -1.1}])
+
+    assert ResultStore(path, version="etabs-v1:abc:5").get_many(["k1"]) == {"k1": {"max_defo": -1.0}}
+    assert ResultStore(path, version="local-frame-v1:abc:5").get_many(["k1"]) == {"k1": {"max_defo": -1.1}}
+
+
+def test_stores_with_an_old_layout_are_emptied(tmp_path):
+    path = tmp_path / "results.sqlite"
+    with closing(sqlite3.connect(path)) as connection, connection:
+        connection.execute("CREATE TABLE results (key TEXT PRIMARY KEY, version TEXT NOT NULL, payload TEXT NOT NULL)")
+        connection.execute("INSERT INTO results VALUES ('k1', 'a', '{}')")
+
+    store = ResultStore(path, version="a")
+    assert store.get_many(["k1"]) == {}
+    store.put_many(["k1"], [{"max_defo": -1.0}])
+    assert ResultStore(path, version="a").get_many(["k1"]) == {"k1": {"max_defo": -1.0}}
+
+
+def test_backends_without_run_cannot_be_created():
+    class IncompleteBackend(AnalysisBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
+
+
+def test_stored_variants_match_the_whole_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "DEFAULT_STORE_PATH", tmp_path / "results.sqlite")
+
+    class RecordingBackend(AnalysisBackend):
+        name = "recording"
+
+        def run(self, models):
+            return [{"deformations": {str(node_id): -1.0 for node_id in model["nodes_with_load"]}} for model in models]
+
+    monkeypatch.setitem(BACKENDS, "Recording", RecordingBackend())
+    params = SimpleNamespace(
+        step_1=SimpleNamespace(section="SHS50X3"), step_2=SimpleNamespace(analysis_backend="Recording", use_symmetry=False)
+    )
+    variant = {
+        "x_bay_width": 8000,
+        "y_bay_width": 14000,
+        "joist_value": 5,
+        "joist_n_diags": 8,
+        "truss_depth_value": 900,
+        "area_load": 5,
+    }
+    Controller().run_worker(Controller.variant_models(params, [variant], {}), backend="Recording")
+
+    # Results are stored under a unit load, so other loads are found as well
+    assert Controller.stored_variants(params, [variant, {**variant, "truss_depth_value": 1000}, {**variant, "area_load": 7}], {}) == [
+        0,
+        2,
+    ]
+    # The number of joist diagonals is not one of the design columns of the store
+    assert Controller.stored_variants(params, [{**variant, "joist_n_diags": 12}], {}) == []
@@ -0,0 +1,17 @@
+from app.structure import ModelTemplate, generate_model
+
+
+def test_template_matches_generate_model():
+    template = ModelTemplate(x_bay_width=8000, y_bay_width=14000, n_diagonals=7, columns_height=6000, joist_n_diags=8)
+    # 3000 puts the bottom chord on the column mid nodes, which changes the topology
+    for truss_depth in (600, 1234.5, 3000):
+        assert template.instantiate(truss_depth, 5) == generate_model(truss_depth, 8000, 14000, 7, 6000, 8, 5)
+
+
+def test_template_ids_are_stable_across_depths():
+    template = ModelTemplate(x_bay_width=8000, y_bay_width=14000, n_diagonals=4, columns_height=6000, joist_n_diags=6)
+    shallow, *_ = template.instantiate_arrays(600, 5)
+    deep, *_ = template.instantiate_arrays(1200, 5)
+
+    assert shallow.node_ids is deep.node_ids
+    assert (shallow.coords[:, 2] != deep.coords[:, 2]).sum() == template.bottom_chord.sum()
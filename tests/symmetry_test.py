@@ -0,0 +1,90 @@
+import json
+
+import numpy as np
+
+from app.backends import LocalFrameBackend, SymmetricBackend
+from app.fake_etabs import start_fake_etabs
+from app.frame_solver import analyze_model
+from app.run_etabs_model import run_models
+from app.symmetry import DISPLACEMENT_COLUMNS, FRAME_FORCE_COLUMNS, REACTION_COLUMNS, SymmetryReduction, find_symmetry_planes
+from tests.fake_etabs_test import worker_model
+
+
+def assert_same_result(result, expected):
+    assert result["deformations"].keys() == expected["deformations"].keys()
+    assert np.isclose(result["max_defo"], expected["max_defo"])
+    for table, label, columns in (
+        ("joint_displacements", "joint", DISPLACEMENT_COLUMNS),
+        ("reactions", "joint", REACTION_COLUMNS),
+        ("frame_forces", "frame", FRAME_FORCE_COLUMNS),
+    ):
+        assert result[table][label] == expected[table][label]
+        for column in columns:
+            # Forces in N and N mm that match to round-off
+            assert np.allclose(result[table][column], expected[table][column], atol=1e-3), (table, column)
+
+
+def test_find_symmetry_planes():
+    # The 8 joist panels are symmetric about y = 7000, 8 truss panels about x = 4000 but 7 are not
+    assert find_symmetry_planes(worker_model(600, n_diagonals=8)) == [(0, 4000.0), (1, 7000.0)]
+    assert find_symmetry_planes(worker_model(600, n_diagonals=7)) == [(1, 7000.0)]
+
+    reduction = SymmetryReduction(worker_model(600, n_diagonals=7))
+    assert find_symmetry_planes(reduction.reduced) == []
+
+
+def test_quarter_model_matches_the_full_model():
+    model = worker_model(900, n_diagonals=8)
+    reduction = SymmetryReduction(model)
+
+    assert len(reduction.reduced["nodes"]) < len(model["nodes"]) / 3
+    assert set(reduction.reduced["frame_modifiers"].values()) <= {0.5, 0.25}
+    assert_same_result(reduction.expand(analyze_model(reduction.reduced)), analyze_model(model))
+
+
+def test_reduced_model_on_the_worker():
+    model = worker_model(700, n_diagonals=6)
+    reduction = SymmetryReduction(model)
+    EtabsObject, EtabsEngine = start_fake_etabs()
+
+    # As the worker reads it from inputs.json
+    result = run_models(EtabsObject, [json.loads(json.dumps(reduction.reduced))])[0]
+
+    assert EtabsEngine.calls["FrameObj.SetModifiers"] == len(reduction.reduced["frame_modifiers"])
+    assert_same_result(reduction.expand(result), analyze_model(model))
+
+
+def test_symmetric_backend():
+    models = [worker_model(600, n_diagonals=8), worker_model(600, n_diagonals=7), worker_model(600, n_diagonals=5)]
+
+    results = SymmetricBackend(LocalFrameBackend()).run(models)
+
+    for model, result in zip(models, results, strict=True):
+        assert_same_result(result, analyze_model(model))
+
+
+def test_members_crossing_a_plane_are_split():
+    # Portal frame whose beam crosses the symmetry plane x = 1000
+    nodes = {
+        node_id: {"id": node_id, "x": x, "y": 0, "z": z} for node_id, x, z in ((1, 0, 0), (2, 0, 3000), (3, 2000, 3000), (4, 2000, 0))
+    }
+    lines = {line_id: {"id": line_id, "nodeI": i, "nodeJ": j} for line_id, i, j in ((1, 1, 2), (2, 2, 3), (3, 4, 3))}
+    model = {**worker_model(600), "nodes": nodes, "lines": lines, "nodes_with_load": [2, 3], "supports": [1, 4]}
+    reduction = SymmetryReduction(model)
+
+    assert reduction.reduced["lines"][2] == {"id": 2, "nodeI": 2, "nodeJ": 5}
+    assert reduction.reduced["restraints"] == {"5": [1, 0, 0, 0, 1, 1]}
+    assert_same_result(reduction.expand(analyze_model(reduction.reduced)), analyze_model(model))
+
+
+def test_supports_on_a_plane():
+    # Portal frame with a middle column and braces to its support, all on or about the symmetry plane x = 1000
+    coordinates = ((1, 0, 0), (2, 0, 3000), (3, 1000, 3000), (4, 2000, 3000), (5, 2000, 0), (6, 1000, 0))
+    nodes = {node_id: {"id": node_id, "x": x, "y": 0, "z": z} for node_id, x, z in coordinates}
+    ends = ((1, 2), (2, 3), (3, 4), (5, 4), (6, 3), (6, 2), (6, 4))
+    lines = {line_id: {"id": line_id, "nodeI": i, "nodeJ": j} for line_id, (i, j) in enumerate(ends, start=1)}
+    model = {**worker_model(600), "nodes": nodes, "lines": lines, "nodes_with_load": [2, 3, 4], "supports": [1, 5, 6]}
+    reduction = SymmetryReduction(model)
+
+    assert reduction.reduced["frame_modifiers"] == {"5": 0.5}
+    assert_same_result(reduction.expand(analyze_model(reduction.reduced)), analyze_model(model))
@@ -0,0 +1,51 @@
+import json
+
+from app.backends import add_worker_spans
+from app.dispatch import ShardedDispatcher
+from app.fake_etabs import start_fake_etabs
+from app.run_etabs_model import run_n_times
+from app.timing import Timer, span
+from tests.fake_etabs_test import worker_model
+
+
+def test_spans_are_recorded_on_the_active_timer_also_in_shards():
+    timer = Timer()
+    with span("untimed"):
+        pass
+
+    def run_shard(models):
+        with span("shard", models=len(models)):
+            return models
+
+    with timer.activate(), timer.span("run"):
+        ShardedDispatcher(run_shard, max_shards=2, target_shard_size=1).run([{"lines": [1]}, {"lines": [1, 2]}])
+
+    totals = timer.totals()
+    assert set(totals) == {"shard", "run"}
+    assert totals["shard"]["count"] == 2 and "untimed" not in totals
+
+    trace = timer.chrome_trace()
+    events = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    assert len(events) == 3 and all(event["dur"] >= 0 for event in events)
+    tracks = {event["args"]["name"] for event in trace["traceEvents"] if event["ph"] == "M"}
+    assert len(tracks) >= 2
+
+
+def test_worker_timings_are_returned_and_placed_before_the_job_end(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "inputs.json").write_text(json.dumps([worker_model(600), worker_model(900)]))
+
+    run_n_times(lambda: start_fake_etabs(call_latency={"Analyze.RunAnalysis": 0.01}))
+
+    results = json.loads((tmp_path / "output.json").read_text())
+    assert [entry["name"] for entry in results[0]["timings"][:2]] == ["read_inputs", "start_etabs"]
+    assert {entry["name"] for entry in results[1]["timings"]} == {"update_model", "save_model", "run_analysis", "extract_results"}
+    assert all(entry["args"]["model"] == 1 for entry in results[1]["timings"])
+
+    timer = Timer()
+    add_worker_spans(timer, results, job_start=1.0, job_end=5.0)
+    assert all("timings" not in result for result in results)
+    spans = {entry["name"]: entry for entry in timer.spans}
+    assert spans["worker_queue"]["start"] == 1.0 and spans["worker_queue"]["seconds"] > 3
+    assert max(entry["start"] + entry["seconds"] for entry in timer.spans) <= 5.0 + 1e-9
+    assert timer.totals()["run_analysis"]["count"] == 2